@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lol_cafe.settings')
+# Routes the read-heavy pages to their async views (see lol_cafe/asgi_urls.py)
+os.environ.setdefault('CAFE_SERVER', 'asgi')
 
 application = get_asgi_application()
@@ -0,0 +1,11 @@
+"""
+URLconf used under ASGI: the read-heavy menu pages resolve to their async
+versions in menu/async_views.py, everything else to the usual views.
+"""
+from django.urls import include, path
+
+from .urls import urlpatterns as wsgi_urlpatterns
+
+urlpatterns = [
+    path('', include('menu.async_urls')),
+] + wsgi_urlpatterns
@@ -10,8 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import importlib.util
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -52,7 +56,9 @@ MIDDLEWARE = [
 ]
 
 ROOT_URLCONF = 'lol_cafe.urls'
-import os
+# lol_cafe/asgi.py sets CAFE_SERVER=asgi, which swaps in the async catalog views
+if os.environ.get('CAFE_SERVER') == 'asgi':
+    ROOT_URLCONF = 'lol_cafe.asgi_urls'
 
 TEMPLATES = [
     {
@@ -65,6 +71,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'menu.context_processors.cart_summary',
             ],
         },
     },
@@ -78,14 +85,147 @@ WSGI_APPLICATION = 'lol_cafe.wsgi.application'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
 
-DATABASES = {
-    'default': {
+# Run on every new SQLite connection. WAL lets readers carry on while a
+# writer commits, and busy_timeout makes a writer wait for the lock instead
+# of failing at once. synchronous=NORMAL is crash-safe under WAL. A negative
+# cache_size is in KiB.
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('CAFE_SQLITE_JOURNAL_MODE', 'WAL'),
+    'busy_timeout': int(os.environ.get('CAFE_SQLITE_BUSY_TIMEOUT_MS', 5000)),
+    'synchronous': os.environ.get('CAFE_SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'cache_size': int(os.environ.get('CAFE_SQLITE_CACHE_SIZE', -20000)),
+}
+
+# CAFE_DB_ENGINE=postgresql switches to PostgreSQL, configured by
+# CAFE_DB_NAME/USER/PASSWORD/HOST/PORT; SQLite is the default.
+DB_ENGINE = os.environ.get('CAFE_DB_ENGINE', 'sqlite3')
+
+# Read replicas for the catalog pages and admin changelists (menu/routers.py):
+# a comma-separated list of SQLite files, or of PostgreSQL hosts that share
+# the primary's name and credentials. For a local two-file setup, point
+# CAFE_DB_REPLICAS at a second file and refresh it with sync_replicas.
+DB_REPLICAS = [name.strip() for name in os.environ.get('CAFE_DB_REPLICAS', '').split(',') if name.strip()]
+
+if DB_ENGINE == 'postgresql':
+    PRIMARY_DATABASE = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('CAFE_DB_NAME', 'lol_cafe'),
+        'USER': os.environ.get('CAFE_DB_USER', ''),
+        'PASSWORD': os.environ.get('CAFE_DB_PASSWORD', ''),
+        'HOST': os.environ.get('CAFE_DB_HOST', ''),
+        'PORT': os.environ.get('CAFE_DB_PORT', ''),
+        'OPTIONS': {},
+    }
+    REPLICA_FIELD = 'HOST'
+else:
+    PRIMARY_DATABASE = {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            # BEGIN IMMEDIATE takes the write lock up front, so two transactions
+            # that read before writing queue on busy_timeout instead of
+            # deadlocking on the lock upgrade ("database is locked")
+            'transaction_mode': os.environ.get('CAFE_SQLITE_TRANSACTION_MODE', 'IMMEDIATE'),
+        },
+    }
+    REPLICA_FIELD = 'NAME'
+
+PRIMARY_DATABASE.update({
+    # Reuse connections across requests. Under ASGI every request runs its
+    # queries on a fresh thread, so connections there are never kept.
+    'CONN_MAX_AGE': int(os.environ.get(
+        'CAFE_DB_CONN_MAX_AGE', 0 if os.environ.get('CAFE_SERVER') == 'asgi' else 60,
+    )),
+    'CONN_HEALTH_CHECKS': True,
+})
+
+# PostgreSQL only: CAFE_DB_POOL_MAX_SIZE turns on psycopg's connection pool
+# (needs psycopg[pool]). Each process then keeps between MIN_SIZE and
+# MAX_SIZE connections per database and a request waits up to TIMEOUT
+# seconds for a free one. Pooled connections go back to the pool after
+# every request, so CONN_MAX_AGE has to be 0.
+if DB_ENGINE == 'postgresql' and os.environ.get('CAFE_DB_POOL_MAX_SIZE'):
+    PRIMARY_DATABASE['OPTIONS']['pool'] = {
+        'min_size': int(os.environ.get('CAFE_DB_POOL_MIN_SIZE', 2)),
+        'max_size': int(os.environ['CAFE_DB_POOL_MAX_SIZE']),
+        'timeout': float(os.environ.get('CAFE_DB_POOL_TIMEOUT', 10)),
+    }
+    PRIMARY_DATABASE['CONN_MAX_AGE'] = 0
+
+DATABASES = {
+    'default': {
+        **PRIMARY_DATABASE,
+        # File-backed test database so threaded tests see real SQLite locking
+        # instead of the shared-cache table locks of an in-memory database.
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'} if DB_ENGINE == 'sqlite3' else {},
+    },
+}
+for number, target in enumerate(DB_REPLICAS, 1):
+    DATABASES[f'replica{number}'] = {
+        **PRIMARY_DATABASE,
+        'OPTIONS': dict(PRIMARY_DATABASE['OPTIONS']),
+        REPLICA_FIELD: target,
+        # Tests read replicas through the test primary
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['menu.routers.ReplicaRouter']
+
+# Seconds a replica may trail the primary. Cached catalog pages whose data
+# changed more recently than this are rebuilt from the primary.
+DATABASE_REPLICA_LAG = float(os.environ.get('CAFE_DB_REPLICA_LAG', 2))
+
+# Cache
+# Catalog pages are cached under versioned keys. Use a shared backend (file or
+# redis) when running several workers so a version bump is seen by all of them.
+
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+CACHE_BACKEND = os.environ.get('CAFE_CACHE', 'locmem')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': os.environ.get('CAFE_CACHE_LOCATION', {
+            'locmem': 'lol-cafe',
+            'file': str(BASE_DIR / '.cache'),
+            'redis': 'redis://127.0.0.1:6379',
+        }[CACHE_BACKEND]),
     }
 }
+
+# Sessions
+# CAFE_SESSIONS picks where sessions live:
+#   db             - Django's session table: a SELECT on every request that
+#                    reads the session, an UPDATE whenever it changes
+#   cached_db      - the cache first, written through to the table, so reads
+#                    skip the database but a cache flush logs nobody out
+#   cache          - the cache only: no queries, but sessions are lost with
+#                    the cache, so only use it with the redis or file backend
+#   signed_cookies - the whole session in a signed cookie: no storage at all,
+#                    but a logout cannot revoke a copied cookie
+# purge_sessions clears expired rows of the db and cached_db modes.
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_MODE = os.environ.get('CAFE_SESSIONS', 'cached_db')
+SESSION_ENGINE = SESSION_ENGINES[SESSION_MODE]
+
 from django.contrib.messages import constants as messages
 
+# Flash messages travel in their own signed cookie. The default storage
+# falls back to the session when the cookie overflows, which would turn a
+# redirect into a session write; the cookie storage drops the oldest
+# messages instead.
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
 MESSAGE_TAGS = {
     messages.ERROR: 'danger'
 }
@@ -110,6 +250,74 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+AUTHENTICATION_BACKENDS = ['menu.backends.EmailOrUsernameBackend']
+
+# Password hashing (menu/hashers.py). CAFE_PASSWORD_HASHER picks pbkdf2,
+# scrypt or argon2 (needs argon2-cffi); CAFE_PASSWORD_COST_CUSTOMER and
+# CAFE_PASSWORD_COST_STAFF set the cost in that algorithm's unit: PBKDF2
+# iterations, the scrypt work factor (a power of two) or the Argon2 time
+# cost. Stored hashes are redone at the next login after a change, and
+# bench_login measures what a cost does to login throughput.
+PASSWORD_COST_DEFAULTS = {
+    'pbkdf2': {'customer': 600_000, 'staff': 1_000_000},
+    'scrypt': {'customer': 2 ** 14, 'staff': 2 ** 15},
+    'argon2': {'customer': 2, 'staff': 4},
+}
+PASSWORD_HASHER = os.environ.get('CAFE_PASSWORD_HASHER', 'pbkdf2')
+if PASSWORD_HASHER == 'argon2' and importlib.util.find_spec('argon2') is None:
+    raise ImproperlyConfigured('CAFE_PASSWORD_HASHER=argon2 needs the argon2-cffi package.')
+PASSWORD_COST = {
+    role: int(os.environ.get(f'CAFE_PASSWORD_COST_{role.upper()}', cost))
+    for role, cost in PASSWORD_COST_DEFAULTS[PASSWORD_HASHER].items()
+}
+_POLICY_HASHERS = {
+    'pbkdf2': 'menu.hashers.PBKDF2Hasher',
+    'scrypt': 'menu.hashers.ScryptHasher',
+    'argon2': 'menu.hashers.Argon2Hasher',
+}
+PASSWORD_HASHERS = [
+    # New passwords use the first; the rest verify hashes made under older policies
+    _POLICY_HASHERS[PASSWORD_HASHER],
+    *(path for name, path in _POLICY_HASHERS.items() if name != PASSWORD_HASHER),
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+
+
+def _bucket(value):
+    """'capacity/seconds', e.g. '20/300': 20 attempts at once, refilled over 5 minutes."""
+    capacity, period = value.split('/')
+    return int(capacity), float(period)
+
+
+# Login throttling (menu/throttle.py), kept in the default cache: attempts
+# per client IP and per account before logins are refused without hashing
+LOGIN_THROTTLE = {
+    'ip': _bucket(os.environ.get('CAFE_LOGIN_THROTTLE_IP', '20/300')),
+    'account': _bucket(os.environ.get('CAFE_LOGIN_THROTTLE_ACCOUNT', '5/900')),
+}
+
+# Live order status (menu/live.py). LocalBroker only reaches streams served
+# by the same process; with several ASGI workers, or orders changed from a
+# WSGI process, use menu.live.RedisBroker, which fans out through Redis.
+LIVE_BROKER = os.environ.get('CAFE_LIVE_BROKER', 'menu.live.LocalBroker')
+LIVE_BROKER_URL = os.environ.get('CAFE_LIVE_BROKER_URL', 'redis://127.0.0.1:6379/0')
+# A keepalive comment after this many idle seconds; streams end (and the
+# browser reconnects) after LIVE_STREAM_SECONDS
+LIVE_HEARTBEAT_SECONDS = int(os.environ.get('CAFE_LIVE_HEARTBEAT', 15))
+LIVE_STREAM_SECONDS = int(os.environ.get('CAFE_LIVE_STREAM_SECONDS', 300))
+
+# Tracking numbers (menu/tracking.py) carry a node number, 0-1023, which
+# must differ between every process placing orders. Set
+# CAFE_TRACKING_NODE_ID per worker; only DEBUG falls back to the process ID.
+TRACKING_NODE_ID = os.environ.get('CAFE_TRACKING_NODE_ID')
+if TRACKING_NODE_ID is not None:
+    TRACKING_NODE_ID = int(TRACKING_NODE_ID)
+    if not 0 <= TRACKING_NODE_ID <= 1023:
+        raise ImproperlyConfigured('CAFE_TRACKING_NODE_ID must be between 0 and 1023.')
+elif not DEBUG:
+    raise ImproperlyConfigured('Set CAFE_TRACKING_NODE_ID to a number unique to this worker (0-1023).')
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -150,3 +358,8 @@ LOGIN_REDIRECT_URL = 'home'
 # Media Files (Images)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR
+
+# Profile pictures larger than this are refused while they stream in; accepted
+# ones are cropped to a PROFILE_PIC_SIZE square by the process_profile_pics worker
+PROFILE_PIC_MAX_UPLOAD_SIZE = int(os.environ.get('CAFE_PROFILE_PIC_MAX_BYTES', 5 * 1024 * 1024))
+PROFILE_PIC_SIZE = 256
@@ -1,9 +1,23 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
+from django.views.decorators.cache import cache_control
+from django.views.static import serve
+
+from menu.images import RENDITIONS_DIR
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('menu.urls')),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]
+
+if settings.DEBUG:
+    # Rendition names change with their content, so they can be cached for good
+    urlpatterns.append(re_path(
+        rf'^{settings.MEDIA_URL.lstrip("/")}(?P<path>{RENDITIONS_DIR}/.*)$',
+        cache_control(public=True, max_age=60 * 60 * 24 * 365, immutable=True)(serve),
+        {'document_root': settings.MEDIA_ROOT},
+    ))
+
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,16 +1,229 @@
-from django.contrib import admin
-from .models import Category, Product, Cart, Order, Review, Profile
+from datetime import timedelta
+
+from django import forms
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.http import HttpResponseRedirect, JsonResponse
+from django.template.loader import render_to_string
+from django.template.response import TemplateResponse
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.utils.functional import cached_property
+
+from . import prep, sales
+from .forms import SalesReportForm
+from .models import (
+    Category, Product, Cart, Order, Checkout, Review, Profile, OutboundEmail, PrepLine, DailySales, StaleOrder,
+)
+from .orders import sources, transition
+from .routers import read_from_replica
+
+
+class ReplicaChangelistAdmin(admin.ModelAdmin):
+    """Lists rows from a read replica; the list_editable POST and every change form use the primary."""
+
+    def changelist_view(self, request, extra_context=None):
+        if request.method == "GET":
+            return read_from_replica(super().changelist_view)(request, extra_context)
+        return super().changelist_view(request, extra_context)
+
+
+admin.site.register(Category, ReplicaChangelistAdmin)
+admin.site.register(Product, ReplicaChangelistAdmin)
+admin.site.register(Cart, ReplicaChangelistAdmin)
+
+class CappedCountPaginator(Paginator):
+    """Counts at most ``cap`` rows, so paging a huge table never scans all of it."""
+
+    cap = 10_000
+
+    @cached_property
+    def count(self):
+        # COUNT(*) over a LIMITed subquery stops after cap rows
+        return self.object_list[:self.cap].count()
+
+
+class OrderAdminForm(forms.ModelForm):
+    """Refuses status changes the state machine does not allow, and edits of a stale version."""
+
+    class Meta:
+        model = Order
+        fields = '__all__'
+        widgets = {'version': forms.HiddenInput}
+
+    def clean_order_sts(self):
+        status = self.cleaned_data['order_sts']
+        current = self.instance.order_sts if self.instance.pk else None
+        if current and status != current and status not in Order.TRANSITIONS[current]:
+            raise forms.ValidationError(f"An order that is {current} cannot be marked {status}.")
+        return status
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if self.instance.pk and 'version' in cleaned_data:
+            saved = Order.objects.filter(pk=self.instance.pk).values_list('version', flat=True).first()
+            if saved != cleaned_data['version']:
+                raise forms.ValidationError(
+                    "Someone else changed this order while you were editing it. Reload the page to see their changes."
+                )
+        return cleaned_data
+
+
+class StaleOrderAdmin(ReplicaChangelistAdmin):
+    """
+    Order change forms (the order's own, or a checkout's order lines) that
+    lose the race with another save between validation and saving: the
+    form's transaction is rolled back and the page reloaded with the
+    other save's values, instead of a server error.
+    """
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except StaleOrder:
+            self.message_user(
+                request, "Someone else changed this order while you were saving it. Nothing was saved; "
+                "the form now shows their changes.", messages.ERROR,
+            )
+            return HttpResponseRedirect(request.get_full_path())
+
+
+def transition_action(status, description):
+    def action(modeladmin, request, queryset):
+        moved = len(transition(queryset, status))
+        skipped = queryset.count() - moved
+        modeladmin.message_user(request, f"{moved} order(s) marked {status}.", messages.SUCCESS)
+        if skipped:
+            modeladmin.message_user(
+                request, f"{skipped} order(s) skipped: only {' or '.join(sources(status))} orders can be marked {status}.",
+                messages.WARNING,
+            )
+
+    action.__name__ = f"mark_{status.lower().replace(' ', '_')}"
+    return admin.action(description=description, permissions=["change"])(action)
 
-admin.site.register(Category)
-admin.site.register(Product)
-admin.site.register(Cart)
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(StaleOrderAdmin):
     list_display = ('id', 'customer', 'orderitem', 'qty', 'order_sts', 'date_order', 'tracking_no')
-    list_editable = ('order_sts',)
     list_filter = ('order_sts', 'date_order')
-    search_fields = ('tracking_no', 'customer__username')
+    # Exact matches ride the tracking_no index and the unique username index
+    search_fields = ('=tracking_no', '=customer__username')
+    list_select_related = ('customer', 'orderitem')
+    show_full_result_count = False
+    paginator = CappedCountPaginator
+    form = OrderAdminForm
+    # Status changes go through the actions (one UPDATE for the whole selection) or the change form
+    actions = [
+        transition_action('Out for Delivery', "Mark selected orders out for delivery"),
+        transition_action('Delivered', "Mark selected orders delivered"),
+        transition_action('Cancelled', "Cancel selected orders"),
+    ]
+
+class OrderLineInline(admin.TabularInline):
+    model = Order
+    form = OrderAdminForm
+    fields = ('orderitem', 'qty', 'price', 'order_sts', 'version')
+    readonly_fields = ('orderitem', 'qty', 'price')
+    extra = 0
+    can_delete = False
+
+
+@admin.register(Checkout)
+class CheckoutAdmin(StaleOrderAdmin):
+    list_display = ('tracking_no', 'customer', 'total', 'status', 'created_at')
+    list_filter = ('status',)
+    list_select_related = ('customer',)
+    search_fields = ('=tracking_no',)
+    readonly_fields = ('tracking_no', 'customer', 'total', 'status', 'created_at')
+    inlines = [OrderLineInline]
+
+
+@admin.register(PrepLine)
+class PrepBoardAdmin(admin.ModelAdmin):
+    """
+    The kitchen prep board in place of a changelist: what to make per
+    product, by tracking number. Read-only, and read from the primary so
+    the kitchen never works from a lagging replica; the page refreshes its
+    table every ``refresh_seconds`` with ?format=json.
+    """
+
+    refresh_seconds = 5
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        if not self.has_view_or_change_permission(request):
+            raise PermissionDenied
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Kitchen prep board",
+            "products": prep.board(),
+            "refresh_seconds": self.refresh_seconds,
+            **(extra_context or {}),
+        }
+        if request.GET.get("format") == "json":
+            return JsonResponse({"html": render_to_string("admin/menu/prepline/board_rows.html", context, request)})
+        return TemplateResponse(request, "admin/menu/prepline/board.html", context)
+
+
+@admin.register(DailySales)
+class SalesDashboardAdmin(admin.ModelAdmin):
+    """
+    The sales dashboard in place of a changelist: totals, a chart and the
+    top products and categories over a date range. Reads only the rollups
+    (menu/sales.py), from a replica when there is one.
+    """
+
+    default_days = 30
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    @method_decorator(read_from_replica)
+    def changelist_view(self, request, extra_context=None):
+        if not self.has_view_or_change_permission(request):
+            raise PermissionDenied
+        today = timezone.localdate()
+        form = SalesReportForm(request.GET or {
+            "first": today - timedelta(days=self.default_days - 1), "last": today, "period": "day",
+        })
+        report = None
+        if form.is_valid():
+            report = sales.report(form.cleaned_data["first"], form.cleaned_data["last"], form.cleaned_data["period"])
+            report["peak"] = max(point["revenue"] for point in report["series"])
+            report["period"] = form.cleaned_data["period"]
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Sales dashboard",
+            "form": form,
+            "report": report,
+            **(extra_context or {}),
+        }
+        return TemplateResponse(request, "admin/menu/dailysales/dashboard.html", context)
+
+admin.site.register(Review, ReplicaChangelistAdmin)
+admin.site.register(Profile, ReplicaChangelistAdmin)
+
 
-admin.site.register(Review)
-admin.site.register(Profile)
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(ReplicaChangelistAdmin):
+    list_display = ('id', 'subject', 'to', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('=to',)
@@ -0,0 +1,16 @@
+from django.urls import path
+
+from .async_views import (
+    CategoryDetailView, HomeView, OrderEventsView, ProductDetailView, SearchView, UserOrdersView,
+)
+
+# Same paths and names as their entries in menu/urls.py, which they shadow
+# in lol_cafe/asgi_urls.py
+urlpatterns = [
+    path("home", HomeView.as_view(), name="home"),
+    path("category/<int:pk>/", CategoryDetailView.as_view(), name="category_detail"),
+    path("product/<int:pk>/", ProductDetailView.as_view(), name="product_detail"),
+    path("my-orders/", UserOrdersView.as_view(), name="my_orders"),
+    path("my-orders/events/", OrderEventsView.as_view(), name="order_events"),
+    path("search/", SearchView.as_view(), name="search"),
+]
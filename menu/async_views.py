@@ -0,0 +1,220 @@
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import redirect, render
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.cache import never_cache
+
+from . import cart, catalog_cache, keyset, live, views
+from .catalog_cache import aconditional_page
+from .forms import ReviewForm
+from .models import Category, Order, Product
+from .routers import read_from_replica
+from .search import search_products
+
+# Async versions of the read-heavy pages, served when the project runs under
+# lol_cafe/asgi.py (see lol_cafe/asgi_urls.py). Each one loads the session,
+# user and cart badge with async queries before rendering, because a
+# template that reaches the database from the event loop would fail; the
+# pages and cache keys are the same as the sync views in menu/views.py.
+
+
+async def load_request(request):
+    """Resolve everything the base template reads from the request without blocking."""
+    request.user = await request.auser()
+    request.cart_summary = await cart.asummary(request.user.id) if request.user.is_authenticated else None
+
+
+async def alist(queryset):
+    return [obj async for obj in queryset]
+
+
+def signin_required(fn):
+    async def wrapper(request, *args, **kwargs):
+        await load_request(request)
+        if not request.user.is_authenticated:
+            return redirect("login")
+        return await fn(request, *args, **kwargs)
+    return wrapper
+
+
+# ------------------------ HOME / CATEGORY / PRODUCT ------------------------
+
+@method_decorator(read_from_replica, name="get")
+@method_decorator(aconditional_page(lambda request: [catalog_cache.catalog(), catalog_cache.offers()]), name="get")
+class HomeView(View):
+    offer_limit = views.HomeView.offer_limit
+
+    async def get(self, request):
+        await load_request(request)
+        categories = await catalog_cache.aget_or_build(
+            "home:categories", [catalog_cache.catalog()], lambda: alist(Category.objects.all())
+        )
+        offer_products = await catalog_cache.aget_or_build(
+            "home:offers", [catalog_cache.offers()], lambda: alist(
+                Product.objects.filter(discount_percent__gte=50)
+                .order_by('-discount_percent', '-id')[:self.offer_limit]
+            )
+        )
+        return render(request, "menu/index.html", {"categories": categories, "offer_products": offer_products})
+
+
+@method_decorator(read_from_replica, name="get")
+@method_decorator(aconditional_page(lambda request, pk: [catalog_cache.category(pk)]), name="get")
+class CategoryDetailView(View):
+    paginate_by = views.CategoryDetailView.paginate_by
+
+    async def get(self, request, pk):
+        await load_request(request)
+        cursor = request.GET.get("cursor")
+        if keyset.decode_cursor(cursor)[0] is None:
+            cursor = None
+
+        async def build():
+            category = await Category.objects.filter(id=pk).afirst()
+            if category is None:
+                return None, keyset.Page([])
+            return category, await keyset.apaginate(
+                Product.objects.filter(category=category), ("name", "id"), cursor, self.paginate_by
+            )
+
+        if cursor is None:
+            category, page = await catalog_cache.aget_or_build(f"category:{pk}", [catalog_cache.category(pk)], build)
+        else:
+            category, page = await build()
+        if category is None:
+            raise Http404("No Category matches the given query.")
+        if views.wants_json(request):
+            return views.load_more(request, page, "menu/product_cards.html", views.product_items(page), products=page)
+        return render(request, "menu/category_detail.html", {
+            "name": category,
+            "data": page,
+            "page": page,
+        })
+
+
+@method_decorator(read_from_replica, name="get")
+@method_decorator(aconditional_page(lambda request, pk: [catalog_cache.product(pk)]), name="get")
+class ProductDetailView(View):
+    async def get(self, request, pk):
+        await load_request(request)
+
+        async def build():
+            product = await Product.objects.select_related("category").filter(id=pk).afirst()
+            reviews = await alist(product.review_set.select_related("user").order_by("-date")[:5]) if product else []
+            return product, reviews
+
+        product, reviews = await catalog_cache.aget_or_build(f"product:{pk}", [catalog_cache.product(pk)], build)
+        if product is None:
+            raise Http404("No Product matches the given query.")
+        return render(request, "menu/p_detail.html", {"data": product, "reviews": reviews})
+
+
+# ------------------------ ORDERS / SEARCH ------------------------
+
+@method_decorator(signin_required, name="get")
+@method_decorator(never_cache, name="get")
+class UserOrdersView(View):
+    paginate_by = views.UserOrdersView.paginate_by
+
+    async def get(self, request):
+        orders = views.customer_orders(request)
+        page = await keyset.apaginate(orders, ("-date_order", "-id"), request.GET.get("cursor"), self.paginate_by)
+        form = ReviewForm()
+        if views.wants_json(request):
+            items = [
+                {
+                    "id": order.id,
+                    "date_order": order.date_order.isoformat(),
+                    "status": order.order_sts,
+                    "product": order.orderitem.name,
+                    "qty": order.qty,
+                    "price": str(order.price),
+                    "has_review": order.has_review,
+                }
+                for order in page
+            ]
+            return views.load_more(request, page, "menu/order_cards.html", items, orders=page, form=form)
+        return render(request, "menu/orders.html", {"orders": page, "page": page, "form": form})
+
+
+@method_decorator(signin_required, name="get")
+class OrderEventsView(View):
+    """
+    Server-sent events for the status of the user's orders, so My Orders
+    need not be reloaded to see them move.
+
+    Each change arrives as an ``order`` event with JSON data {id, status,
+    tracking_no}. A reconnecting browser sends Last-Event-ID; it may have
+    missed changes while away, so it first gets the current status of its
+    latest orders. Streams end after settings.LIVE_STREAM_SECONDS and the
+    browser reconnects, which keeps a dead connection from holding a
+    subscription for long.
+    """
+
+    # How long the browser waits before reconnecting, in milliseconds
+    retry = 3000
+
+    async def get(self, request):
+        response = StreamingHttpResponse(
+            self.events(request.user.id, "HTTP_LAST_EVENT_ID" in request.META),
+            content_type="text/event-stream",
+        )
+        response["Cache-Control"] = "no-cache"
+        # Stop nginx from buffering the stream
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    async def events(self, user_id, resumed):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.LIVE_STREAM_SECONDS
+        async with live.broker().subscribe(live.orders_channel(user_id)) as messages:
+            # The id makes the browser send Last-Event-ID even if no event arrives before it reconnects
+            yield f"retry: {self.retry}\nid: 0\n\n"
+            sent = 0
+            if resumed:
+                latest = (
+                    Order.objects.filter(customer_id=user_id)
+                    .order_by("-date_order", "-id")
+                    .values_list("id", "order_sts", "tracking_no")[:UserOrdersView.paginate_by]
+                )
+                async for order_id, status, tracking_no in latest:
+                    sent += 1
+                    yield self.event(sent, {"id": order_id, "status": status, "tracking_no": tracking_no})
+            while (remaining := deadline - loop.time()) > 0:
+                try:
+                    message = await asyncio.wait_for(messages.get(), min(settings.LIVE_HEARTBEAT_SECONDS, remaining))
+                except asyncio.TimeoutError:
+                    # A comment line, so proxies and load balancers see traffic on an idle stream
+                    yield ": keepalive\n\n"
+                    continue
+                sent += 1
+                yield self.event(sent, message)
+
+    def event(self, event_id, data):
+        return f"id: {event_id}\nevent: order\ndata: {json.dumps(data)}\n\n"
+
+
+@method_decorator(read_from_replica, name="get")
+class SearchView(View):
+    paginate_by = views.SearchView.paginate_by
+
+    async def get(self, request):
+        await load_request(request)
+        query = request.GET.get("q")
+        page = None
+        if query:
+            # The FTS5 lookup is raw SQL, which has no async cursor; it runs on the request's worker thread
+            page = await sync_to_async(search_products)(query, request.GET.get("cursor"), self.paginate_by)
+        if views.wants_json(request):
+            page = page or keyset.Page([])
+            return views.load_more(request, page, "menu/product_cards.html", views.product_items(page), products=page)
+        return render(request, "menu/search.html", {
+            "result": page,
+            "query": query,
+            "page": page,
+        })
@@ -0,0 +1,133 @@
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import SkipFile, TemporaryFileUploadHandler
+from django.template.defaultfilters import filesizeformat
+from PIL import Image, ImageOps
+
+from .images import digest
+from .models import Profile
+
+# Profile pictures arrive as whatever the phone camera produced. The upload
+# handler streams them to a temporary file and gives up on a part as soon as
+# it is not an image or grows past the cap, so a large upload never sits in
+# worker memory. Accepted files are stored as uploaded and flagged; the
+# process_profile_pics worker squares, shrinks and re-encodes them later.
+
+FIELD = "profile_pic"
+
+# Leading bytes of the formats we accept -> Pillow format name
+SIGNATURES = (
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"GIF87a", "GIF"),
+    (b"GIF89a", "GIF"),
+)
+
+
+def sniff(head):
+    """The image format the first bytes of a file announce, or None."""
+    for signature, fmt in SIGNATURES:
+        if head.startswith(signature):
+            return fmt
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    return None
+
+
+class ProfilePicUploadHandler(TemporaryFileUploadHandler):
+    """
+    Stream the profile picture to disk, refusing oversize or non-image parts.
+
+    A refused part is skipped and the rest of the form still parses; the
+    reason is kept in ``error`` for the view to show on the form.
+    """
+
+    def __init__(self, request=None, max_size=None):
+        super().__init__(request)
+        self.max_size = max_size or settings.PROFILE_PIC_MAX_UPLOAD_SIZE
+        self.error = None
+
+    def reject(self, message):
+        self.error = message
+        raise SkipFile(message)
+
+    def too_large(self):
+        self.reject(f"Profile pictures can be at most {filesizeformat(self.max_size)}.")
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        if field_name != FIELD:
+            raise SkipFile(f"Unexpected file field {field_name!r}")
+        # Browsers rarely send a per-part length, but when they do it saves reading the part
+        if content_length and content_length > self.max_size:
+            self.too_large()
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+
+    def receive_data_chunk(self, raw_data, start):
+        if start == 0 and sniff(raw_data[:12]) is None:
+            self.reject("Upload a JPEG, PNG, GIF or WebP image.")
+        if start + len(raw_data) > self.max_size:
+            self.too_large()
+        return super().receive_data_chunk(raw_data, start)
+
+
+# ------------------------------ PROCESSING ------------------------------
+
+def square(data, size):
+    """JPEG bytes of the image ``data`` cropped to its centre square and scaled to ``size``."""
+    with Image.open(BytesIO(data)) as image:
+        # Let the JPEG decoder skip detail we are about to throw away
+        image.draft("RGB", (size * 2, size * 2))
+        image = ImageOps.exif_transpose(image)
+        image = ImageOps.fit(image.convert("RGB"), (size, size), Image.LANCZOS)
+    out = BytesIO()
+    # Saved without exif or icc_profile, so camera and location metadata are dropped
+    image.save(out, "JPEG", quality=85, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+# Outcomes of processing one picture
+DONE = "done"
+DROPPED = "dropped"
+SUPERSEDED = "superseded"
+
+
+def process(profile, size=None):
+    """
+    Replace one pending profile picture with its small square version.
+
+    Unreadable uploads are DROPPED (removed from the profile); if the user
+    uploaded another picture meanwhile the result is discarded as SUPERSEDED
+    and the new one stays pending.
+    """
+    size = size or settings.PROFILE_PIC_SIZE
+    original = profile.profile_pic.name
+    if not original:
+        Profile.objects.filter(pk=profile.pk).update(pic_pending=False)
+        return DROPPED
+    try:
+        with default_storage.open(original, "rb") as f:
+            data = square(f.read(), size)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        if not Profile.objects.filter(pk=profile.pk, profile_pic=original).update(profile_pic="", pic_pending=False):
+            return SUPERSEDED
+        default_storage.delete(original)
+        return DROPPED
+
+    name = default_storage.save(f"profile_pics/{profile.user_id}-{digest(data)}.jpg", ContentFile(data))
+    # Only swap in the result if the row still points at what we read
+    replaced = Profile.objects.filter(pk=profile.pk, profile_pic=original, pic_pending=True).update(
+        profile_pic=name, pic_pending=False,
+    )
+    default_storage.delete(original if replaced else name)
+    return DONE if replaced else SUPERSEDED
+
+
+def process_batch(batch_size=20, size=None):
+    """Process up to ``batch_size`` pending pictures; returns {outcome: count}."""
+    counts = {DONE: 0, DROPPED: 0, SUPERSEDED: 0}
+    for profile in Profile.objects.filter(pic_pending=True).order_by("id")[:batch_size]:
+        counts[process(profile, size)] += 1
+    return counts
@@ -0,0 +1,70 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.exceptions import PermissionDenied
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from . import hashers, throttle
+
+UserModel = get_user_model()
+
+
+class EmailOrUsernameBackend(ModelBackend):
+    """
+    Log in with a username or an email address, either case-insensitively.
+
+    Attempts are throttled per client IP and per account before the password
+    is hashed. A throttled attempt fails with ``request.login_retry_after``
+    set to the seconds the client should wait. Passwords are checked against
+    the hashing policy of menu.hashers and re-hashed when it has changed.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        if request is not None:
+            self.throttle(request, "ip", throttle.client_ip(request))
+        user = self.get_by_login(username)
+        if request is not None:
+            # Keyed by the account, so its username and email share one bucket
+            self.throttle(request, "account", user.pk if user else username.lower())
+
+        if user is None:
+            # Hash anyway, so the response time does not tell which accounts exist
+            UserModel().set_password(password)
+            return None
+        if hashers.verify(user, password) and self.user_can_authenticate(user):
+            if request is not None:
+                throttle.bucket("account").reset(user.pk)
+            return user
+        return None
+
+    def throttle(self, request, name, ident):
+        wait = throttle.bucket(name).take(ident)
+        if wait:
+            request.login_retry_after = wait
+            # Stops authenticate() from trying any other backend
+            raise PermissionDenied
+
+    def get_by_login(self, login):
+        """
+        The user ``login`` names: the account with exactly that username, else
+        the oldest with that email, else the oldest whose username matches it
+        ignoring case. Emails are always compared ignoring case.
+        """
+        # LOWER(username) and LOWER(email) are indexed (menu_user_username_lower, menu_user_email_lower)
+        match = Q(username_lower=login.lower())
+        if "@" in login:
+            match |= Q(email_lower=login.lower())
+        users = list(
+            UserModel._default_manager.alias(username_lower=Lower("username"), email_lower=Lower("email"))
+            .filter(match).order_by("id")[:10]
+        )
+
+        def rank(user):
+            return (user.get_username() != login, user.email.lower() != login.lower())
+
+        return min(users, key=rank) if users else None
@@ -0,0 +1,568 @@
+import asyncio
+import http.client
+import json
+import math
+import queue
+import random
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http import HTTPStatus
+from http.cookies import SimpleCookie
+from urllib.parse import unquote, urlencode
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.auth.tokens import default_token_generator
+from django.core.asgi import get_asgi_application
+from django.core.servers.basehttp import (
+    ThreadedWSGIServer, WSGIRequestHandler, WSGIServer, get_internal_wsgi_application,
+)
+from django.db import DatabaseError, connection
+from django.test import Client
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from . import catalog_cache
+from .models import Cart, Category, Order, Product
+from .search import rebuild_index
+from .seed import DISHES, migrate_database, seed_activity, seed_catalog
+
+# Drives every named route in menu/urls.py with concurrent logged-in
+# customers and reports latency percentiles per URL name. Requests either go
+# through the test client in this process or over HTTP to a WSGI or ASGI
+# server started on a free local port; all of them share the seeded database.
+
+
+def bench_host():
+    """A Host header the current ALLOWED_HOSTS accepts."""
+    for host in settings.ALLOWED_HOSTS:
+        if host != "*":
+            return host.lstrip(".") or "localhost"
+    return "localhost"
+
+
+# ------------------------------ CLIENTS ------------------------------
+
+class InProcessClient:
+    def __init__(self):
+        self.client = Client(HTTP_HOST=bench_host())
+
+    def login(self, user):
+        self.client.force_login(user)
+
+    def request(self, method, path, data=None):
+        if isinstance(data, str):
+            return getattr(self.client, method)(path, data, content_type="application/json").status_code
+        return getattr(self.client, method)(path, data or {}).status_code
+
+
+class HTTPClient:
+    """Minimal cookie-keeping HTTP client; one connection per request, redirects are not followed."""
+
+    def __init__(self, address):
+        self.address = address
+        self.csrf_token = get_random_string(32)
+        self.cookies = SimpleCookie()
+        self.cookies[settings.CSRF_COOKIE_NAME] = self.csrf_token
+
+    def login(self, user):
+        # The test client writes the session through the configured engine,
+        # which the server reads from the same database
+        client = Client()
+        client.force_login(user)
+        self.cookies[settings.SESSION_COOKIE_NAME] = client.cookies[settings.SESSION_COOKIE_NAME].value
+
+    def request(self, method, path, data=None):
+        headers = {
+            "Host": bench_host(),
+            "Cookie": "; ".join(f"{key}={morsel.value}" for key, morsel in self.cookies.items()),
+            "X-CSRFToken": self.csrf_token,
+        }
+        body = None
+        if isinstance(data, str):
+            body = data
+            headers["Content-Type"] = "application/json"
+        elif method == "post":
+            body = urlencode(data or {})
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        elif data:
+            path = f"{path}?{urlencode(data)}"
+
+        conn = http.client.HTTPConnection(*self.address, timeout=60)
+        try:
+            conn.request(method.upper(), path, body, headers)
+            response = conn.getresponse()
+            response.read()
+            for header in response.headers.get_all("Set-Cookie") or []:
+                self.cookies.load(header)
+            return response.status
+        finally:
+            conn.close()
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class PooledWSGIServer(WSGIServer):
+    """
+    WSGI server with a fixed number of handler threads, like a threaded gunicorn worker.
+
+    A connection holds its thread from the first byte of the request to the
+    last byte of the response, so slow clients can use up the pool.
+    """
+
+    def __init__(self, *args, threads=4, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = ThreadPoolExecutor(threads)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+@contextmanager
+def local_server(threads=None):
+    """
+    Serve the WSGI application from a background thread; yields (host, port).
+
+    Each connection gets its own thread, or one of ``threads`` pooled ones.
+    """
+    if threads:
+        server = PooledWSGIServer(("127.0.0.1", 0), QuietRequestHandler, threads=threads, allow_reuse_address=False)
+    else:
+        server = ThreadedWSGIServer(("127.0.0.1", 0), QuietRequestHandler, allow_reuse_address=False)
+    server.set_app(get_internal_wsgi_application())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server.server_address[:2]
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+async def _serve_asgi(app, reader, writer):
+    """Hand one HTTP/1.1 request to the ASGI application and close the connection."""
+    disconnected = asyncio.Event()
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+        request_line, *lines = head.decode("latin-1").split("\r\n")[:-2]
+        method, target, _ = request_line.split(" ", 2)
+        headers = [
+            (name.strip().lower().encode("latin-1"), value.strip().encode("latin-1"))
+            for name, value in (line.split(":", 1) for line in lines)
+        ]
+        length = int(dict(headers).get(b"content-length", 0))
+        body = await reader.readexactly(length) if length else b""
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError, ConnectionError):
+        # The client gave up or sent garbage before finishing its request
+        writer.close()
+        return
+
+    path, _, query = target.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": unquote(path),
+        "raw_path": path.encode("latin-1"),
+        "query_string": query.encode("latin-1"),
+        "root_path": "",
+        "headers": headers,
+        "client": writer.get_extra_info("peername")[:2],
+        "server": writer.get_extra_info("sockname")[:2],
+    }
+    pending = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        if pending:
+            return pending.pop()
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            writer.write(
+                f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n".encode()
+                + b"".join(name + b": " + value + b"\r\n" for name, value in message.get("headers", []))
+                + b"Connection: close\r\n\r\n"
+            )
+        elif message["type"] == "http.response.body":
+            writer.write(message.get("body", b""))
+            await writer.drain()
+
+    try:
+        await app(scope, receive, send)
+    except ConnectionError:
+        pass
+    finally:
+        disconnected.set()
+        writer.close()
+
+
+@contextmanager
+def local_asgi_server():
+    """
+    Serve the ASGI application from an event loop in a background thread; yields (host, port).
+
+    A bare-bones HTTP/1.1 front end, one request per connection, enough to
+    put lol_cafe/asgi.py under the same load as the WSGI server. Requests are
+    only handed to Django once they have fully arrived, as real ASGI servers do.
+    """
+    app = get_asgi_application()
+    started = queue.Queue()
+
+    async def main():
+        serving = set()
+
+        async def serve(reader, writer):
+            task = asyncio.current_task()
+            serving.add(task)
+            try:
+                await _serve_asgi(app, reader, writer)
+            except asyncio.CancelledError:
+                # Shutting down mid-request; asyncio would log a cancelled connection task
+                writer.close()
+            finally:
+                serving.discard(task)
+
+        server = await asyncio.start_server(serve, "127.0.0.1", 0)
+        stop = asyncio.Event()
+        started.put((server.sockets[0].getsockname()[:2], asyncio.get_running_loop(), stop))
+        async with server:
+            await stop.wait()
+        for task in serving:
+            task.cancel()
+        await asyncio.gather(*serving)
+
+    thread = threading.Thread(target=asyncio.run, args=(main(),), daemon=True)
+    thread.start()
+    address, loop, stop = started.get()
+    try:
+        yield address
+    finally:
+        loop.call_soon_threadsafe(stop.set)
+        thread.join()
+
+
+class SlowClient(threading.Thread):
+    """
+    Keeps requesting ``path`` over a bad connection until stopped.
+
+    Each request trickles in one header line every ``pause`` seconds, so it
+    ties up a connection for roughly ``lines * pause`` seconds before the
+    server sees it complete.
+    """
+
+    def __init__(self, address, path, lines=10, pause=0.1):
+        super().__init__(daemon=True)
+        self.address = address
+        self.path = path
+        self.lines = lines
+        self.pause = pause
+        self.stopping = threading.Event()
+        self.completed = 0
+
+    def run(self):
+        while not self.stopping.is_set():
+            try:
+                with socket.create_connection(self.address, timeout=60) as sock:
+                    sock.sendall(f"GET {self.path} HTTP/1.1\r\nHost: {bench_host()}\r\n".encode())
+                    for i in range(self.lines):
+                        if self.stopping.wait(self.pause):
+                            return
+                        sock.sendall(f"X-Slow-{i}: {'x' * 32}\r\n".encode())
+                    sock.sendall(b"Connection: close\r\n\r\n")
+                    while sock.recv(65536):
+                        pass
+                    self.completed += 1
+            except OSError:
+                self.stopping.wait(self.pause)
+
+    def stop(self):
+        self.stopping.set()
+        self.join()
+
+
+@contextmanager
+def slow_clients(address, count, path, lines=10, pause=0.1):
+    """Run ``count`` SlowClients against a server for the duration of the block; yields them."""
+    clients = [SlowClient(address, path, lines, pause) for _ in range(count)]
+    for client in clients:
+        client.start()
+    try:
+        yield clients
+    finally:
+        for client in clients:
+            client.stop()
+
+
+# ------------------------------ ROUTES ------------------------------
+
+class Visitor:
+    """One simulated customer: a client plus the rows its requests are built from."""
+
+    def __init__(self, client, user, category_ids, product_ids, seed=0):
+        self.client = client
+        self.user = user
+        self.category_ids = category_ids
+        self.product_ids = product_ids
+        self.rng = random.Random(seed)
+        client.login(user)
+
+    def category(self):
+        return self.rng.choice(self.category_ids)
+
+    def product(self):
+        return self.rng.choice(self.product_ids)
+
+    def cart_line(self):
+        # Plain autocommit statements: a read-then-write transaction like
+        # update_or_create() deadlocks against the other writers on SQLite
+        product = self.product()
+        if not Cart.objects.filter(user=self.user, item_id=product).update(qty=2):
+            Cart.objects.create(user=self.user, item_id=product, qty=2)
+        return Cart.objects.filter(user=self.user, item_id=product).values_list("id", flat=True).get()
+
+    def delivered_order(self):
+        product = self.product()
+        return Order.objects.create(orderitem_id=product, customer=self.user, price=10, order_sts="Delivered").id
+
+    def leaving_user(self):
+        # delete_account removes whoever is logged in, so hand it a throwaway customer
+        self.client.login(User.objects.create(username=f"leaving-{uuid.uuid4().hex[:12]}"))
+
+    def reset_link(self):
+        return [urlsafe_base64_encode(force_bytes(self.user.pk)), default_token_generator.make_token(self.user)]
+
+
+def _page(name):
+    return lambda v: (reverse(name), None)
+
+
+def _checkout(v):
+    v.cart_line()
+    return reverse("checkout"), None
+
+
+def _delete_account(v):
+    v.leaving_user()
+    return reverse("delete_account"), None
+
+
+def _cart_api(v):
+    changes = [{"item": v.product(), "delta": v.rng.choice([1, 1, -1])} for _ in range(v.rng.randint(1, 3))]
+    return reverse("cart_api"), json.dumps({"changes": changes})
+
+
+# name -> (method, build); build(visitor) does any untimed setup the request
+# needs and returns (path, data). String data is sent as a JSON body.
+ROUTES = {
+    "login": ("get", _page("login")),
+    "register": ("get", _page("register")),
+    "logout": ("get", _page("logout")),
+    "profile": ("get", _page("profile")),
+    "password_reset": ("get", _page("password_reset")),
+    "password_reset_done": ("get", _page("password_reset_done")),
+    "password_reset_confirm": ("get", lambda v: (reverse("password_reset_confirm", args=v.reset_link()), None)),
+    "password_reset_complete": ("get", _page("password_reset_complete")),
+    "home": ("get", _page("home")),
+    "category_detail": ("get", lambda v: (reverse("category_detail", args=[v.category()]), None)),
+    "product_detail": ("get", lambda v: (reverse("product_detail", args=[v.product()]), None)),
+    "product_reviews": ("get", lambda v: (reverse("product_reviews", args=[v.product()]), None)),
+    "cart": ("get", _page("cart")),
+    "cart_api": ("post", _cart_api),
+    "add_to_cart": ("get", lambda v: (reverse("add_to_cart", args=[v.product()]), None)),
+    "delete_cart": ("get", lambda v: (reverse("delete_cart", args=[v.cart_line()]), None)),
+    "checkout": ("post", _checkout),
+    "increase_qty": ("post", lambda v: (reverse("increase_qty", args=[v.cart_line()]), None)),
+    "decrease_qty": ("post", lambda v: (reverse("decrease_qty", args=[v.cart_line()]), None)),
+    "buy": ("get", lambda v: (reverse("buy", args=[v.product()]), None)),
+    "my_orders": ("get", _page("my_orders")),
+    "order_events": ("get", _page("order_events")),
+    "order_success": ("get", _page("order_success")),
+    "add_review": ("post", lambda v: (
+        reverse("add_review", args=[v.delivered_order()]), {"rating": 4, "comment": "Benchmark review"},
+    )),
+    "search": ("get", lambda v: (reverse("search"), {"q": v.rng.choice(DISHES)})),
+    "terms": ("get", _page("terms")),
+    "privacy": ("get", _page("privacy")),
+    "refund": ("get", _page("refund")),
+    "about_us": ("get", _page("about_us")),
+    "contact_us": ("get", _page("contact_us")),
+    "delete_account": ("post", _delete_account),
+}
+
+# Routes that end the visitor's session
+LOGS_OUT = {"logout", "delete_account"}
+
+
+def ready_catalog():
+    """Finish a bulk-seeded catalog: deep stock, a fresh search index and no stale cached pages."""
+    Product.objects.update(quantity=10 ** 6)
+    rebuild_index()
+    catalog_cache.bump(
+        catalog_cache.catalog(), catalog_cache.offers(),
+        *(catalog_cache.category(pk) for pk in Category.objects.values_list("id", flat=True)),
+        *(catalog_cache.product(pk) for pk in Product.objects.values_list("id", flat=True)),
+    )
+
+
+# Seed volumes of the benchmark commands' throwaway database
+VOLUMES = {
+    "users": 200,
+    "categories": 12,
+    "products": 500,
+    "orders_per_user": 20,
+    "cart_lines": 3,
+    "review_ratio": 0.3,
+}
+
+
+def add_volume_arguments(parser):
+    group = parser.add_argument_group("seed volumes")
+    for key, default in VOLUMES.items():
+        group.add_argument(f"--{key.replace('_', '-')}", type=type(default), default=default)
+
+
+def seed_database(volumes):
+    """Migrate and seed the current (throwaway) database; returns the seeded customers."""
+    migrate_database()
+    products = seed_catalog(categories=volumes["categories"], products=volumes["products"])
+    users = seed_activity(
+        products, users=volumes["users"], orders_per_user=volumes["orders_per_user"],
+        cart_lines=volumes["cart_lines"], review_ratio=volumes["review_ratio"],
+    )
+    ready_catalog()
+    return users
+
+
+# ------------------------------ RUNNER ------------------------------
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def summarize(timings, errors, busy):
+    ordered = sorted(timings)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "throughput": round(len(ordered) / busy, 1) if busy else 0.0,
+        "mean": round(sum(ordered) / len(ordered), 3) if ordered else 0.0,
+        "p50": round(percentile(ordered, 50), 3),
+        "p95": round(percentile(ordered, 95), 3),
+        "p99": round(percentile(ordered, 99), 3),
+    }
+
+
+def drive(visitors, name, requests, warmup=1):
+    """
+    Send ``requests`` requests for one route, spread over the visitors' threads.
+
+    Latencies are in milliseconds. Throughput divides the request count by the
+    busiest thread's time spent inside requests, so the untimed per-request
+    setup of write routes does not count against them. Responses of 500 and
+    above, and requests that raise, are errors.
+    """
+    method, build = ROUTES[name]
+    per_visitor = math.ceil(requests / len(visitors))
+    lock = threading.Lock()
+    timings, errors, busy = [], [0], [0.0]
+
+    def run(visitor):
+        mine, failed, spent = [], 0, 0.0
+        try:
+            for i in range(warmup + per_visitor):
+                try:
+                    path, data = build(visitor)
+                except DatabaseError:
+                    # Setup lost a lock race; skip the request rather than time a broken one
+                    continue
+                start = time.perf_counter()
+                try:
+                    status = visitor.client.request(method, path, data)
+                except Exception:
+                    status = 599
+                elapsed = time.perf_counter() - start
+                if name in LOGS_OUT:
+                    visitor.client.login(visitor.user)
+                if i < warmup:
+                    continue
+                spent += elapsed
+                mine.append(elapsed * 1000)
+                failed += status >= 500
+        finally:
+            connection.close()
+        with lock:
+            timings.extend(mine)
+            errors[0] += failed
+            busy[0] = max(busy[0], spent)
+
+    threads = [threading.Thread(target=run, args=(v,)) for v in visitors]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return summarize(timings, errors[0], busy[0])
+
+
+def run_benchmark(users, names=None, requests=200, warmup=1, address=None, seed=0):
+    """Benchmark each route with one visitor per user; returns {name: stats}."""
+    category_ids = list(Category.objects.values_list("id", flat=True))
+    product_ids = list(Product.objects.values_list("id", flat=True))
+    make_client = (lambda: HTTPClient(address)) if address else InProcessClient
+    visitors = [
+        Visitor(make_client(), user, category_ids, product_ids, seed=seed + i)
+        for i, user in enumerate(users)
+    ]
+    return {name: drive(visitors, name, requests, warmup) for name in names or ROUTES}
+
+
+def compare(report, baseline, tolerance=0.25, min_delta_ms=2.0):
+    """
+    List the routes of ``report`` that regressed against ``baseline``.
+
+    A route regresses when its p50 or p95 grows by more than ``tolerance`` and
+    by at least ``min_delta_ms``, when its throughput drops by the same
+    fraction, or when it has more errors. Routes missing from either side are skipped.
+    """
+    problems = []
+    for name, current in report["urls"].items():
+        before = baseline.get("urls", {}).get(name)
+        if before is None:
+            continue
+        for key in ("p50", "p95"):
+            if current[key] > before[key] * (1 + tolerance) and current[key] - before[key] >= min_delta_ms:
+                problems.append(f"{name}: {key} {before[key]:.2f}ms -> {current[key]:.2f}ms")
+        if current["throughput"] < before["throughput"] / (1 + tolerance):
+            problems.append(f"{name}: throughput {before['throughput']}/s -> {current['throughput']}/s")
+        if current["errors"] > before["errors"]:
+            problems.append(f"{name}: errors {before['errors']} -> {current['errors']}")
+    return problems
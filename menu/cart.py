@@ -0,0 +1,153 @@
+from decimal import Decimal
+
+from django.contrib.auth import SESSION_KEY
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+from . import catalog_cache
+from .checkout import OutOfStock
+from .models import Cart, Product
+
+# The navbar badge and the cart pages read a per-user summary (units, lines
+# and total) kept under the versioned catalog cache. Every view that changes
+# a cart bumps the user's cart scope, so the next page rebuilds it with one
+# aggregate query and every page after that reads it straight from the cache.
+
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+# Most line changes one API call may carry
+MAX_CHANGES = 50
+
+
+def session_user_id(request):
+    """
+    The logged-in user's id as stored in the session, or None.
+
+    The badge only needs the id to find the cached summary, so this skips
+    loading the User row on pages that never touch request.user.
+    """
+    value = request.session.get(SESSION_KEY)
+    return User._meta.pk.to_python(value) if value is not None else None
+
+
+TOTALS = {
+    "count": Coalesce(Sum("qty"), 0),
+    "lines": Count("id"),
+    "total": Coalesce(Sum(F("qty") * F("item__selling_price"), output_field=MONEY), Value(Decimal("0")), output_field=MONEY),
+}
+
+
+def totals(user_id):
+    """Units, distinct lines and total price of a user's cart in one aggregate query."""
+    result = Cart.objects.filter(user_id=user_id).aggregate(**TOTALS)
+    result["total"] = result["total"].quantize(Decimal("0.01"))
+    return result
+
+
+async def atotals(user_id):
+    result = await Cart.objects.filter(user_id=user_id).aaggregate(**TOTALS)
+    result["total"] = result["total"].quantize(Decimal("0.01"))
+    return result
+
+
+def summary(user_id):
+    return catalog_cache.get_or_build(f"cart:{user_id}", [catalog_cache.cart(user_id)], lambda: totals(user_id))
+
+
+async def asummary(user_id):
+    return await catalog_cache.aget_or_build(f"cart:{user_id}", [catalog_cache.cart(user_id)], lambda: atotals(user_id))
+
+
+def invalidate(*user_ids):
+    catalog_cache.bump(*(catalog_cache.cart(pk) for pk in user_ids))
+
+
+# ------------------------------ CHANGES ------------------------------
+
+def parse_changes(payload):
+    """
+    Validate a cart API body into a list of (product_id, op, value).
+
+    The body is one change or ``{"changes": [...]}``; a change names the
+    product as ``item`` and either adds ``delta`` units (negative to take
+    away) or sets ``qty`` outright, 0 removing the line. Raises ValueError.
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("Expected a JSON object.")
+    changes = payload["changes"] if "changes" in payload else [payload]
+    if not isinstance(changes, list) or not 0 < len(changes) <= MAX_CHANGES:
+        raise ValueError(f"Send between 1 and {MAX_CHANGES} changes.")
+
+    parsed = []
+    for change in changes:
+        if not isinstance(change, dict) or len({"delta", "qty"} & set(change)) != 1:
+            raise ValueError("Each change needs an item and exactly one of delta or qty.")
+        op = "delta" if "delta" in change else "qty"
+        item, value = change.get("item"), change[op]
+        # bool is an int subclass, but true/false are not quantities
+        if not all(isinstance(n, int) and not isinstance(n, bool) for n in (item, value)):
+            raise ValueError("item, delta and qty must be integers.")
+        if op == "qty" and value < 0:
+            raise ValueError("qty cannot be negative.")
+        parsed.append((item, op, value))
+    return parsed
+
+
+def apply_changes(user_id, changes):
+    """
+    Apply parsed cart changes for one user in a single transaction.
+
+    Existing lines change with one F() UPDATE each, guarded in SQL by the
+    product's stock, so concurrent requests cannot lose an increment or push
+    a line past what is on the shelf. Decreases, by delta or by setting a
+    smaller qty, never need stock; lines that reach zero are removed. If any product is short nothing is written and
+    OutOfStock lists it; unknown products raise Product.DoesNotExist.
+    Returns the ids of the products whose lines changed.
+    """
+    short = []
+    try:
+        with transaction.atomic():
+            # Every change starts with a write, so on SQLite the transaction
+            # takes its write lock up front instead of upgrading from a read
+            for item, op, value in changes:
+                lines = Cart.objects.filter(user_id=user_id, item_id=item)
+                if op == "qty" and value == 0:
+                    lines.delete()
+                elif op == "delta" and value <= 0:
+                    lines.update(qty=F("qty") + value)
+                    lines.filter(qty__lte=0).delete()
+                else:
+                    wanted = Value(value) if op == "qty" else F("qty") + value
+                    in_stock = Q(item__quantity__gte=wanted)
+                    if op == "qty":
+                        # Setting a line to no more than it holds is a decrease
+                        in_stock |= Q(qty__gte=value)
+                    if not lines.filter(in_stock).update(qty=wanted):
+                        if lines.exists() or not _add_line(user_id, item, value):
+                            short.append(item)
+            if short:
+                raise OutOfStock([])
+    except OutOfStock:
+        # Report the stock as it is now, not as it was when the batch started
+        raise OutOfStock(Product.objects.filter(id__in=short).order_by("id")) from None
+
+    invalidate(user_id)
+    return {item for item, _, _ in changes}
+
+
+def _add_line(user_id, item, qty):
+    stock = Product.objects.filter(id=item).values_list("quantity", flat=True).first()
+    if stock is None:
+        raise Product.DoesNotExist(f"No product with id {item}")
+    if stock < qty:
+        return False
+    try:
+        with transaction.atomic():
+            Cart.objects.create(user_id=user_id, item_id=item, qty=qty)
+    except IntegrityError:
+        # A concurrent request created the line first; add to it under the stock guard instead
+        lines = Cart.objects.filter(user_id=user_id, item_id=item, item__quantity__gte=F("qty") + qty)
+        return bool(lines.update(qty=F("qty") + qty))
+    return True
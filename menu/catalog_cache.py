@@ -0,0 +1,217 @@
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from .routers import primary_reads
+
+# Every cached catalog entry is keyed by the version of the rows it was built
+# from. Writers never delete entries; they bump the version, so every worker
+# sharing the cache starts building fresh keys at once and the old entries
+# simply expire. Versions are microsecond timestamps, which keeps them unique
+# after an eviction and doubles as the Last-Modified time of the page.
+
+VERSION_PREFIX = "catalog:v"
+DATA_PREFIX = "catalog:data"
+DATA_TIMEOUT = 60 * 60 * 6
+
+
+def _version_key(kind, pk=None):
+    return f"{VERSION_PREFIX}:{kind}" if pk is None else f"{VERSION_PREFIX}:{kind}:{pk}"
+
+
+def _now():
+    return time.time_ns() // 1000
+
+
+def get_versions(*scopes):
+    """Return the current version for each (kind, pk) scope, creating missing ones."""
+    keys = [_version_key(kind, pk) for kind, pk in scopes]
+    found = cache.get_many(keys)
+    missing = {key: _now() for key in keys if key not in found}
+    if missing:
+        for key, value in missing.items():
+            # add() so a worker racing us keeps whichever version landed first
+            if not cache.add(key, value, None):
+                missing[key] = cache.get(key, value)
+        found.update(missing)
+    return [found[key] for key in keys]
+
+
+async def aget_versions(*scopes):
+    """get_versions() for async views."""
+    keys = [_version_key(kind, pk) for kind, pk in scopes]
+    found = await cache.aget_many(keys)
+    missing = {key: _now() for key in keys if key not in found}
+    if missing:
+        for key, value in missing.items():
+            if not await cache.aadd(key, value, None):
+                missing[key] = await cache.aget(key, value)
+        found.update(missing)
+    return [found[key] for key in keys]
+
+
+def _bump_now(scopes):
+    now = _now()
+    keys = [_version_key(kind, pk) for kind, pk in scopes]
+    current = cache.get_many(keys)
+    cache.set_many({key: max(now, current.get(key, 0) + 1) for key in keys}, None)
+
+
+def bump(*scopes):
+    """
+    Invalidate everything built from the given (kind, pk) scopes.
+
+    Inside a transaction the bump is repeated on commit, so a page rebuilt
+    from pre-commit data by another worker in the meantime is dropped too.
+    """
+    scopes = list(scopes)
+    if not scopes:
+        return
+    _bump_now(scopes)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _bump_now(scopes))
+
+
+def _recently_changed(versions):
+    # A scope bumped within the replica lag may not have reached the replicas
+    # yet; building it from one would cache the old data under the new version
+    return _now() - max(versions) < settings.DATABASE_REPLICA_LAG * 1_000_000
+
+
+def get_or_build(name, scopes, builder, timeout=DATA_TIMEOUT):
+    versions = get_versions(*scopes)
+    key = f"{DATA_PREFIX}:{name}:" + "-".join(str(v) for v in versions)
+    value = cache.get(key)
+    if value is None:
+        if _recently_changed(versions):
+            with primary_reads():
+                value = builder()
+        else:
+            value = builder()
+        cache.set(key, value, timeout)
+    return value
+
+
+async def aget_or_build(name, scopes, builder, timeout=DATA_TIMEOUT):
+    """get_or_build() for async views; ``builder`` is a coroutine function."""
+    versions = await aget_versions(*scopes)
+    key = f"{DATA_PREFIX}:{name}:" + "-".join(str(v) for v in versions)
+    value = await cache.aget(key)
+    if value is None:
+        if _recently_changed(versions):
+            with primary_reads():
+                value = await builder()
+        else:
+            value = await builder()
+        await cache.aset(key, value, timeout)
+    return value
+
+
+def etag(*scopes):
+    return "-".join(str(v) for v in get_versions(*scopes))
+
+
+def last_modified(*scopes):
+    return datetime.fromtimestamp(max(get_versions(*scopes)) / 1_000_000, tz=timezone.utc)
+
+
+def has_messages(request):
+    """
+    Whether django.contrib.messages has something queued for this request.
+    A 304 would leave the browser on its copy of the page, without them.
+    """
+    storage = getattr(request, "_messages", None)
+    return storage is not None and len(storage) > 0
+
+
+def conditional_page(scopes):
+    """
+    View decorator answering conditional GETs from the cached versions alone.
+
+    ``scopes(request, *args, **kwargs)`` lists the (kind, pk) scopes the page
+    is built from; a matching If-None-Match or If-Modified-Since gets a 304
+    without building the page, unless messages are waiting to be shown.
+    Logged-in users also see their cart badge, so their cart scope is part
+    of every validator. Browsers are told to always revalidate.
+    """
+    def page_scopes(request, *args, **kwargs):
+        found = list(scopes(request, *args, **kwargs))
+        # Same session lookup the badge uses (menu.cart.session_user_id)
+        user_id = request.session.get(SESSION_KEY)
+        if user_id is not None:
+            found.append(cart(user_id))
+        return found
+
+    def decorator(view):
+        conditional = condition(
+            etag_func=lambda request, *args, **kwargs: etag(*page_scopes(request, *args, **kwargs)),
+            last_modified_func=lambda request, *args, **kwargs: last_modified(*page_scopes(request, *args, **kwargs)),
+        )(view)
+
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            if has_messages(request):
+                return view(request, *args, **kwargs)
+            return conditional(request, *args, **kwargs)
+        return cache_control(private=True, no_cache=True)(inner)
+    return decorator
+
+
+def aconditional_page(scopes):
+    """conditional_page() for async views, reading the session and versions without blocking."""
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            found = list(scopes(request, *args, **kwargs))
+            user_id = await request.session.aget(SESSION_KEY)
+            if user_id is not None:
+                found.append(cart(user_id))
+            versions = await aget_versions(*found)
+            page_etag = quote_etag("-".join(str(v) for v in versions))
+            page_modified = max(versions) // 1_000_000
+
+            response = None
+            # The session is loaded by now, so session-stored messages are read without blocking
+            if not has_messages(request):
+                response = get_conditional_response(request, etag=page_etag, last_modified=page_modified)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if request.method in ("GET", "HEAD"):
+                if not response.has_header("Last-Modified"):
+                    response.headers["Last-Modified"] = http_date(page_modified)
+                response.headers.setdefault("ETag", page_etag)
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return inner
+    return decorator
+
+
+# ------------------------------ SCOPES ------------------------------
+
+def catalog():
+    return ("catalog", None)
+
+
+def offers():
+    return ("offers", None)
+
+
+def category(pk):
+    return ("category", pk)
+
+
+def product(pk):
+    return ("product", pk)
+
+
+def cart(user_id):
+    return ("cart", user_id)
@@ -0,0 +1,98 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from . import catalog_cache
+from .orders import change_for, orders_transitioned
+from .models import Product, Order, Checkout
+from .tracking import new_tracking_no
+
+
+# Fresh tracking numbers tried before giving up on clashes with other workers
+TRACKING_ATTEMPTS = 3
+
+
+class OutOfStock(Exception):
+    def __init__(self, products):
+        self.products = list(products)
+        names = ", ".join(p.name for p in self.products)
+        super().__init__(f"Not enough stock for {names}")
+
+
+def place_order(user, lines, tracking_no=None):
+    """
+    Reserve stock for every (product, qty) in ``lines`` and create a
+    Checkout header with the matching Order rows, all in one transaction.
+
+    The products are locked and their stock checked in one SELECT ... FOR
+    UPDATE, then taken in one UPDATE, so two checkouts racing for the last
+    units can never both win and the cost does not grow with the number of
+    lines. If any line is short, nothing is written and OutOfStock lists
+    every product that could not be reserved, as the locked rows showed it.
+    A generated tracking number another worker already took is replaced
+    with a fresh one and the transaction tried again; any other integrity
+    error is raised as it is. Returns the Checkout,
+    with its lines as ``checkout.lines``.
+    """
+    lines = [(product, qty) for product, qty in lines]
+    wanted = {}
+    for product, qty in lines:
+        wanted[product.id] = wanted.get(product.id, 0) + qty
+
+    needed = Case(
+        *[When(id=product_id, then=Value(qty)) for product_id, qty in wanted.items()],
+        output_field=IntegerField(),
+    )
+
+    for attempt in range(TRACKING_ATTEMPTS):
+        attempt_no = tracking_no or new_tracking_no()
+        try:
+            checkout = _record(user, lines, wanted, needed, attempt_no)
+        except IntegrityError:
+            # Only a clash on the tracking number is worth another go; any
+            # other constraint would fail again the same way
+            if tracking_no is not None or attempt == TRACKING_ATTEMPTS - 1:
+                raise
+            if not Checkout.objects.filter(tracking_no=attempt_no).exists():
+                raise
+        else:
+            break
+
+    # Product pages show the stock left
+    catalog_cache.bump(*[catalog_cache.product(product_id) for product_id in wanted])
+    return checkout
+
+
+def _record(user, lines, wanted, needed, tracking_no):
+    with transaction.atomic():
+        # Locked in id order, so checkouts sharing products cannot deadlock
+        stock = {p.id: p for p in Product.objects.select_for_update().filter(id__in=wanted).order_by('id')}
+        products = {product.id: product for product, _ in lines}
+        # A product deleted since it was picked has no stock at all
+        short = [
+            stock.get(product_id, products[product_id]) for product_id in sorted(wanted)
+            if product_id not in stock or stock[product_id].quantity < wanted[product_id]
+        ]
+        if short:
+            raise OutOfStock(short)
+        Product.objects.filter(id__in=wanted).update(quantity=F('quantity') - needed)
+
+        checkout = Checkout.objects.create(
+            customer=user,
+            tracking_no=tracking_no,
+            total=sum(product.selling_price * qty for product, qty in lines),
+        )
+        checkout.lines = Order.objects.bulk_create([
+            Order(
+                orderitem=product,
+                customer=user,
+                qty=qty,
+                price=product.selling_price * qty,
+                order_sts="Pending",
+                tracking_no=checkout.tracking_no,
+                checkout=checkout,
+            )
+            for product, qty in lines
+        ])
+        # bulk_create() sends no post_save
+        orders_transitioned.send(sender=Order, changes=[change_for(order, None) for order in checkout.lines])
+    return checkout
@@ -0,0 +1,16 @@
+from django.utils.functional import SimpleLazyObject
+
+from . import cart
+
+
+def cart_summary(request):
+    """The logged-in user's cached cart summary for the navbar badge, or None."""
+    if hasattr(request, "cart_summary"):
+        # Async views load it up front, since templates cannot query from the event loop
+        return {"cart_summary": request.cart_summary}
+
+    def build():
+        user_id = cart.session_user_id(request)
+        return cart.summary(user_id) if user_id is not None else None
+
+    return {"cart_summary": SimpleLazyObject(build)}
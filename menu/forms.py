@@ -1,5 +1,7 @@
 from django import forms
+from django.contrib.auth.forms import PasswordResetForm
 from django.contrib.auth.models import User
+from django.template import loader
 
 class UserRegisterForm(forms.ModelForm):
     password = forms.CharField(
@@ -48,6 +50,7 @@ class UserLoginForm(forms.Form):
     )
 
 from .models import Review, Profile
+from .mail import queue_mail
 
 class UserOrderForm(forms.Form):
     # Field removed as per user request
@@ -99,6 +102,37 @@ class ProfileUpdateForm(forms.ModelForm):
             }),
             'profile_pic': forms.FileInput(attrs={
                 "class": "hidden",
-                "id": "profile-upload" 
+                "id": "profile-upload",
+                "accept": "image/jpeg,image/png,image/gif,image/webp",
             }),
         }
+
+
+class OutboxPasswordResetForm(PasswordResetForm):
+    """Password reset form that queues its email in the outbox instead of sending it in the request."""
+
+    def send_mail(self, subject_template_name, email_template_name, context, from_email, to_email,
+                  html_email_template_name=None):
+        subject = "".join(loader.render_to_string(subject_template_name, context).splitlines())
+        body = loader.render_to_string(email_template_name, context)
+        html_body = loader.render_to_string(html_email_template_name, context) if html_email_template_name else None
+        queue_mail(subject, body, [to_email], from_email=from_email, html_message=html_body)
+
+
+class SalesReportForm(forms.Form):
+    """Date range of the admin sales dashboard; hourly charts are limited to a week."""
+    first = forms.DateField(widget=forms.DateInput(attrs={"type": "date"}))
+    last = forms.DateField(widget=forms.DateInput(attrs={"type": "date"}))
+    period = forms.ChoiceField(choices=[("day", "By day"), ("hour", "By hour")], initial="day")
+
+    max_hourly_days = 7
+
+    def clean(self):
+        cleaned_data = super().clean()
+        first, last = cleaned_data.get("first"), cleaned_data.get("last")
+        if first and last:
+            if first > last:
+                raise forms.ValidationError("The range must start before it ends.")
+            if cleaned_data.get("period") == "hour" and (last - first).days >= self.max_hourly_days:
+                raise forms.ValidationError(f"Hourly charts cover at most {self.max_hourly_days} days.")
+        return cleaned_data
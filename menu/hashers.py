@@ -0,0 +1,135 @@
+import base64
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher, PBKDF2PasswordHasher, ScryptPasswordHasher, check_password, identify_hasher,
+    make_password,
+)
+
+# Password hashing policy: settings.PASSWORD_HASHER names the algorithm and
+# settings.PASSWORD_COST its cost for customers and for staff (PBKDF2
+# iterations, scrypt work factor or Argon2 time cost). The hashers keep
+# Django's algorithm names, so existing hashes verify unchanged; a hash made
+# under another algorithm or cost is redone at the next successful login
+# (see menu.backends.EmailOrUsernameBackend). Django itself only knows the
+# customer hasher: passwords set any other way (the admin, the password
+# forms) get the staff cost as the user is saved (menu/signals.py), and
+# User.check_password() leaves hashes above the customer cost alone.
+
+CUSTOMER = "customer"
+STAFF = "staff"
+
+
+class RoleCost:
+    """Takes the hasher's cost, the decoded parameter ``cost_param``, from the policy for ``role``."""
+
+    role = CUSTOMER
+    cost_param = None
+
+    @property
+    def cost(self):
+        return settings.PASSWORD_COST[self.role]
+
+    def must_update(self, encoded):
+        if self.role == CUSTOMER and self.decode(encoded)[self.cost_param] > self.cost:
+            # A staff hash; re-hashing it would take it down to the customer cost
+            return False
+        return super().must_update(encoded)
+
+
+class PBKDF2Hasher(RoleCost, PBKDF2PasswordHasher):
+    cost_param = "iterations"
+
+    @property
+    def iterations(self):
+        return self.cost
+
+
+class StaffPBKDF2Hasher(PBKDF2Hasher):
+    role = STAFF
+
+
+class ScryptHasher(RoleCost, ScryptPasswordHasher):
+    cost_param = "work_factor"
+
+    @property
+    def work_factor(self):
+        return self.cost
+
+    def encode(self, password, salt, n=None, r=None, p=None):
+        # As Django's, but with the memory limit sized for this hash's own
+        # cost: scrypt needs 128 * N * r bytes and OpenSSL refuses more than
+        # 32 MiB unless told otherwise. This hasher verifies every scrypt
+        # hash, staff ones and those made under an older cost included.
+        self._check_encode_args(password, salt)
+        n = n or self.work_factor
+        r = r or self.block_size
+        p = p or self.parallelism
+        hash_ = hashlib.scrypt(
+            password.encode(), salt=salt.encode(), n=n, r=r, p=p, maxmem=2 * 128 * n * r, dklen=64,
+        )
+        hash_ = base64.b64encode(hash_).decode("ascii").strip()
+        return "%s$%d$%s$%d$%d$%s" % (self.algorithm, n, salt, r, p, hash_)
+
+
+class StaffScryptHasher(ScryptHasher):
+    role = STAFF
+
+
+class Argon2Hasher(RoleCost, Argon2PasswordHasher):
+    cost_param = "time_cost"
+
+    @property
+    def time_cost(self):
+        return self.cost
+
+
+class StaffArgon2Hasher(Argon2Hasher):
+    role = STAFF
+
+
+# settings.PASSWORD_HASHER -> {role: hasher class}
+POLICIES = {
+    "pbkdf2": {CUSTOMER: PBKDF2Hasher, STAFF: StaffPBKDF2Hasher},
+    "scrypt": {CUSTOMER: ScryptHasher, STAFF: StaffScryptHasher},
+    "argon2": {CUSTOMER: Argon2Hasher, STAFF: StaffArgon2Hasher},
+}
+
+
+def role(user):
+    return STAFF if user.is_staff or user.is_superuser else CUSTOMER
+
+
+def hasher_for(user):
+    """The hasher the current policy wants for this user's password."""
+    return POLICIES[settings.PASSWORD_HASHER][role(user)]()
+
+
+def verify(user, password):
+    """
+    Check ``password`` against ``user``; on success, re-hash it if the policy has changed.
+
+    Unlike User.check_password(), which only knows the default (customer)
+    hasher, this brings staff accounts up to the staff cost.
+    """
+    hasher = hasher_for(user)
+
+    def rehash(raw):
+        user.password = make_password(raw, hasher=hasher)
+        user.save(update_fields=["password"])
+
+    return check_password(password, user.password, rehash, preferred=hasher)
+
+
+def hash_for_role(user):
+    """
+    Re-hash a password just given to set_password() at the user's cost,
+    before the user is saved; set_password() always uses the customer one.
+    """
+    password = getattr(user, "_password", None)
+    if password is None or not user.has_usable_password():
+        return
+    hasher = hasher_for(user)
+    if identify_hasher(user.password).algorithm != hasher.algorithm or hasher.must_update(user.password):
+        user.password = make_password(password, hasher=hasher)
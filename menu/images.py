@@ -0,0 +1,160 @@
+import hashlib
+import logging
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from . import catalog_cache
+
+logger = logging.getLogger(__name__)
+
+# Catalog images are uploaded at whatever size the admin had to hand, so
+# pages link sized renditions instead. Each rendition is named after the
+# SHA-256 of the source file and its size, which means a name never changes
+# meaning: it can be served with a far-future Cache-Control header, and a
+# replaced image simply gets new names. The source's digest is kept on the
+# row, so templates build rendition URLs without touching the storage.
+
+RENDITIONS_DIR = "renditions"
+
+# Name -> bounding width in pixels; sources are never upscaled
+SIZES = {
+    "thumb": 160,
+    "card": 480,
+    "detail": 960,
+}
+
+# Extension -> (Pillow format, save options). Browsers that understand WebP
+# get it from <picture>, everything else falls back to the JPEG.
+FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 6}),
+    "jpg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+# Model label -> (image field, digest field)
+SOURCES = {
+    "menu.category": ("image", "image_digest"),
+    "menu.product": ("product_image", "product_image_digest"),
+}
+
+
+def digest(data):
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def rendition_name(source_digest, size, ext):
+    return f"{RENDITIONS_DIR}/{source_digest[:2]}/{source_digest}-{SIZES[size]}.{ext}"
+
+
+def rendition_url(source_digest, size, ext):
+    return default_storage.url(rendition_name(source_digest, size, ext))
+
+
+def encode(image, width, ext):
+    """One rendition of an already opened image as bytes."""
+    fmt, options = FORMATS[ext]
+    if image.width > width:
+        image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+    if fmt == "JPEG" or image.mode not in ("RGB", "RGBA"):
+        # JPEG has no alpha channel; palette and CMYK sources get flattened too
+        image = image.convert("RGB")
+    out = BytesIO()
+    image.save(out, fmt, **options)
+    return out.getvalue()
+
+
+def render(data, force=False):
+    """
+    Write every rendition of the image bytes ``data``; returns the source digest.
+
+    Renditions already in storage are left alone unless ``force`` is set,
+    so rendering the same file twice costs one hash. Raises OSError when
+    Pillow cannot read the data, or when it has too many pixels to decode
+    safely (Image.MAX_IMAGE_PIXELS).
+    """
+    source_digest = digest(data)
+    wanted = [
+        (size, ext) for size in SIZES for ext in FORMATS
+        if force or not default_storage.exists(rendition_name(source_digest, size, ext))
+    ]
+    if not wanted:
+        return source_digest
+
+    try:
+        with Image.open(BytesIO(data)) as image:
+            image.load()
+            # Phone photos are stored sideways with an EXIF rotation; bake it in
+            image = ImageOps.exif_transpose(image)
+    except Image.DecompressionBombError as e:
+        raise OSError(str(e)) from e
+    for size, ext in wanted:
+        name = rendition_name(source_digest, size, ext)
+        if force and default_storage.exists(name):
+            default_storage.delete(name)
+        default_storage.save(name, ContentFile(encode(image, SIZES[size], ext)))
+    return source_digest
+
+
+def render_instance(instance, force=False):
+    """
+    Render the renditions of one Category or Product and record the digest.
+
+    The digest is written with an UPDATE so the save signals (search index,
+    renditions) do not fire again; the cached pages showing the image are
+    invalidated directly. Returns the digest, or "" for a missing image.
+    """
+    image_field, digest_field = SOURCES[instance._meta.label_lower]
+    file = getattr(instance, image_field)
+    source_digest = ""
+    if file:
+        with file.open("rb") as f:
+            source_digest = render(f.read(), force)
+    if getattr(instance, digest_field) != source_digest:
+        type(instance).objects.filter(pk=instance.pk).update(**{digest_field: source_digest})
+        setattr(instance, digest_field, source_digest)
+        catalog_cache.bump(*_scopes(instance))
+    return source_digest
+
+
+def _scopes(instance):
+    if instance._meta.label_lower == "menu.category":
+        return [catalog_cache.catalog(), catalog_cache.category(instance.pk)]
+    return [catalog_cache.offers(), catalog_cache.category(instance.category_id), catalog_cache.product(instance.pk)]
+
+
+def prepare_save(instance):
+    """
+    Called before a Category or Product is saved; True when renditions are due.
+
+    A freshly uploaded file gets renditions once the save commits. Any other
+    change of image drops the recorded digest, so pages fall back to the
+    original file until the render_images command has caught up.
+    """
+    image_field, digest_field = SOURCES[instance._meta.label_lower]
+    file = getattr(instance, image_field)
+    uploaded = bool(file) and not file._committed
+    has_changed = getattr(instance, "has_changed", None)
+    if not file or uploaded or (has_changed is not None and has_changed(image_field)):
+        setattr(instance, digest_field, "")
+    return uploaded
+
+
+def render_on_commit(instance):
+    # Renditions are only worth making for an image that really got saved
+    model, pk = type(instance), instance.pk
+    transaction.on_commit(lambda: _render_saved(model, pk))
+
+
+def _render_saved(model, pk):
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return
+    try:
+        render_instance(instance)
+    except OSError as e:
+        # Unreadable, oversized or missing file: pages keep linking the
+        # original, and the render_images command reports it too
+        logger.warning("No renditions for %s #%s: %s", model.__name__, pk, e)
@@ -0,0 +1,139 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+# Keyset ("seek") pagination: a page is addressed by the sort key of the row
+# next to it instead of an OFFSET, so a deep page costs the same index seek
+# as the first one and rows inserted meanwhile never shift a page. Cursors
+# are the boundary row's sort values as JSON in URL-safe base64; they carry
+# no authority, a forged one just lands somewhere else in the same listing.
+
+AFTER = "after"
+BEFORE = "before"
+
+
+class Page:
+    def __init__(self, items, next_cursor=None, previous_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def encode_cursor(values, direction=AFTER):
+    # str() keeps full microseconds on datetimes, which DjangoJSONEncoder would truncate
+    payload = json.dumps({direction: list(values)}, default=str, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Return (direction, values), or (None, None) for a missing or malformed cursor."""
+    if not token:
+        return None, None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        (direction, values), = payload.items()
+    except (ValueError, TypeError, AttributeError):
+        return None, None
+    if direction not in (AFTER, BEFORE) or not isinstance(values, list):
+        return None, None
+    return direction, values
+
+
+def build_page(rows, per_page, direction, key):
+    """
+    Turn the ``per_page + 1`` rows fetched for a cursor into a Page.
+
+    ``rows`` come in query order, which is reversed when paging backwards;
+    ``key(row)`` gives the sort values a cursor is built from.
+    """
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == BEFORE:
+        rows.reverse()
+        has_next, has_previous = True, more
+    else:
+        has_next, has_previous = more, direction == AFTER
+    if not rows:
+        return Page(rows)
+    return Page(
+        rows,
+        next_cursor=encode_cursor(key(rows[-1]), AFTER) if has_next else None,
+        previous_cursor=encode_cursor(key(rows[0]), BEFORE) if has_previous else None,
+    )
+
+
+def _seek(ordering, values, backwards):
+    """Q for the rows strictly past ``values`` in ``ordering`` (or before them when ``backwards``)."""
+    condition = Q()
+    for i, (order, value) in enumerate(zip(ordering, values)):
+        name = order.lstrip("-")
+        forward = order.startswith("-") == backwards
+        step = Q(**{f"{name}__{'gt' if forward else 'lt'}": value})
+        step &= Q(**{order_.lstrip("-"): value_ for order_, value_ in zip(ordering[:i], values[:i])})
+        condition |= step
+    # The redundant bound on the leading key gives the database an index range to seek to
+    leading = ordering[0].lstrip("-")
+    forward = ordering[0].startswith("-") == backwards
+    return Q(**{f"{leading}__{'gte' if forward else 'lte'}": values[0]}) & condition
+
+
+def _seek_query(queryset, ordering, cursor):
+    """The ordered, filtered queryset for ``cursor`` plus its direction."""
+    fields = [order.lstrip("-") for order in ordering]
+    direction, values = decode_cursor(cursor)
+    if values is not None and len(values) == len(fields):
+        try:
+            values = [queryset.model._meta.get_field(f).to_python(v) for f, v in zip(fields, values)]
+        except ValidationError:
+            direction = None
+    else:
+        direction = None
+
+    backwards = direction == BEFORE
+    queryset = queryset.order_by(*(
+        order.lstrip("-") if order.startswith("-") else f"-{order}" for order in ordering
+    ) if backwards else ordering)
+    if direction is not None:
+        queryset = queryset.filter(_seek(ordering, values, backwards))
+    return queryset, direction
+
+
+def _row_key(ordering):
+    fields = [order.lstrip("-") for order in ordering]
+    return lambda row: [getattr(row, f) for f in fields]
+
+
+def paginate(queryset, ordering, cursor=None, per_page=20):
+    """
+    Return the Page of ``queryset`` sorted by ``ordering`` that ``cursor`` points at.
+
+    ``ordering`` must end in a unique field (normally the primary key) so
+    every row has a distinct position. A missing or malformed cursor gives
+    the first page.
+    """
+    queryset, direction = _seek_query(queryset, ordering, cursor)
+    rows = list(queryset[:per_page + 1])
+    return build_page(rows, per_page, direction, _row_key(ordering))
+
+
+async def apaginate(queryset, ordering, cursor=None, per_page=20):
+    """paginate() for async views."""
+    queryset, direction = _seek_query(queryset, ordering, cursor)
+    rows = [row async for row in queryset[:per_page + 1]]
+    return build_page(rows, per_page, direction, _row_key(ordering))
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import threading
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Publish/subscribe for live order status. Order status changes are
+# published, once committed, to a per-customer channel; the My Orders event
+# stream (menu.async_views.OrderEventsView) subscribes to it. The broker is
+# settings.LIVE_BROKER: LocalBroker reaches subscribers in this process
+# only, RedisBroker fans out to every worker through Redis.
+
+# Messages a slow subscriber may have waiting before the oldest are dropped
+QUEUE_SIZE = 100
+
+
+def orders_channel(user_id):
+    return f"orders:{user_id}"
+
+
+def _offer(queue, message):
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(message)
+
+
+class LocalBroker:
+    """In-process fan-out; publish() may be called from any thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def publish(self, channel, message):
+        self.deliver(channel, message)
+
+    def deliver(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, message)
+            except RuntimeError:
+                # The subscriber's event loop has closed
+                pass
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        """Yields an asyncio.Queue of the messages published to ``channel`` from now on."""
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(QUEUE_SIZE))
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscriber)
+        try:
+            yield subscriber[1]
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(channel, set())
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    self._subscribers.pop(channel, None)
+
+
+class RedisBroker(LocalBroker):
+    """
+    Fan-out across workers through Redis pub/sub (needs redis-py).
+
+    Each process keeps one Redis subscription for all its channels and hands
+    the messages to its local subscribers, so an open stream costs no Redis
+    connection of its own.
+    """
+
+    prefix = "lol-cafe:live:"
+
+    def __init__(self, url=None):
+        super().__init__()
+        self.url = url or settings.LIVE_BROKER_URL
+        self._publisher = None
+        self._listener = None
+
+    def publish(self, channel, message):
+        if self._publisher is None:
+            import redis
+
+            self._publisher = redis.Redis.from_url(self.url)
+        self._publisher.publish(self.prefix + channel, json.dumps(message))
+
+    async def listen(self):
+        import redis.asyncio
+
+        client = redis.asyncio.Redis.from_url(self.url)
+        async with client.pubsub() as pubsub:
+            await pubsub.psubscribe(self.prefix + "*")
+            async for item in pubsub.listen():
+                if item["type"] == "pmessage":
+                    channel = item["channel"].decode()[len(self.prefix):]
+                    self.deliver(channel, json.loads(item["data"]))
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self.listen())
+        async with super().subscribe(channel) as queue:
+            yield queue
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(settings.LIVE_BROKER)()
+        return _broker
+
+
+def publish_order_changes(changes):
+    """Tell each customer's open My Orders pages about the given OrderChanges."""
+    for change in changes:
+        if change.status is None:
+            # Deleted
+            continue
+        broker().publish(orders_channel(change.customer_id), {
+            "id": change.order_id,
+            "status": change.status,
+            "tracking_no": change.tracking_no,
+        })
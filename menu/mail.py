@@ -0,0 +1,104 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+# Retry schedule for failed sends: 1, 2, 4, 8... minutes, capped at an hour
+RETRY_BASE = timedelta(minutes=1)
+RETRY_CAP = timedelta(hours=1)
+MAX_ATTEMPTS = 6
+
+# How long a worker owns the rows it picked up before another worker may retry them
+CLAIM_LEASE = timedelta(minutes=5)
+
+
+def default_from_email():
+    return settings.EMAIL_HOST_USER if hasattr(settings, 'EMAIL_HOST_USER') else 'admin@foodspot.com'
+
+
+def queue_mail(subject, message, recipient_list, from_email=None, html_message=None):
+    """Store an email in the outbox; the send_queued_mail worker delivers it."""
+    return OutboundEmail.objects.create(
+        subject=subject,
+        body=message,
+        html_body=html_message or "",
+        from_email=from_email or default_from_email(),
+        to=",".join(address for address in recipient_list if address),
+    )
+
+
+def retry_delay(attempts):
+    return min(RETRY_BASE * (2 ** max(attempts - 1, 0)), RETRY_CAP)
+
+
+def claim_batch(batch_size, now=None):
+    """
+    Reserve up to ``batch_size`` due emails for this worker.
+
+    Claiming pushes next_attempt_at past a lease with a conditional UPDATE,
+    so two workers draining the same outbox never send the same row.
+    """
+    now = now or timezone.now()
+    due = list(
+        OutboundEmail.objects.filter(status='Pending', next_attempt_at__lte=now)
+        .order_by('next_attempt_at', 'id')
+        .values_list('id', flat=True)[:batch_size]
+    )
+    if not due:
+        return []
+    lease = now + CLAIM_LEASE
+    OutboundEmail.objects.filter(id__in=due, status='Pending', next_attempt_at__lte=now).update(next_attempt_at=lease)
+    return list(OutboundEmail.objects.filter(id__in=due, next_attempt_at=lease).order_by('id'))
+
+
+def send_batch(batch_size=50, max_attempts=MAX_ATTEMPTS, connection=None):
+    """Send one batch over a single backend connection; returns (sent, retried, dead)."""
+    emails = claim_batch(batch_size)
+    if not emails:
+        return 0, 0, 0
+
+    connection = connection or get_connection()
+    sent, failed = [], []
+    try:
+        connection.open()
+    except Exception as e:
+        failed = [(email, e) for email in emails]
+    else:
+        try:
+            for email in emails:
+                message = EmailMultiAlternatives(
+                    email.subject, email.body, email.from_email, email.recipients, connection=connection
+                )
+                if email.html_body:
+                    message.attach_alternative(email.html_body, "text/html")
+                try:
+                    message.send()
+                    sent.append(email.id)
+                except Exception as e:
+                    failed.append((email, e))
+        finally:
+            connection.close()
+
+    now = timezone.now()
+    if sent:
+        OutboundEmail.objects.filter(id__in=sent).update(
+            status='Sent', sent_at=now, attempts=F('attempts') + 1, last_error=""
+        )
+
+    dead = 0
+    for email, error in failed:
+        attempts = email.attempts + 1
+        if attempts >= max_attempts:
+            dead += 1
+            status, next_attempt_at = 'Dead', now
+        else:
+            status, next_attempt_at = 'Pending', now + retry_delay(attempts)
+        OutboundEmail.objects.filter(id=email.id).update(
+            status=status, attempts=attempts, next_attempt_at=next_attempt_at, last_error=str(error)[:2000]
+        )
+
+    return len(sent), len(failed) - dead, dead
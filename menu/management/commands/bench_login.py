@@ -0,0 +1,74 @@
+import importlib.util
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from menu import hashers
+from menu.seed import migrate_database, temporary_database
+
+
+class Command(BaseCommand):
+    help = (
+        "Time logins through the authentication backend under each password hashing policy "
+        "and report logins per second per core. Runs against a throwaway SQLite database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hasher", action="append", dest="hashers", choices=sorted(hashers.POLICIES),
+            help="Algorithms to try (default: every installed one).",
+        )
+        parser.add_argument(
+            "--cost", action="append", dest="costs", type=int,
+            help="Costs to try, in the algorithm's unit (default: its customer and staff defaults).",
+        )
+        parser.add_argument("--logins", type=int, default=10, help="Timed logins per policy.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("This benchmark builds a throwaway SQLite database; run it with the SQLite settings.")
+        algorithms = options["hashers"] or [
+            name for name in hashers.POLICIES if name != "argon2" or importlib.util.find_spec("argon2")
+        ]
+        if "argon2" in algorithms and importlib.util.find_spec("argon2") is None:
+            raise CommandError("Argon2 needs the argon2-cffi package.")
+
+        cost = settings.PASSWORD_COST
+        self.stdout.write(
+            f"Configured: {settings.PASSWORD_HASHER}, customer cost {cost['customer']}, staff cost {cost['staff']}"
+        )
+        self.stdout.write(f"{'policy':<10} {'cost':>10} {'p50':>10} {'p95':>10} {'logins/s/core':>14}")
+        with temporary_database():
+            migrate_database()
+            for algorithm in algorithms:
+                costs = options["costs"] or sorted(set(settings.PASSWORD_COST_DEFAULTS[algorithm].values()))
+                for number, cost in enumerate(costs):
+                    p50, p95, mean = self.measure(f"bench-{algorithm}-{number}", algorithm, cost, options["logins"])
+                    self.stdout.write(
+                        f"{algorithm:<10} {cost:>10} {p50:>8.1f}ms {p95:>8.1f}ms {1000 / mean:>14.1f}"
+                    )
+
+    def measure(self, username, algorithm, cost, logins):
+        with override_settings(PASSWORD_HASHER=algorithm, PASSWORD_COST={"customer": cost, "staff": cost}):
+            password = "bench-login-password"
+            User.objects.create(username=username, password=make_password(password, hasher=hashers.hasher_for(User())))
+            timings = []
+            # One login at a time on one thread: the rate is what one core sustains
+            for _ in range(logins):
+                start = time.perf_counter()
+                if authenticate(username=username, password=password) is None:
+                    raise CommandError(f"Login failed under {algorithm} with cost {cost}.")
+                timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        return (
+            statistics.median(timings),
+            timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+            statistics.mean(timings),
+        )
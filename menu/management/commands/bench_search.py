@@ -0,0 +1,50 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from menu.models import Product
+from menu.search import fts_enabled, rebuild_index, search_products
+from menu.seed import seed_catalog
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare search latency of the FTS5 index against the old name__icontains scan. "
+        "Seeds products inside a transaction that is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=20000)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("queries", nargs="*", default=["masala", "dos", "chicken biryani", "spicy veg roll"])
+
+    def handle(self, *args, **options):
+        if not fts_enabled():
+            raise CommandError("The full-text index needs SQLite with FTS5.")
+
+        with transaction.atomic():
+            seed_catalog(categories=12, products=options["products"])
+            rebuild_index()
+            total = Product.objects.count()
+            self.stdout.write(f"{total} products, {options['repeat']} runs per query\n")
+            self.stdout.write(f"{'query':<20} {'scan p50':>10} {'scan p95':>10} {'fts p50':>10} {'fts p95':>10}")
+
+            for query in options["queries"]:
+                scan = self.measure(options["repeat"], lambda: list(Product.objects.filter(name__icontains=query)))
+                fts = self.measure(options["repeat"], lambda: search_products(query))
+                self.stdout.write(
+                    f"{query:<20} {scan[0]:>9.2f}ms {scan[1]:>9.2f}ms {fts[0]:>9.2f}ms {fts[1]:>9.2f}ms"
+                )
+
+            transaction.set_rollback(True)
+
+    def measure(self, repeat, fn):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        return statistics.median(timings), timings[min(len(timings) - 1, int(len(timings) * 0.95))]
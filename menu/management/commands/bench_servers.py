@@ -0,0 +1,84 @@
+import json
+import platform
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.urls import reverse
+
+from menu.benchmark import (
+    VOLUMES, add_volume_arguments, local_asgi_server, local_server, run_benchmark, seed_database, slow_clients,
+)
+from menu.seed import temporary_database
+
+# Pages with an async version in menu/async_views.py
+ASYNC_ROUTES = ["home", "category_detail", "product_detail", "my_orders", "search"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve one seeded throwaway SQLite database over a WSGI server with a fixed thread pool "
+        "and over lol_cafe/asgi.py, drive the pages that have async views with concurrent "
+        "clients while slow clients trickle in requests, and report both runs as JSON."
+    )
+
+    def add_arguments(self, parser):
+        add_volume_arguments(parser)
+
+        load = parser.add_argument_group("load")
+        load.add_argument("--clients", type=int, default=8, help="Concurrent logged-in clients.")
+        load.add_argument("--requests", type=int, default=100, help="Timed requests per URL.")
+        load.add_argument("--warmup", type=int, default=1, help="Untimed requests per client before timing.")
+        load.add_argument("--url", action="append", dest="urls", choices=ASYNC_ROUTES, help="Only these URL names.")
+        load.add_argument("--threads", type=int, default=4, help="Handler threads of the WSGI server.")
+
+        slow = parser.add_argument_group("slow clients")
+        slow.add_argument("--slow-clients", type=int, default=8, help="Connections trickling requests meanwhile.")
+        slow.add_argument("--slow-lines", type=int, default=10, help="Header lines each slow request trickles in.")
+        slow.add_argument("--slow-pause", type=float, default=0.1, help="Seconds between those lines.")
+
+        parser.add_argument("--output", help="Write the JSON report here instead of stdout.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("This benchmark builds a throwaway SQLite database; run it with the SQLite settings.")
+        if options["clients"] > options["users"]:
+            raise CommandError("--clients cannot exceed --users; every client logs in as its own customer.")
+
+        volumes = {key: options[key] for key in VOLUMES}
+        names = options["urls"] or ASYNC_ROUTES
+        servers = {}
+        with temporary_database():
+            users = seed_database(volumes)
+            clients = users[:options["clients"]]
+            with local_server(threads=options["threads"]) as address:
+                servers["wsgi"] = self.measure(address, clients, names, options)
+            with override_settings(ROOT_URLCONF="lol_cafe.asgi_urls"), local_asgi_server() as address:
+                servers["asgi"] = self.measure(address, clients, names, options)
+
+        report = {
+            "clients": options["clients"],
+            "requests_per_url": options["requests"],
+            "wsgi_threads": options["threads"],
+            "slow_clients": {
+                "count": options["slow_clients"],
+                "seconds_per_request": round(options["slow_lines"] * options["slow_pause"], 3),
+            },
+            "volumes": volumes,
+            "environment": {"python": platform.python_version(), "django": django.get_version()},
+            "servers": servers,
+        }
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+        else:
+            self.stdout.write(output)
+
+    def measure(self, address, clients, names, options):
+        with slow_clients(
+            address, options["slow_clients"], reverse("home"), options["slow_lines"], options["slow_pause"],
+        ) as slow:
+            results = run_benchmark(clients, names, options["requests"], options["warmup"], address)
+        return {"slow_requests_completed": sum(client.completed for client in slow), "urls": results}
@@ -0,0 +1,88 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from menu.benchmark import (
+    LOGS_OUT, ROUTES, VOLUMES, InProcessClient, Visitor, add_volume_arguments, percentile, seed_database,
+)
+from menu.models import Category, Product
+from menu.seed import temporary_database
+
+# Pages a logged-in customer hits most, plus two that flash a message
+DEFAULT_ROUTES = ["home", "product_detail", "cart", "my_orders", "add_to_cart", "cart_api"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway SQLite database and, for each session mode, count the queries a "
+        "logged-in request makes and how many of them touch the session table. Reports JSON."
+    )
+
+    def add_arguments(self, parser):
+        add_volume_arguments(parser)
+        parser.add_argument("--requests", type=int, default=50, help="Timed requests per URL and mode.")
+        parser.add_argument("--warmup", type=int, default=2, help="Untimed requests per URL and mode.")
+        parser.add_argument(
+            "--mode", action="append", dest="modes", choices=sorted(settings.SESSION_ENGINES),
+            help="Only these session modes (default: all).",
+        )
+        parser.add_argument("--url", action="append", dest="urls", choices=sorted(ROUTES), help="Only these URL names.")
+        parser.add_argument("--output", help="Write the JSON report here instead of stdout.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("This benchmark builds a throwaway SQLite database; run it with the SQLite settings.")
+        modes = options["modes"] or list(settings.SESSION_ENGINES)
+        names = options["urls"] or DEFAULT_ROUTES
+        volumes = {key: options[key] for key in VOLUMES}
+
+        results = {}
+        with temporary_database():
+            user = seed_database(volumes)[0]
+            category_ids = list(Category.objects.values_list("id", flat=True))
+            product_ids = list(Product.objects.values_list("id", flat=True))
+            for mode in modes:
+                with override_settings(SESSION_ENGINE=settings.SESSION_ENGINES[mode]):
+                    visitor = Visitor(InProcessClient(), user, category_ids, product_ids)
+                    results[mode] = {
+                        name: self.measure(visitor, name, options["requests"], options["warmup"]) for name in names
+                    }
+
+        report = {"requests_per_url": options["requests"], "volumes": volumes, "modes": results}
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+        else:
+            self.stdout.write(output)
+
+    def measure(self, visitor, name, requests, warmup):
+        method, build = ROUTES[name]
+        queries, session_queries, timings, errors = [], [], [], 0
+        for i in range(warmup + requests):
+            path, data = build(visitor)
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                status = visitor.client.request(method, path, data)
+                elapsed = (time.perf_counter() - start) * 1000
+            if name in LOGS_OUT:
+                visitor.client.login(visitor.user)
+            if i < warmup:
+                continue
+            queries.append(len(captured))
+            session_queries.append(sum("django_session" in query["sql"] for query in captured))
+            timings.append(elapsed)
+            errors += status >= 500
+        timings.sort()
+        return {
+            "requests": requests,
+            "errors": errors,
+            "queries": round(sum(queries) / requests, 2),
+            "session_queries": round(sum(session_queries) / requests, 2),
+            "p50": round(percentile(timings, 50), 3),
+            "p95": round(percentile(timings, 95), 3),
+        }
@@ -0,0 +1,86 @@
+import json
+import platform
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from menu.benchmark import (
+    ROUTES, VOLUMES, add_volume_arguments, compare, local_server, run_benchmark, seed_database,
+)
+from menu.seed import temporary_database
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway SQLite database, drive every menu URL with concurrent logged-in "
+        "clients and report throughput and p50/p95/p99 latency per URL name as JSON. "
+        "With --baseline, exits non-zero when a URL regressed."
+    )
+
+    def add_arguments(self, parser):
+        add_volume_arguments(parser)
+
+        load = parser.add_argument_group("load")
+        load.add_argument("--clients", type=int, default=8, help="Concurrent logged-in clients.")
+        load.add_argument("--requests", type=int, default=200, help="Timed requests per URL.")
+        load.add_argument("--warmup", type=int, default=1, help="Untimed requests per client before timing.")
+        load.add_argument(
+            "--server", action="store_true",
+            help="Go over HTTP to a threaded WSGI server on a local port instead of the in-process test client.",
+        )
+        load.add_argument("--url", action="append", dest="urls", choices=sorted(ROUTES), help="Only these URL names.")
+
+        report = parser.add_argument_group("report")
+        report.add_argument("--output", help="Write the JSON report here instead of stdout.")
+        report.add_argument("--baseline", help="JSON report of an earlier run to compare against.")
+        report.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown (0.25 = 25%%).")
+        report.add_argument("--min-delta-ms", type=float, default=2.0, help="Ignore slowdowns smaller than this.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("This benchmark builds a throwaway SQLite database; run it with the SQLite settings.")
+        if options["clients"] > options["users"]:
+            raise CommandError("--clients cannot exceed --users; every client logs in as its own customer.")
+
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                baseline = json.load(f)
+
+        volumes = {key: options[key] for key in VOLUMES}
+        with temporary_database():
+            users = seed_database(volumes)
+            clients = users[:options["clients"]]
+            if options["server"]:
+                with local_server() as address:
+                    results = run_benchmark(clients, options["urls"], options["requests"], options["warmup"], address)
+            else:
+                results = run_benchmark(clients, options["urls"], options["requests"], options["warmup"])
+
+        report = {
+            "mode": "server" if options["server"] else "in-process",
+            "clients": options["clients"],
+            "requests_per_url": options["requests"],
+            "volumes": volumes,
+            "environment": {
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "debug": settings.DEBUG,
+                "cache": settings.CACHES["default"]["BACKEND"],
+            },
+            "urls": results,
+        }
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+        else:
+            self.stdout.write(output)
+
+        if baseline is not None:
+            problems = compare(report, baseline, options["tolerance"], options["min_delta_ms"])
+            if problems:
+                raise CommandError("Performance regressed:\n  " + "\n  ".join(problems))
+            self.stderr.write(self.style.SUCCESS("No regressions against the baseline."))
@@ -0,0 +1,88 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models.functions import Lower
+
+from menu.seed import migrate_database, seed_activity, seed_catalog, temporary_database
+
+# Last migration before the hot-path indexes were added
+BEFORE = ("menu", "0011_checkout_header")
+
+
+def hot_queries(apps, sample):
+    """Name -> queryset for each hot lookup, built from the given app registry."""
+    User = apps.get_model("auth", "User")
+    Order = apps.get_model("menu", "Order")
+    Cart = apps.get_model("menu", "Cart")
+    Review = apps.get_model("menu", "Review")
+    return {
+        "orders by customer": Order.objects.filter(customer_id=sample["user_id"]).order_by("-date_order")[:20],
+        "order by tracking_no": Order.objects.filter(tracking_no=sample["tracking_no"]),
+        "cart line by user+item": Cart.objects.filter(user_id=sample["user_id"], item_id=sample["product_id"]),
+        "review for order": Review.objects.filter(order_id=sample["order_id"]),
+        "user by username": User.objects.annotate(username_lower=Lower("username"))
+        .filter(username_lower=sample["username"]),
+        "user by email": User.objects.annotate(email_lower=Lower("email")).filter(email_lower=sample["email"]),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway SQLite database before and after the hot-path index migration "
+        "and print EXPLAIN QUERY PLAN and timings for each hot query."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=2000)
+        parser.add_argument("--orders-per-user", type=int, default=25)
+        parser.add_argument("--products", type=int, default=2000)
+        parser.add_argument("--repeat", type=int, default=50)
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("This benchmark builds throwaway SQLite databases; run it with the SQLite settings.")
+
+        results = {}
+        for label, target in (("before", BEFORE), ("after", None)):
+            self.stdout.write(f"Seeding {label} database...")
+            with temporary_database():
+                apps = migrate_database(target)
+                products = seed_catalog(categories=12, products=options["products"], apps=apps)
+                users = seed_activity(products, users=options["users"],
+                                      orders_per_user=options["orders_per_user"], apps=apps)
+                results[label] = self.measure(apps, users, options["repeat"])
+
+        for name in results["after"]:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\n{name}"))
+            for label in ("before", "after"):
+                plan, p50, p95 = results[label][name]
+                self.stdout.write(f"  {label:<6} p50 {p50:8.3f}ms  p95 {p95:8.3f}ms")
+                for line in plan.splitlines():
+                    self.stdout.write(f"         {line}")
+
+    def measure(self, apps, users, repeat):
+        Order = apps.get_model("menu", "Order")
+        user = users[len(users) // 2]
+        order = Order.objects.filter(customer_id=user.id).order_by("id").first()
+        sample = {
+            "user_id": user.id,
+            "username": user.username.lower(),
+            "email": user.email.lower(),
+            "tracking_no": order.tracking_no,
+            "order_id": order.id,
+            "product_id": order.orderitem_id,
+        }
+
+        results = {}
+        for name, queryset in hot_queries(apps, sample).items():
+            plan = queryset.explain()
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            results[name] = (plan, statistics.median(timings), timings[min(len(timings) - 1, int(len(timings) * 0.95))])
+        return results
@@ -0,0 +1,44 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from menu.avatars import DONE, DROPPED, SUPERSEDED, process_batch
+
+
+class Command(BaseCommand):
+    help = (
+        "Crop pending profile picture uploads to a small square JPEG without EXIF data "
+        "and replace the original upload with it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=20)
+        parser.add_argument("--size", type=int, default=settings.PROFILE_PIC_SIZE, help="Side of the square in pixels.")
+        parser.add_argument("--loop", action="store_true",
+                            help="Keep polling for uploads instead of exiting once none are pending.")
+        parser.add_argument("--interval", type=float, default=5.0,
+                            help="Seconds to sleep between polls when nothing is pending (with --loop).")
+
+    def handle(self, *args, **options):
+        totals = {DONE: 0, DROPPED: 0, SUPERSEDED: 0}
+        while True:
+            counts = process_batch(options["batch_size"], options["size"])
+            for outcome, n in counts.items():
+                totals[outcome] += n
+            handled = sum(counts.values())
+            if handled:
+                self.stdout.write(
+                    f"Processed {counts[DONE]}, dropped {counts[DROPPED]} unreadable, "
+                    f"{counts[SUPERSEDED]} replaced meanwhile"
+                )
+            # A full batch means more is probably waiting; otherwise we are drained
+            if handled >= options["batch_size"]:
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {totals[DONE]} processed, {totals[DROPPED]} dropped, {totals[SUPERSEDED]} superseded."
+        ))
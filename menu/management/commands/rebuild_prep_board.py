@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from menu import prep
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the kitchen prep board (PrepLine) from the Order table, e.g. after "
+        "order statuses were changed with raw SQL or a queryset update()."
+    )
+
+    def handle(self, *args, **options):
+        rows = prep.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Prep board rebuilt: {rows} row(s)."))
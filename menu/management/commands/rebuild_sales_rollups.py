@@ -0,0 +1,24 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from menu import sales
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the hourly and daily sales rollups from the Order table, e.g. after "
+        "orders were changed with raw SQL or a queryset update()."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since", type=date.fromisoformat, metavar="YYYY-MM-DD",
+            help="Only rebuild the periods from this date on (default: all of them).",
+        )
+
+    def handle(self, *args, **options):
+        written = sales.rebuild(options["since"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Sales rollups rebuilt: {written['hour']} hourly and {written['day']} daily row(s)."
+        ))
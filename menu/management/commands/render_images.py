@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from menu import images
+from menu.models import Category, Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the sized WebP/JPEG renditions of every category and product image and "
+        "record their content digests. Safe to re-run; existing renditions are kept."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Re-encode renditions that already exist.")
+        parser.add_argument(
+            "--missing", action="store_true",
+            help="Only images without a recorded digest (new since the last run).",
+        )
+
+    def handle(self, *args, **options):
+        rendered = failed = 0
+        for model in (Category, Product):
+            image_field, digest_field = images.SOURCES[model._meta.label_lower]
+            no_image = Q(**{image_field: ""}) | Q(**{f"{image_field}__isnull": True})
+            rows = model.objects.exclude(no_image)
+            if options["missing"]:
+                rows = rows.filter(**{digest_field: ""})
+            # Rows whose image went away keep no stale digest
+            model.objects.filter(no_image).exclude(**{digest_field: ""}).update(**{digest_field: ""})
+            for instance in rows.order_by("pk").iterator():
+                try:
+                    images.render_instance(instance, force=options["force"])
+                except OSError as e:
+                    failed += 1
+                    self.stderr.write(f"{model.__name__} #{instance.pk}: {getattr(instance, image_field).name}: {e}")
+                else:
+                    rendered += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Rendered {rendered} image(s), {failed} failed."))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from menu.models import Product, Review
+
+
+class Command(BaseCommand):
+    help = "Recompute Product.rating_count and rating_sum from the Review table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="Only report products whose stored ratings have drifted.",
+        )
+
+    def handle(self, *args, **options):
+        reviews = Review.objects.filter(product=OuterRef("pk")).order_by().values("product")
+        actual_count = Coalesce(Subquery(reviews.annotate(n=Count("id")).values("n")), 0)
+        actual_sum = Coalesce(Subquery(reviews.annotate(total=Sum("rating")).values("total")), 0)
+
+        with transaction.atomic():
+            drifted = Product.objects.annotate(
+                actual_count=actual_count, actual_sum=actual_sum,
+            ).exclude(rating_count=F("actual_count"), rating_sum=F("actual_sum"))
+            count = drifted.count()
+            if not options["dry_run"] and count:
+                Product.objects.update(rating_count=actual_count, rating_sum=actual_sum)
+
+        verb = "would be repaired" if options["dry_run"] else "repaired"
+        self.stdout.write(self.style.SUCCESS(f"{count} product(s) {verb}."))
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from menu.mail import MAX_ATTEMPTS, send_batch
+
+
+class Command(BaseCommand):
+    help = "Deliver queued emails from the outbox in batches over one reused mail connection."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS,
+                            help="Attempts before an email is dead-lettered.")
+        parser.add_argument("--loop", action="store_true",
+                            help="Keep polling the outbox instead of exiting once it is drained.")
+        parser.add_argument("--interval", type=float, default=5.0,
+                            help="Seconds to sleep between polls when the outbox is empty (with --loop).")
+
+    def handle(self, *args, **options):
+        totals = [0, 0, 0]
+        while True:
+            sent, retried, dead = send_batch(options["batch_size"], options["max_attempts"])
+            totals = [totals[0] + sent, totals[1] + retried, totals[2] + dead]
+            if sent or retried or dead:
+                self.stdout.write(f"Sent {sent}, retrying {retried}, dead-lettered {dead}")
+            # A full batch means more is probably waiting; otherwise we are drained
+            if sent + retried + dead >= options["batch_size"]:
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {totals[0]} sent, {totals[1]} to retry, {totals[2]} dead-lettered."
+        ))
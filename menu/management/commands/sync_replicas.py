@@ -0,0 +1,48 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the SQLite primary into the replica files named in CAFE_DB_REPLICAS. "
+        "Stands in for replication when trying the replica router locally; "
+        "PostgreSQL replicas are kept up to date by the server and are left alone."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "aliases", nargs="*",
+            help="Replica aliases to refresh (default: every replica in settings.DATABASE_REPLICAS).",
+        )
+
+    def handle(self, *args, **options):
+        aliases = options["aliases"] or settings.DATABASE_REPLICAS
+        primary = connections[DEFAULT_DB_ALIAS].settings_dict
+        if primary["ENGINE"] != "django.db.backends.sqlite3":
+            raise CommandError("sync_replicas only copies SQLite databases.")
+        for alias in aliases:
+            if alias not in settings.DATABASE_REPLICAS:
+                raise CommandError(f"{alias!r} is not a replica alias.")
+
+        source = sqlite3.connect(primary["NAME"])
+        try:
+            for alias in aliases:
+                name = connections[alias].settings_dict["NAME"]
+                if str(name) == str(primary["NAME"]):
+                    # A test mirror is the primary itself
+                    self.stdout.write(f"{alias}: same file as the primary, skipped")
+                    continue
+                target = sqlite3.connect(name)
+                try:
+                    # The online backup API copies a consistent snapshot while
+                    # the primary keeps taking writes
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(f"{alias}: copied from {primary['NAME']}")
+        finally:
+            source.close()
+        self.stdout.write(self.style.SUCCESS(f"Synced {len(aliases)} replica(s)."))
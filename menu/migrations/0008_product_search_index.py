@@ -0,0 +1,35 @@
+# Generated by Django 5.2.3 on 2026-10-17 23:40
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS menu_product_fts USING fts5("
+        "name, description, category, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    schema_editor.execute(
+        "INSERT INTO menu_product_fts (rowid, name, description, category) "
+        "SELECT p.id, p.name, p.description, c.name "
+        "FROM menu_product p JOIN menu_category c ON c.id = p.category_id"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS menu_product_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0007_product_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.3 on 2026-10-17 23:08
+
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import migrations, models
+
+
+def backfill_discounts(apps, schema_editor):
+    Product = apps.get_model('menu', 'Product')
+    products = list(Product.objects.filter(original_price__gt=0).only('original_price', 'selling_price'))
+    for product in products:
+        discount = (1 - product.selling_price / product.original_price) * 100
+        product.discount_percent = max(discount, Decimal('0')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    Product.objects.bulk_update(products, ['discount_percent'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0008_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='discount_percent',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, max_digits=5),
+        ),
+        migrations.RunPython(backfill_discounts, migrations.RunPython.noop),
+    ]
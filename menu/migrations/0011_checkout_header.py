@@ -0,0 +1,70 @@
+# Generated by Django 5.2.3 on 2026-10-17 23:11
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+STATUS_PROGRESS = ('Pending', 'Out for Delivery', 'Delivered')
+
+
+def group_orders_into_checkouts(apps, schema_editor):
+    Order = apps.get_model('menu', 'Order')
+    Checkout = apps.get_model('menu', 'Checkout')
+
+    groups = {}
+    for order in Order.objects.order_by('date_order', 'id').iterator():
+        if not order.tracking_no:
+            # Orders from before tracking numbers get a header of their own
+            order.tracking_no = f"legacy{order.id}"
+            Order.objects.filter(id=order.id).update(tracking_no=order.tracking_no)
+        groups.setdefault(order.tracking_no, []).append(order)
+
+    for tracking_no, orders in groups.items():
+        statuses = {order.order_sts for order in orders}
+        if len(statuses) == 1:
+            status = statuses.pop()
+        else:
+            live = [s for s in STATUS_PROGRESS if s in statuses]
+            status = live[0] if live else 'Cancelled'
+        checkout = Checkout.objects.create(
+            customer_id=orders[0].customer_id,
+            tracking_no=tracking_no,
+            total=sum(order.price or 0 for order in orders),
+            status=status,
+            created_at=orders[0].date_order,
+        )
+        Order.objects.filter(id__in=[order.id for order in orders]).update(checkout=checkout)
+
+
+def ungroup_checkouts(apps, schema_editor):
+    Order = apps.get_model('menu', 'Order')
+    Order.objects.filter(tracking_no__startswith='legacy').update(tracking_no=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0010_outbound_email'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Checkout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tracking_no', models.CharField(max_length=150, unique=True)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Out for Delivery', 'Out for Delivery'), ('Delivered', 'Delivered'), ('Cancelled', 'Cancelled')], default='Pending', max_length=20)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='checkout',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='items', to='menu.checkout'),
+        ),
+        migrations.RunPython(group_orders_into_checkouts, ungroup_checkouts),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 5.2.3 on 2026-10-17 23:13
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+USER_EMAIL_INDEX = 'menu_user_email_lower'
+
+
+def merge_duplicate_carts(apps, schema_editor):
+    Cart = apps.get_model('menu', 'Cart')
+    duplicates = (
+        Cart.objects.values('user', 'item')
+        .annotate(rows=Count('id'), keep=Min('id'), total=Sum('qty'))
+        .filter(rows__gt=1)
+    )
+    for dup in duplicates:
+        Cart.objects.filter(id=dup['keep']).update(qty=dup['total'])
+        Cart.objects.filter(user=dup['user'], item=dup['item']).exclude(id=dup['keep']).delete()
+
+
+def drop_duplicate_reviews(apps, schema_editor):
+    Review = apps.get_model('menu', 'Review')
+    Product = apps.get_model('menu', 'Product')
+    duplicates = (
+        Review.objects.filter(order__isnull=False).values('order')
+        .annotate(rows=Count('id'), keep=Min('id'))
+        .filter(rows__gt=1)
+    )
+    removed = False
+    for dup in duplicates:
+        Review.objects.filter(order=dup['order']).exclude(id=dup['keep']).delete()
+        removed = True
+    if removed:
+        reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+        Product.objects.update(
+            rating_count=Coalesce(Subquery(reviews.annotate(n=Count('id')).values('n')), 0),
+            rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0),
+        )
+
+
+def add_user_email_index(apps, schema_editor):
+    # Case-insensitive email login looks users up by LOWER(email)
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    quote = schema_editor.quote_name
+    schema_editor.execute(
+        f"CREATE INDEX {quote(USER_EMAIL_INDEX)} ON {quote(User._meta.db_table)} (LOWER({quote('email')}))"
+    )
+
+
+def remove_user_email_index(apps, schema_editor):
+    schema_editor.execute(f"DROP INDEX {schema_editor.quote_name(USER_EMAIL_INDEX)}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0011_checkout_header'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer', '-date_order'], name='menu_order_customer_date'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['tracking_no'], name='menu_order_tracking_no'),
+        ),
+        migrations.RunPython(merge_duplicate_carts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(fields=('user', 'item'), name='menu_cart_unique_user_item'),
+        ),
+        migrations.RunPython(drop_duplicate_reviews, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='review',
+            constraint=models.UniqueConstraint(condition=models.Q(('order__isnull', False)), fields=('order',), name='menu_review_unique_order'),
+        ),
+        migrations.RunPython(add_user_email_index, remove_user_email_index),
+    ]
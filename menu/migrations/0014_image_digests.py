@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-17 23:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0013_product_category_name_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='image_digest',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='product_image_digest',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32),
+        ),
+    ]
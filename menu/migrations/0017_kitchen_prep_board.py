@@ -0,0 +1,51 @@
+# Generated by Django 5.2.3 on 2026-10-18 00:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+COLUMNS = {'Pending': 'pending', 'Out for Delivery': 'out_for_delivery'}
+
+
+def fill_prep_board(apps, schema_editor):
+    Order = apps.get_model('menu', 'Order')
+    PrepLine = apps.get_model('menu', 'PrepLine')
+
+    lines = {}
+    totals = (
+        Order.objects.filter(order_sts__in=COLUMNS)
+        .values_list('orderitem_id', 'tracking_no', 'order_sts')
+        .annotate(qty=Sum('qty'))
+        .order_by()
+    )
+    for product_id, tracking_no, status, qty in totals:
+        line = lines.setdefault(
+            (product_id, tracking_no or ''), PrepLine(product_id=product_id, tracking_no=tracking_no or ''),
+        )
+        setattr(line, COLUMNS[status], qty)
+    PrepLine.objects.bulk_create(lines.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0016_order_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrepLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tracking_no', models.CharField(blank=True, default='', max_length=150)),
+                ('pending', models.IntegerField(default=0)),
+                ('out_for_delivery', models.IntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='menu.product')),
+            ],
+            options={
+                'verbose_name_plural': 'kitchen prep board',
+                'constraints': [models.UniqueConstraint(fields=('product', 'tracking_no'), name='menu_prepline_product_tracking')],
+            },
+        ),
+        migrations.RunPython(fill_prep_board, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.3 on 2026-10-18 00:18
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce, TruncDate, TruncHour
+
+
+def fill_sales_rollups(apps, schema_editor):
+    Order = apps.get_model('menu', 'Order')
+    orders = Order.objects.exclude(order_sts='Cancelled')
+    for model_name, trunc in (('HourlySales', TruncHour), ('DailySales', TruncDate)):
+        model = apps.get_model('menu', model_name)
+        rows = (
+            orders.annotate(period=trunc('date_order'))
+            .values_list('period', 'orderitem_id')
+            .annotate(revenue=Coalesce(Sum('price'), Decimal(0)), units=Sum('qty'), orders=Count('id'))
+            .order_by()
+        )
+        model.objects.bulk_create([
+            model(start=start, product_id=product_id, revenue=revenue, units=units, orders=count)
+            for start, product_id, revenue, units, count in rows
+        ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0017_kitchen_prep_board'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('units', models.IntegerField(default=0)),
+                ('orders', models.IntegerField(default=0)),
+                ('start', models.DateField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='menu.product')),
+            ],
+            options={
+                'verbose_name_plural': 'sales dashboard',
+                'constraints': [models.UniqueConstraint(fields=('start', 'product'), name='menu_dailysales_start_product')],
+            },
+        ),
+        migrations.CreateModel(
+            name='HourlySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('units', models.IntegerField(default=0)),
+                ('orders', models.IntegerField(default=0)),
+                ('start', models.DateTimeField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='menu.product')),
+            ],
+            options={
+                'verbose_name_plural': 'hourly sales',
+                'constraints': [models.UniqueConstraint(fields=('start', 'product'), name='menu_hourlysales_start_product')],
+            },
+        ),
+        migrations.RunPython(fill_sales_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.db import migrations
+
+USER_USERNAME_INDEX = 'menu_user_username_lower'
+
+
+def add_user_username_index(apps, schema_editor):
+    # Case-insensitive username login looks users up by LOWER(username)
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    quote = schema_editor.quote_name
+    schema_editor.execute(
+        f"CREATE INDEX {quote(USER_USERNAME_INDEX)} ON {quote(User._meta.db_table)} (LOWER({quote('username')}))"
+    )
+
+
+def remove_user_username_index(apps, schema_editor):
+    schema_editor.execute(f"DROP INDEX {schema_editor.quote_name(USER_USERNAME_INDEX)}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0018_sales_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(add_user_username_index, remove_user_username_index),
+    ]
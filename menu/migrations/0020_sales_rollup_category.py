@@ -0,0 +1,44 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_rollup_categories(apps, schema_editor):
+    # Existing rows can only take the product's current category
+    Product = apps.get_model('menu', 'Product')
+    category = Subquery(Product.objects.filter(id=OuterRef('product_id')).values('category_id')[:1])
+    for model_name in ('HourlySales', 'DailySales'):
+        apps.get_model('menu', model_name).objects.update(category_id=category)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0019_user_username_lower_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailysales',
+            name='category',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='menu.category'),
+        ),
+        migrations.AddField(
+            model_name='hourlysales',
+            name='category',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='menu.category'),
+        ),
+        migrations.RunPython(fill_rollup_categories, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='dailysales',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='menu.category'),
+        ),
+        migrations.AlterField(
+            model_name='hourlysales',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='menu.category'),
+        ),
+    ]
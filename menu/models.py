@@ -1,14 +1,46 @@
-from django.db import models
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import models, router, transaction
+from django.db.models import F
+from django.utils import timezone
 from django.contrib.auth.models import User
+from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
+# ------------------------------ LOADED VALUES ------------------------------
+
+class TracksLoadedValues:
+    """
+    Model mixin remembering the column values an instance was loaded or
+    last saved with, so saves and their signals can tell which fields changed.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def has_changed(self, *fields):
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return True
+        return any(loaded.get(field) != getattr(self, field) for field in fields if field in loaded)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_values = {f.attname: getattr(self, f.attname) for f in self._meta.concrete_fields}
+
+
 # ------------------------------ CATEGORY ------------------------------
 
 class Category(models.Model):
     name = models.CharField(max_length=200, null=False, blank=False)
     description = models.TextField(max_length=200, null=False, blank=False)
     image = models.ImageField(upload_to='images', null=True)
+    # SHA-256 prefix naming the image's sized renditions (menu/images.py); blank until rendered
+    image_digest = models.CharField(max_length=32, blank=True, default='', editable=False)
     status = models.BooleanField(default=False)
 
     def __str__(self):
@@ -17,14 +49,50 @@ class Category(models.Model):
 
 # ------------------------------ PRODUCT ------------------------------
 
-class Product(models.Model):
+def compute_discount(original_price, selling_price):
+    original_price = Decimal(original_price or 0)
+    if original_price <= 0:
+        return Decimal('0.00')
+    discount = (1 - Decimal(selling_price or 0) / original_price) * 100
+    return max(discount, Decimal('0')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+class Product(TracksLoadedValues, models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     name = models.CharField(max_length=150, null=False, blank=False)
     product_image = models.ImageField(upload_to='images', null=True, blank=True)
+    product_image_digest = models.CharField(max_length=32, blank=True, default='', editable=False)
     quantity = models.IntegerField(null=False, blank=False, default=0)
     original_price = models.DecimalField(max_digits=10, decimal_places=2, null=False)
     selling_price = models.DecimalField(max_digits=10, decimal_places=2, null=False)
     description = models.TextField(max_length=300, null=False)
+    # Maintained alongside Review inserts so pages never scan the review table
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    # Percentage off original_price, kept in step with the prices on save so the Offer Zone can use an index
+    discount_percent = models.DecimalField(max_digits=5, decimal_places=2, default=0, db_index=True)
+
+    # Fields shown on an Offer Zone card; the cached list is rebuilt only when one of these changes
+    OFFER_FIELDS = ('name', 'product_image', 'product_image_digest', 'original_price', 'selling_price')
+
+    class Meta:
+        indexes = [
+            # Category listings page on (name, id) within a category
+            models.Index(fields=['category', 'name'], name='menu_product_category_name'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.discount_percent = compute_discount(self.original_price, self.selling_price)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'original_price', 'selling_price'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'discount_percent'}
+        super().save(*args, **kwargs)
+
+    @property
+    def average_rating(self):
+        if not self.rating_count:
+            return None
+        return round(self.rating_sum / self.rating_count, 1)
 
     def __str__(self):
         return self.name
@@ -37,6 +105,11 @@ class Cart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     qty = models.IntegerField(null=False, default=1)
     date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'item'], name='menu_cart_unique_user_item'),
+        ]
     
     def total_price(self):
         return self.qty * self.item.selling_price
@@ -47,7 +120,11 @@ class Cart(models.Model):
 
 # ------------------------------ ORDER ------------------------------
 
-class Order(models.Model):
+class StaleOrder(Exception):
+    """Raised when saving an Order that someone else saved after it was loaded."""
+
+
+class Order(TracksLoadedValues, models.Model):
     orderitem = models.ForeignKey(Product, on_delete=models.CASCADE)
     customer = models.ForeignKey(User, on_delete=models.CASCADE)
     qty = models.IntegerField(default=1) # Kept this to avoid breaking Buy logic
@@ -67,21 +144,176 @@ class Order(models.Model):
     razorpay_payment_id = models.CharField(max_length=200, null=True, blank=True)
     razorpay_signature = models.CharField(max_length=200, null=True, blank=True)
     tracking_no = models.CharField(max_length=150, null=True, blank=True)
+    checkout = models.ForeignKey('Checkout', on_delete=models.CASCADE, null=True, blank=True, related_name='items')
+    # Bumped by every save and status transition; a save carrying an older version is refused
+    version = models.PositiveIntegerField(default=0)
+
+    # Status changes staff may make; Delivered and Cancelled are final
+    TRANSITIONS = {
+        'Pending': ('Out for Delivery', 'Cancelled'),
+        'Out for Delivery': ('Delivered', 'Cancelled'),
+        'Delivered': (),
+        'Cancelled': (),
+    }
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['customer', '-date_order'], name='menu_order_customer_date'),
+            models.Index(fields=['tracking_no'], name='menu_order_tracking_no'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            super().save(*args, **kwargs)
+        else:
+            with transaction.atomic(using=router.db_for_write(Order)):
+                if not hasattr(self, '_loaded_values'):
+                    # Built in memory (bulk_create); read the row so saves can tell what changed
+                    attnames = [f.attname for f in self._meta.concrete_fields]
+                    self._loaded_values = Order.objects.filter(pk=self.pk).values(*attnames).first() or {}
+                # Claim the row at the version this instance was loaded (or edited) at
+                if not Order.objects.filter(pk=self.pk, version=self.version).update(version=F('version') + 1):
+                    raise StaleOrder(f"Order #{self.pk} was changed by someone else")
+                self.version += 1
+                super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Order #{self.id} by {self.customer.username}"
 
 
+# ------------------------------ CHECKOUT ------------------------------
+
+class Checkout(models.Model):
+    """One placed order: the header for the Order line items bought together."""
+    customer = models.ForeignKey(User, on_delete=models.CASCADE)
+    tracking_no = models.CharField(max_length=150, unique=True)
+    total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES, default='Pending')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    # Progress of a checkout whose lines disagree is that of its least advanced live line
+    STATUS_PROGRESS = ('Pending', 'Out for Delivery', 'Delivered')
+
+    @classmethod
+    def status_for(cls, line_statuses):
+        line_statuses = set(line_statuses)
+        if len(line_statuses) == 1:
+            return line_statuses.pop()
+        live = [status for status in cls.STATUS_PROGRESS if status in line_statuses]
+        return live[0] if live else 'Cancelled'
+
+    def refresh_status(self):
+        status = self.status_for(self.items.values_list('order_sts', flat=True))
+        if status != self.status:
+            Checkout.objects.filter(id=self.id).update(status=status)
+            self.status = status
+
+    @classmethod
+    def refresh_statuses(cls, checkout_ids):
+        """refresh_status() for many checkouts: one read, then one UPDATE per resulting status."""
+        line_statuses = {}
+        lines = Order.objects.filter(checkout_id__in=checkout_ids).values_list('checkout_id', 'order_sts')
+        for checkout_id, status in lines:
+            line_statuses.setdefault(checkout_id, set()).add(status)
+        by_status = {}
+        for checkout_id, statuses in line_statuses.items():
+            by_status.setdefault(cls.status_for(statuses), []).append(checkout_id)
+        for status, ids in by_status.items():
+            cls.objects.filter(id__in=ids).exclude(status=status).update(status=status)
+
+    def __str__(self):
+        return f"{self.tracking_no} by {self.customer.username}"
+
+
+@receiver(post_save, sender=Order)
+def sync_checkout_status(sender, instance, created, raw=False, **kwargs):
+    if not raw and not created and instance.checkout_id:
+        instance.checkout.refresh_status()
+
+
+# ------------------------------ KITCHEN PREP BOARD ------------------------------
+
+class PrepLine(models.Model):
+    """
+    How many of a product are pending and out for delivery under one
+    tracking number. Kept in step with Order by menu.prep.apply(), so the
+    kitchen board reads these rows instead of the orders; rows with nothing
+    left are removed.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    tracking_no = models.CharField(max_length=150, blank=True, default='')
+    pending = models.IntegerField(default=0)
+    out_for_delivery = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'kitchen prep board'
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'tracking_no'], name='menu_prepline_product_tracking'),
+        ]
+
+
+# ------------------------------ SALES ROLLUPS ------------------------------
+
+class SalesRollup(models.Model):
+    """
+    Sales of a product over one period, counting every order not cancelled
+    by the time it was placed. Kept in step with Order by
+    menu.sales.apply(), so reports never scan the orders.
+
+    ``category`` is the product's category when the row was first written,
+    so moving a product later does not move its past sales.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    units = models.IntegerField(default=0)
+    orders = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class HourlySales(SalesRollup):
+    start = models.DateTimeField()
+
+    class Meta:
+        verbose_name_plural = 'hourly sales'
+        constraints = [
+            models.UniqueConstraint(fields=['start', 'product'], name='menu_hourlysales_start_product'),
+        ]
+
+
+class DailySales(SalesRollup):
+    start = models.DateField()
+
+    class Meta:
+        verbose_name_plural = 'sales dashboard'
+        constraints = [
+            models.UniqueConstraint(fields=['start', 'product'], name='menu_dailysales_start_product'),
+        ]
+
+
 # ------------------------------ REVIEW ------------------------------
 
-class Review(models.Model):
+class Review(TracksLoadedValues, models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     order = models.ForeignKey(Order, on_delete=models.CASCADE, null=True, blank=True)
-    rating = models.IntegerField(default=5)
+    rating = models.IntegerField(default=5, validators=[MinValueValidator(1), MaxValueValidator(5)])
     comment = models.TextField(max_length=500)
     date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', '-date'], name='menu_review_product_date'),
+        ]
+        constraints = [
+            # One review per delivered order; AddReviewView already checks this
+            models.UniqueConstraint(
+                fields=['order'], condition=models.Q(order__isnull=False), name='menu_review_unique_order'
+            ),
+        ]
+
     def __str__(self):
         return f"Review by {self.user.username} for {self.product.name}"
 
@@ -92,8 +324,15 @@ class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     phone = models.CharField(max_length=15, null=True, blank=True)
     profile_pic = models.ImageField(upload_to='profile_pics', null=True, blank=True)
+    # Set while profile_pic is the raw upload, until process_profile_pics replaces it
+    pic_pending = models.BooleanField(default=False)
     bio = models.TextField(max_length=500, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(pic_pending=True), name='menu_profile_pic_pending'),
+        ]
+
     def __str__(self):
         return f'{self.user.username} Profile'
 
@@ -107,3 +346,36 @@ def create_user_profile(sender, instance, created, **kwargs):
 def save_user_profile(sender, instance, **kwargs):
     if hasattr(instance, 'profile'):
         instance.profile.save()
+
+
+# ------------------------------ EMAIL OUTBOX ------------------------------
+
+class OutboundEmail(models.Model):
+    STATUS_CHOICES = (
+        ('Pending', 'Pending'),
+        ('Sent', 'Sent'),
+        ('Dead', 'Dead'),
+    )
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=254)
+    to = models.TextField(help_text="Comma-separated recipient addresses")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='Pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='menu_outbox_due'),
+        ]
+
+    @property
+    def recipients(self):
+        return [address for address in self.to.split(',') if address]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to} ({self.status})"
@@ -0,0 +1,72 @@
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models import F
+from django.dispatch import Signal
+
+from .models import Checkout, Order
+
+# Order status changes, however they happen: transition() for bulk moves,
+# or a plain Order.save() (see menu/signals.py). New orders change from
+# status None (checkout.place_order() announces its lines), deleted ones to
+# None. Sent inside the transaction that makes them, with ``changes``, a
+# list of OrderChange. Receivers that talk to the outside world should wait
+# for transaction.on_commit().
+orders_transitioned = Signal()
+
+OrderChange = namedtuple(
+    "OrderChange",
+    "order_id checkout_id customer_id product_id qty price tracking_no date_order old_status status",
+)
+
+# Order columns an OrderChange is built from, in field order
+CHANGE_COLUMNS = (
+    "id", "checkout_id", "customer_id", "orderitem_id", "qty", "price", "tracking_no", "date_order", "order_sts",
+)
+# The columns that describe the line rather than its progress
+LINE_COLUMNS = CHANGE_COLUMNS[1:-1]
+
+
+def change_for(order, old_status):
+    return OrderChange(
+        order.id, order.checkout_id, order.customer_id, order.orderitem_id, order.qty, order.price,
+        order.tracking_no, order.date_order, old_status, order.order_sts,
+    )
+
+
+def removal_for(order, values=None):
+    """The OrderChange taking ``order`` off the books: as it is, or as the column ``values`` it was loaded with."""
+    values = values or {column: getattr(order, column) for column in CHANGE_COLUMNS}
+    return OrderChange(*(values.get(column) for column in CHANGE_COLUMNS), None)
+
+
+def sources(status):
+    """The statuses an order may move to ``status`` from."""
+    return [old for old, targets in Order.TRANSITIONS.items() if status in targets]
+
+
+def transition(orders, status):
+    """
+    Move every order of the queryset ``orders`` that may go to ``status`` there.
+
+    The orders move in one UPDATE, which also bumps their versions, so an
+    edit form still open on one of them can no longer be saved over it.
+    Orders whose status does not allow the move are left alone. The rows
+    are locked as they are read, so another writer cannot move them in
+    between and the changes announced are the ones made. Returns the
+    OrderChange of every order moved.
+    """
+    allowed = sources(status)
+    with transaction.atomic():
+        rows = list(
+            orders.filter(order_sts__in=allowed).select_for_update(of=("self",)).values_list(*CHANGE_COLUMNS)
+        )
+        if not rows:
+            return []
+        Order.objects.filter(id__in=[row[0] for row in rows], order_sts__in=allowed).update(
+            order_sts=status, version=F("version") + 1,
+        )
+        Checkout.refresh_statuses({row[1] for row in rows if row[1]})
+        changes = [OrderChange(*row, status) for row in rows]
+        orders_transitioned.send(sender=Order, changes=changes)
+    return changes
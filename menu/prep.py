@@ -0,0 +1,75 @@
+from collections import defaultdict
+from itertools import groupby
+
+from django.db import transaction
+from django.db.models import Sum
+
+from . import tallies
+from .models import Order, PrepLine
+
+# The kitchen prep board: per product, the quantities pending and out for
+# delivery, by tracking number. PrepLine holds the running totals; every
+# OrderChange (menu/orders.py) adjusts them by its quantity, so reading the
+# board costs one query over the live rows however many orders there are.
+
+# Statuses on the board -> their PrepLine column
+COLUMNS = {"Pending": "pending", "Out for Delivery": "out_for_delivery"}
+SLOTS = {status: slot for slot, status in enumerate(COLUMNS)}
+
+
+def deltas(changes):
+    """{(product_id, tracking_no): [pending delta, out for delivery delta]} for some OrderChanges."""
+    totals = defaultdict(lambda: [0, 0])
+    for change in changes:
+        key = (change.product_id, change.tracking_no or "")
+        for status, sign in ((change.old_status, -1), (change.status, 1)):
+            if status in SLOTS:
+                totals[key][SLOTS[status]] += sign * change.qty
+    return {key: delta for key, delta in totals.items() if any(delta)}
+
+
+def apply(changes):
+    """Move the board by ``changes``; call inside the transaction that made them."""
+    rows = deltas(changes)
+    if not rows:
+        return
+    tallies.add(PrepLine, ("product", "tracking_no"), ("pending", "out_for_delivery"), rows)
+    if any(pending < 0 or out < 0 for pending, out in rows.values()):
+        PrepLine.objects.filter(
+            tracking_no__in={t for _, t in rows}, pending__lte=0, out_for_delivery__lte=0,
+        ).delete()
+
+
+def board():
+    """[(product, pending, out for delivery, [PrepLine, ...])], by product name."""
+    lines = PrepLine.objects.select_related("product").order_by("product__name", "product_id", "tracking_no")
+    products = []
+    for _, group in groupby(lines, key=lambda line: line.product_id):
+        group = list(group)
+        products.append((
+            group[0].product,
+            sum(line.pending for line in group),
+            sum(line.out_for_delivery for line in group),
+            group,
+        ))
+    return products
+
+
+def rebuild():
+    """Recompute the board from the Order table; returns the number of rows written."""
+    totals = (
+        Order.objects.filter(order_sts__in=COLUMNS)
+        .values_list("orderitem_id", "tracking_no", "order_sts")
+        .annotate(qty=Sum("qty"))
+        .order_by()
+    )
+    with transaction.atomic():
+        lines = {}
+        for product_id, tracking_no, status, qty in totals:
+            line = lines.setdefault(
+                (product_id, tracking_no or ""), PrepLine(product_id=product_id, tracking_no=tracking_no or ""),
+            )
+            setattr(line, COLUMNS[status], qty)
+        PrepLine.objects.all().delete()
+        PrepLine.objects.bulk_create(lines.values(), batch_size=500)
+    return len(lines)
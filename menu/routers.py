@@ -0,0 +1,97 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Catalog pages and admin changelists may read from a replica; everything
+# else, and every write, uses the primary ("default"). Views opt in with
+# @read_from_replica, which picks one of settings.DATABASE_REPLICAS for the
+# whole request, so its queries see one consistent snapshot. A write inside
+# such a request pins the rest of it to the primary, so the request reads
+# its own writes.
+
+# Apps and models that are always read from the primary: a login, a new
+# account or an add-to-cart must show up on the very next page
+PRIMARY_ONLY = {"admin", "auth", "contenttypes", "sessions", "menu.cart"}
+
+_reads = ContextVar("replica_reads", default=None)
+
+
+class ReplicaReads:
+    def __init__(self, alias):
+        self.alias = alias
+        self.pinned = False
+
+
+@contextmanager
+def replica_reads():
+    """Let reads in the block go to a replica, if any are configured."""
+    aliases = settings.DATABASE_REPLICAS
+    token = _reads.set(ReplicaReads(random.choice(aliases)) if aliases else None)
+    try:
+        yield
+    finally:
+        _reads.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """Send reads in the block to the primary, even inside replica_reads()."""
+    token = _reads.set(None)
+    try:
+        yield
+    finally:
+        _reads.reset(token)
+
+
+def read_from_replica(view):
+    """View decorator running the view, and the rendering of its response, under replica_reads()."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            with replica_reads():
+                return await view(request, *args, **kwargs)
+        return inner
+
+    @wraps(view)
+    def inner(request, *args, **kwargs):
+        with replica_reads():
+            response = view(request, *args, **kwargs)
+            # A TemplateResponse runs its queries when rendered, which would
+            # otherwise happen after the block has ended
+            if hasattr(response, "render") and not response.is_rendered:
+                response.render()
+        return response
+    return inner
+
+
+def _primary_only(model):
+    return model._meta.app_label in PRIMARY_ONLY or model._meta.label_lower in PRIMARY_ONLY
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        reads = _reads.get()
+        if reads is None:
+            return None
+        if reads.pinned or _primary_only(model) or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return reads.alias
+
+    def db_for_write(self, model, **hints):
+        reads = _reads.get()
+        if reads is not None:
+            reads.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        return db not in settings.DATABASE_REPLICAS
@@ -0,0 +1,152 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce, TruncDate, TruncHour
+from django.utils import timezone
+
+from . import tallies
+from .models import DailySales, HourlySales, Order, Product
+
+# Sales rollups: revenue, units and order count per product per hour and
+# per day, in HourlySales and DailySales. An order counts from the moment it
+# is placed, in the hour and day it was placed, until it is cancelled or
+# deleted; every OrderChange (menu/orders.py) adds or takes away its share.
+# Each row keeps the category its product was in when the row was written,
+# and reports group by that. Reports read only these tables.
+
+# Statuses that do not count as a sale; None is "not there"
+UNCOUNTED = {None, "Cancelled"}
+
+# name -> (rollup model, truncation of Order.date_order to its period)
+PERIODS = {
+    "hour": (HourlySales, TruncHour),
+    "day": (DailySales, TruncDate),
+}
+COUNTERS = ("revenue", "units", "orders")
+
+
+def periods(moment):
+    """The hour and the day ``moment`` falls in, in the current time zone."""
+    local = timezone.localtime(moment)
+    return {"hour": local.replace(minute=0, second=0, microsecond=0), "day": local.date()}
+
+
+def deltas(changes):
+    """{period: {(start, product_id): [revenue, units, orders]}} for some OrderChanges."""
+    totals = {name: defaultdict(lambda: [Decimal(0), 0, 0]) for name in PERIODS}
+    for change in changes:
+        sign = (change.status not in UNCOUNTED) - (change.old_status not in UNCOUNTED)
+        if not sign:
+            continue
+        for name, start in periods(change.date_order).items():
+            row = totals[name][(start, change.product_id)]
+            row[0] += sign * (change.price or 0)
+            row[1] += sign * change.qty
+            row[2] += sign
+    return {name: {key: delta for key, delta in rows.items() if any(delta)} for name, rows in totals.items()}
+
+
+def apply(changes):
+    """Move the rollups by ``changes``; call inside the transaction that made them."""
+    moves = deltas(changes)
+    # Rows only come into being on a sale, so only sales need the category
+    sold = {
+        product_id
+        for rows in moves.values() for (_, product_id), delta in rows.items()
+        if any(value > 0 for value in delta)
+    }
+    categories = dict(Product.objects.filter(id__in=sold).values_list("id", "category_id")) if sold else {}
+    for name, rows in moves.items():
+        if not rows:
+            continue
+        model = PERIODS[name][0]
+        tallies.add(model, ("start", "product"), COUNTERS, rows, inserted={
+            "category": {key: categories.get(key[1]) for key in rows},
+        })
+        if any(orders < 0 for _, _, orders in rows.values()):
+            model.objects.filter(start__in={start for start, _ in rows}, orders__lte=0).delete()
+
+
+def rebuild(since=None):
+    """
+    Recompute the rollups from the Order table, for every period or only
+    those from the date ``since`` on; returns {period: rows written}. Rows
+    that existed keep their category; new ones take the product's current
+    one, as orders do not record it.
+    """
+    orders = Order.objects.exclude(order_sts="Cancelled")
+    if since is not None:
+        orders = orders.filter(date_order__gte=day_start(since))
+    written = {}
+    with transaction.atomic():
+        for name, (model, trunc) in PERIODS.items():
+            rows = (
+                orders.annotate(period=trunc("date_order"))
+                .values_list("period", "orderitem_id", "orderitem__category_id")
+                .annotate(revenue=Coalesce(Sum("price"), Decimal(0)), units=Sum("qty"), orders=Count("id"))
+                .order_by()
+            )
+            stale = model.objects.all()
+            if since is not None:
+                stale = stale.filter(start__gte=day_start(since) if name == "hour" else since)
+            kept = {(start, product_id): category_id for start, product_id, category_id in
+                    stale.values_list("start", "product_id", "category_id")}
+            stale.delete()
+            created = model.objects.bulk_create([
+                model(
+                    start=start, product_id=product_id, category_id=kept.get((start, product_id), category_id),
+                    revenue=revenue, units=units, orders=count,
+                )
+                for start, product_id, category_id, revenue, units, count in rows
+            ], batch_size=500)
+            written[name] = len(created)
+    return written
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def report(first, last, period="day", top=10):
+    """
+    Sales from the date ``first`` through ``last``, by ``period`` ("hour" or
+    "day"): totals, a series with every period in the range (empty ones as
+    zeros), the ``top`` products and every category, by revenue.
+    """
+    model = PERIODS[period][0]
+    if period == "hour":
+        rows = model.objects.filter(start__gte=day_start(first), start__lt=day_start(last + timedelta(days=1)))
+    else:
+        rows = model.objects.filter(start__range=(first, last))
+    sums = {counter: Coalesce(Sum(counter), Decimal(0) if counter == "revenue" else 0) for counter in COUNTERS}
+
+    found = {row["start"]: row for row in rows.values("start").annotate(**sums).order_by()}
+    series = []
+    for start in span(first, last, period):
+        row = found.get(start)
+        series.append({"start": start, **{counter: row[counter] if row else 0 for counter in COUNTERS}})
+
+    return {
+        "totals": rows.aggregate(**sums),
+        "series": series,
+        "products": list(
+            rows.values("product_id", "product__name").annotate(**sums).order_by("-revenue", "product__name")[:top]
+        ),
+        "categories": list(
+            rows.values("category__name").annotate(**sums).order_by("-revenue", "category__name")
+        ),
+    }
+
+
+def span(first, last, period):
+    """Every hour or day from the start of ``first`` to the end of ``last``."""
+    if period == "hour":
+        start, end, step = day_start(first), day_start(last + timedelta(days=1)), timedelta(hours=1)
+    else:
+        start, end, step = first, last + timedelta(days=1), timedelta(days=1)
+    while start < end:
+        yield start
+        start += step
@@ -0,0 +1,112 @@
+import re
+
+from django.db import connection, connections, router
+from django.db.models import Q
+
+from . import keyset
+from .models import Category, Product
+
+# FTS5 index over product name, description and category name. The rowid of
+# each entry is the Product id, so hits map straight back to Product rows.
+FTS_TABLE = "menu_product_fts"
+
+# bm25() column weights: a hit in the name outranks one in the category,
+# which outranks one buried in the description.
+RANK_WEIGHTS = (10.0, 1.0, 4.0)
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def fts_enabled():
+    return connection.vendor == "sqlite"
+
+
+def build_match(query):
+    """Turn free text into an FTS5 MATCH expression: every word must match as a prefix."""
+    tokens = TOKEN_RE.findall(query or "")
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def index_products(products):
+    if not fts_enabled():
+        return
+    rows = [(p.id, p.name, p.description, p.category.name) for p in products]
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(row[0],) for row in rows])
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, description, category) VALUES (%s, %s, %s, %s)",
+            rows,
+        )
+
+
+def remove_products(product_ids):
+    if not fts_enabled() or not product_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(pk,) for pk in product_ids])
+
+
+def rebuild_index():
+    """Re-create every index entry from the Product and Category tables; returns the row count."""
+    if not fts_enabled():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, description, category) "
+            f"SELECT p.id, p.name, p.description, c.name "
+            f"FROM {Product._meta.db_table} p JOIN {Category._meta.db_table} c ON c.id = p.category_id"
+        )
+        return cursor.rowcount
+
+
+def search_products(query, cursor=None, per_page=12):
+    """
+    Return the keyset Page of ranked results that ``cursor`` points at.
+
+    Uses the FTS5 index on SQLite, paging on (bm25 score, rowid) so results
+    stay in relevance order. Other databases fall back to an icontains scan
+    over the same three fields, paged on (name, id).
+    """
+    match = build_match(query)
+    if not match:
+        return keyset.Page([])
+
+    if not fts_enabled():
+        return keyset.paginate(
+            Product.objects.filter(
+                Q(name__icontains=query) | Q(description__icontains=query) | Q(category__name__icontains=query)
+            ),
+            ("name", "id"), cursor, per_page,
+        )
+
+    direction, values = keyset.decode_cursor(cursor)
+    try:
+        score, rowid = float(values[0]), int(values[1])
+    except (TypeError, ValueError, IndexError):
+        direction = None
+
+    sql = (
+        f"SELECT rowid, score FROM ("
+        f"SELECT rowid, bm25({FTS_TABLE}, %s, %s, %s) AS score FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s)"
+    )
+    params = [*RANK_WEIGHTS, match]
+    if direction == keyset.BEFORE:
+        sql += " WHERE score < %s OR (score = %s AND rowid < %s) ORDER BY score DESC, rowid DESC"
+        params += [score, score, rowid]
+    elif direction == keyset.AFTER:
+        sql += " WHERE score > %s OR (score = %s AND rowid > %s) ORDER BY score, rowid"
+        params += [score, score, rowid]
+    else:
+        sql += " ORDER BY score, rowid"
+    # The index is kept in the database the Products are read from, replicas included
+    with connections[router.db_for_read(Product)].cursor() as db:
+        db.execute(sql + " LIMIT %s", [*params, per_page + 1])
+        hits = db.fetchall()
+
+    page = keyset.build_page(hits, per_page, direction, lambda hit: [hit[1], hit[0]])
+    found = Product.objects.in_bulk([pk for pk, _ in page.items])
+    page.items = [found[pk] for pk, _ in page.items if pk in found]
+    return page
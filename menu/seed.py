@@ -0,0 +1,167 @@
+import os
+import random
+import tempfile
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.apps import apps as global_apps
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import prep, sales
+from .models import compute_discount
+
+# Vocabulary for generated catalog rows, so text search has something realistic to chew on
+DISHES = [
+    "masala", "dosa", "idli", "vada", "biryani", "paneer", "tikka", "samosa", "chai", "coffee",
+    "pulao", "paratha", "thali", "noodles", "manchurian", "sandwich", "burger", "pizza", "lassi",
+    "juice", "kulfi", "halwa", "puffs", "cutlet", "roll", "shawarma", "momos", "upma", "poori",
+]
+WORDS = [
+    "crispy", "spicy", "sweet", "fresh", "steamed", "fried", "grilled", "butter", "cheese",
+    "chicken", "veg", "egg", "mint", "onion", "tomato", "ghee", "coconut", "chutney", "sambar",
+    "garlic", "ginger", "lemon", "mango", "chocolate", "vanilla", "special", "house", "classic",
+]
+SECTIONS = ["Breakfast", "Meals", "Snacks", "Beverages", "Desserts", "Chinese", "Bakery", "Juices"]
+STATUSES = ["Pending", "Out for Delivery", "Delivered", "Delivered", "Delivered", "Cancelled"]
+
+# Seed helpers take an optional app registry so they also work with the
+# historical models of a migration state, like a data migration would.
+
+
+def seed_catalog(categories=8, products=500, seed=0, apps=None):
+    """Bulk-insert generated categories and products; returns the new products."""
+    apps = apps or global_apps
+    Category = apps.get_model('menu', 'Category')
+    Product = apps.get_model('menu', 'Product')
+
+    rng = random.Random(seed)
+    cats = Category.objects.bulk_create([
+        Category(
+            name=f"{SECTIONS[i % len(SECTIONS)]} {i // len(SECTIONS) or ''}".strip(),
+            description="Generated category",
+            image="images/lunch.jpeg",
+            status=True,
+        )
+        for i in range(categories)
+    ])
+    rows = []
+    for i in range(products):
+        price = rng.randint(20, 300)
+        selling = rng.randint(price // 3, price)
+        rows.append(Product(
+            category=rng.choice(cats),
+            name=f"{rng.choice(WORDS).title()} {rng.choice(DISHES).title()} {i}",
+            product_image="images/lunch.jpeg",
+            quantity=rng.randint(0, 200),
+            original_price=price,
+            selling_price=selling,
+            discount_percent=compute_discount(price, selling),
+            description=" ".join(rng.choice(WORDS + DISHES) for _ in range(rng.randint(6, 20))),
+        ))
+    return Product.objects.bulk_create(rows, batch_size=500)
+
+
+def seed_activity(products, users=200, orders_per_user=20, cart_lines=3, review_ratio=0.3, seed=0, apps=None):
+    """
+    Bulk-insert customers with order history, carts and reviews for ``products``.
+
+    Users get an unusable password, so seeding does not pay for hashing.
+    Returns the new users.
+    """
+    apps = apps or global_apps
+    User = apps.get_model('auth', 'User')
+    Cart = apps.get_model('menu', 'Cart')
+    Order = apps.get_model('menu', 'Order')
+    Checkout = apps.get_model('menu', 'Checkout')
+    Review = apps.get_model('menu', 'Review')
+
+    rng = random.Random(seed)
+    start = User.objects.count()
+    customers = User.objects.bulk_create([
+        User(username=f"customer{start + i}", email=f"Customer{start + i}@Example.com", password="!")
+        for i in range(users)
+    ], batch_size=500)
+
+    Cart.objects.bulk_create([
+        Cart(user=user, item=product, qty=rng.randint(1, 3))
+        for user in customers
+        for product in rng.sample(products, min(cart_lines, len(products)))
+    ], batch_size=500)
+
+    now = timezone.now()
+    lines = []
+    for user in customers:
+        for n in range(orders_per_user):
+            product = rng.choice(products)
+            qty = rng.randint(1, 3)
+            lines.append((user, product, qty, rng.choice(STATUSES), now - timedelta(minutes=rng.randint(0, 60 * 24 * 365))))
+    checkouts = Checkout.objects.bulk_create([
+        Checkout(customer=user, tracking_no=f"seed{start}-{i}", total=product.selling_price * qty,
+                 status=status, created_at=placed)
+        for i, (user, product, qty, status, placed) in enumerate(lines)
+    ], batch_size=500)
+    orders = Order.objects.bulk_create([
+        Order(orderitem=product, customer=user, qty=qty, price=product.selling_price * qty,
+              order_sts=status, tracking_no=checkout.tracking_no, checkout=checkout)
+        for checkout, (user, product, qty, status, placed) in zip(checkouts, lines)
+    ], batch_size=500)
+    # date_order is auto_now_add, so spread the history out afterwards
+    for order, (_, _, _, _, placed) in zip(orders, lines):
+        order.date_order = placed
+    Order.objects.bulk_update(orders, ['date_order'], batch_size=500)
+
+    Review.objects.bulk_create([
+        Review(user=order.customer, product=order.orderitem, order=order, rating=rng.randint(1, 5), comment="Seeded review")
+        for order in orders
+        if order.order_sts == "Delivered" and rng.random() < review_ratio
+    ], batch_size=500)
+
+    # bulk_create skips the view code that keeps the stored ratings in step
+    reviews = Review.objects.filter(product=OuterRef("pk")).order_by().values("product")
+    Product = apps.get_model('menu', 'Product')
+    Product.objects.filter(id__in=[p.id for p in products]).update(
+        rating_count=Coalesce(Subquery(reviews.annotate(n=Count("id")).values("n")), 0),
+        rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum("rating")).values("total")), 0),
+    )
+    # Nor are the order counters told about bulk_create; historical states may predate their tables
+    if apps is global_apps:
+        prep.rebuild()
+        sales.rebuild()
+    return customers
+
+
+def migrate_database(target=None):
+    """
+    Migrate the default database to the latest state, or to ``target`` for
+    that app with every other app at its latest; returns the state's apps.
+    """
+    executor = MigrationExecutor(connection)
+    targets = [
+        key for key in executor.loader.graph.leaf_nodes()
+        if target is None or key[0] != target[0]
+    ]
+    if target is not None:
+        targets.append(target)
+    return executor.migrate(targets).apps
+
+
+@contextmanager
+def temporary_database():
+    """Point the default connection at a throwaway SQLite file for the duration of the block."""
+    fd, path = tempfile.mkstemp(prefix="lol_cafe_bench_", suffix=".sqlite3")
+    os.close(fd)
+    original = connection.settings_dict["NAME"]
+    connection.close()
+    connection.settings_dict["NAME"] = path
+    try:
+        yield path
+    finally:
+        connection.close()
+        connection.settings_dict["NAME"] = original
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
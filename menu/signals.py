@@ -0,0 +1,247 @@
+import threading
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import Cart, Category, Order, Product, Review
+from . import cart, catalog_cache, hashers, images, live, orders, prep, sales, search
+
+
+# A deletion sends pre_delete for every row it removes, deletes them, then
+# sends post_delete for each. Deleting an account or a checkout can take
+# many rows, so what their removal changes is gathered at pre_delete and
+# applied together at the first post_delete: one pass over the counters,
+# not one per row.
+
+class DeletionBatch(threading.local):
+    def gather(self, origin, pk, item):
+        if getattr(self, "origin", None) is not origin:
+            self.origin, self.items = origin, {}
+        self.items[pk] = item
+        self.taken = False
+
+    def take(self, origin, pk):
+        """
+        Everything gathered for the deletion of ``pk``, the first time it is
+        asked for, then []. None if another deletion started in between and
+        took over the gathering.
+        """
+        if getattr(self, "origin", None) is not origin or pk not in self.items:
+            return None
+        if self.taken:
+            return []
+        self.taken = True
+        return list(self.items.values())
+
+
+# ------------------------------ SEARCH INDEX ------------------------------
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_products([instance])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    search.remove_products([instance.id])
+
+
+@receiver(post_save, sender=Category)
+def reindex_category(sender, instance, created, raw=False, **kwargs):
+    # New categories have no products yet; renamed ones change every product's entry
+    if not raw and not created:
+        search.index_products(instance.product_set.select_related("category"))
+
+
+# ------------------------------ CATALOG CACHE ------------------------------
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product(sender, instance, **kwargs):
+    scopes = [catalog_cache.category(instance.category_id), catalog_cache.product(instance.id)]
+    if kwargs.get("signal") is post_delete or instance.has_changed(*Product.OFFER_FIELDS):
+        scopes.append(catalog_cache.offers())
+    previous = getattr(instance, "_loaded_values", {}).get("category_id")
+    if previous is not None and previous != instance.category_id:
+        scopes.append(catalog_cache.category(previous))
+    catalog_cache.bump(*scopes)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category(sender, instance, **kwargs):
+    # Product pages show the category name, so they go stale with it
+    product_ids = [] if kwargs.get("signal") is post_delete else instance.product_set.values_list("id", flat=True)
+    catalog_cache.bump(
+        catalog_cache.catalog(),
+        catalog_cache.category(instance.id),
+        *[catalog_cache.product(pk) for pk in product_ids],
+    )
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_reviewed_product(sender, instance, **kwargs):
+    catalog_cache.bump(catalog_cache.product(instance.product_id))
+
+
+# ------------------------------ RATINGS ------------------------------
+
+# Product.rating_count and rating_sum follow the Review table however
+# reviews are written: counted in as they are created, moved when their
+# rating or product is edited, taken out as they are deleted.
+
+def move_ratings(deltas):
+    """Apply {product_id: (count delta, sum delta)} to the stored ratings in one UPDATE."""
+    deltas = {pk: delta for pk, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+
+    def plus(field, slot):
+        amount = Case(*[When(id=pk, then=Value(delta[slot])) for pk, delta in deltas.items()],
+                      output_field=IntegerField())
+        # Never below zero, even if the counters had drifted (repair_ratings mends those)
+        return Greatest(F(field) + amount, 0)
+
+    Product.objects.filter(id__in=deltas).update(
+        rating_count=plus("rating_count", 0), rating_sum=plus("rating_sum", 1),
+    )
+
+
+@receiver(post_save, sender=Review)
+def count_rating(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    deltas = {}
+    if created:
+        deltas[instance.product_id] = (1, instance.rating)
+    elif instance.has_changed("product_id", "rating") and getattr(instance, "_loaded_values", None):
+        loaded = instance._loaded_values
+        old_product, old_rating = loaded.get("product_id", instance.product_id), loaded.get("rating", instance.rating)
+        if old_product == instance.product_id:
+            deltas[instance.product_id] = (0, instance.rating - old_rating)
+        else:
+            deltas[old_product] = (-1, -old_rating)
+            deltas[instance.product_id] = (1, instance.rating)
+    move_ratings(deltas)
+
+
+_rating_removals = DeletionBatch()
+
+
+@receiver(pre_delete, sender=Review)
+def gather_rating_removal(sender, instance, origin=None, **kwargs):
+    _rating_removals.gather(origin, instance.pk, (instance.product_id, instance.rating))
+
+
+@receiver(post_delete, sender=Review)
+def remove_ratings(sender, instance, origin=None, **kwargs):
+    ratings = _rating_removals.take(origin, instance.pk)
+    if ratings is None:
+        ratings = [(instance.product_id, instance.rating)]
+    counts, sums = Counter(), Counter()
+    for product_id, rating in ratings:
+        counts[product_id] -= 1
+        sums[product_id] -= rating
+    move_ratings({pk: (counts[pk], sums[pk]) for pk in counts})
+
+
+# ------------------------------ CART SUMMARIES ------------------------------
+
+@receiver(post_save, sender=Product)
+def invalidate_carts_on_price_change(sender, instance, created, raw=False, **kwargs):
+    # Cart totals are priced from the product, so a new price stales every cart holding it
+    if not raw and not created and instance.has_changed("selling_price"):
+        cart.invalidate(*Cart.objects.filter(item=instance).values_list("user_id", flat=True))
+
+
+@receiver(pre_delete, sender=Product)
+def invalidate_carts_on_delete(sender, instance, **kwargs):
+    # Collected before the cascade removes the cart lines
+    cart.invalidate(*Cart.objects.filter(item=instance).values_list("user_id", flat=True))
+
+
+# ------------------------------ IMAGE RENDITIONS ------------------------------
+
+@receiver(pre_save, sender=Product)
+@receiver(pre_save, sender=Category)
+def check_image(sender, instance, raw=False, **kwargs):
+    instance._render_image = not raw and images.prepare_save(instance)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Category)
+def render_image(sender, instance, **kwargs):
+    if getattr(instance, "_render_image", False):
+        instance._render_image = False
+        images.render_on_commit(instance)
+
+
+# ------------------------------ ORDER STATUS ------------------------------
+
+@receiver(post_save, sender=Order)
+def announce_status_change(sender, instance, created, raw=False, **kwargs):
+    # Bulk moves and checkouts announce themselves, from orders.transition() and checkout.place_order()
+    if raw:
+        return
+    if created:
+        changes = [orders.change_for(instance, None)]
+    elif instance.has_changed(*orders.LINE_COLUMNS):
+        # The line itself was edited: off the books as it was, back on as it is
+        changes = [orders.removal_for(instance, instance._loaded_values), orders.change_for(instance, None)]
+    elif instance.has_changed("order_sts"):
+        changes = [orders.change_for(instance, instance._loaded_values.get("order_sts"))]
+    else:
+        return
+    orders.orders_transitioned.send(sender=Order, changes=changes)
+
+
+_order_removals = DeletionBatch()
+
+
+@receiver(pre_delete, sender=Order)
+def gather_removal(sender, instance, origin=None, **kwargs):
+    _order_removals.gather(origin, instance.pk, orders.removal_for(instance))
+
+
+@receiver(post_delete, sender=Order)
+def announce_removals(sender, instance, origin=None, **kwargs):
+    changes = _order_removals.take(origin, instance.pk)
+    if changes is None:
+        changes = [orders.removal_for(instance)]
+    if changes:
+        orders.orders_transitioned.send(sender=Order, changes=changes)
+
+
+@receiver(orders.orders_transitioned)
+def publish_status_changes(sender, changes, **kwargs):
+    # Only once committed: a stream must not show a status that may roll back
+    transaction.on_commit(lambda: live.publish_order_changes(changes))
+
+
+# ------------------------------ KITCHEN PREP BOARD ------------------------------
+
+@receiver(orders.orders_transitioned)
+def update_prep_board(sender, changes, **kwargs):
+    prep.apply(changes)
+
+
+# ------------------------------ SALES ROLLUPS ------------------------------
+
+@receiver(orders.orders_transitioned)
+def update_sales_rollups(sender, changes, **kwargs):
+    sales.apply(changes)
+
+
+# ------------------------------ PASSWORDS ------------------------------
+
+@receiver(pre_save, sender=User)
+def hash_password_for_role(sender, instance, raw=False, **kwargs):
+    if not raw:
+        hashers.hash_for_role(instance)
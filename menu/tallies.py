@@ -0,0 +1,63 @@
+from django.db import connections, router
+
+# Counter tables kept in step with the orders they count (the kitchen prep
+# board, the sales rollups): each change adds to its row's counters in
+# place, so nothing ever recounts the orders.
+
+
+def add(model, keys, counters, deltas, inserted=None):
+    """
+    Add ``deltas``, {key values: counter deltas}, to the ``counters`` of the
+    ``model`` rows identified by the ``keys`` fields, which must make up one
+    of its unique constraints. ``inserted``, {field name: {key values:
+    value}}, fills other columns of the rows this creates; rows that already
+    exist keep theirs.
+
+    Every delta that adds anything goes in one INSERT ... ON CONFLICT DO
+    UPDATE. A row it creates starts from the delta's gains only, so a
+    decrement alongside them (an order moving from one counter to another)
+    never writes a negative count into a row that was missing. Pure
+    decrements only update rows that exist: an order deleted in the cascade
+    of its product must not put back a row for the product being deleted.
+    Rows left at zero are the caller's to remove.
+    """
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    key_fields = [model._meta.get_field(name) for name in keys]
+    counter_fields = [model._meta.get_field(name) for name in counters]
+    inserted = inserted or {}
+    inserted_fields = [model._meta.get_field(name) for name in inserted]
+
+    def prepare(fields, values):
+        return [field.get_db_prep_value(value, connection) for field, value in zip(fields, values)]
+
+    upserts, decrements = [], []
+    for key, delta in deltas.items():
+        if any(value > 0 for value in delta):
+            extra = [values.get(key) for values in inserted.values()]
+            upserts.append(
+                prepare(key_fields, key) + prepare(inserted_fields, extra)
+                + prepare(counter_fields, [max(value, 0) for value in delta]) + prepare(counter_fields, delta)
+            )
+        else:
+            decrements.append(prepare(counter_fields, delta) + prepare(key_fields, key))
+
+    key_columns = [quote(field.column) for field in key_fields]
+    counter_columns = [quote(field.column) for field in counter_fields]
+    with connection.cursor() as cursor:
+        if upserts:
+            columns = key_columns + [quote(field.column) for field in inserted_fields] + counter_columns
+            cursor.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) "
+                f"ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET "
+                + ", ".join(f"{column} = {table}.{column} + %s" for column in counter_columns),
+                upserts,
+            )
+        if decrements:
+            cursor.executemany(
+                f"UPDATE {table} SET "
+                + ", ".join(f"{column} = {column} + %s" for column in counter_columns)
+                + " WHERE " + " AND ".join(f"{column} = %s" for column in key_columns),
+                decrements,
+            )
@@ -0,0 +1,46 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from menu import images
+
+register = template.Library()
+
+SIZE_NAMES = list(images.SIZES)
+
+
+def _srcset(source_digest, size, ext):
+    # The next size up doubles as the high-density candidate
+    candidates = [(images.rendition_url(source_digest, size, ext), "1x")]
+    position = SIZE_NAMES.index(size)
+    if position + 1 < len(SIZE_NAMES):
+        candidates.append((images.rendition_url(source_digest, SIZE_NAMES[position + 1], ext), "2x"))
+    return ", ".join(f"{url} {density}" for url, density in candidates)
+
+
+@register.simple_tag
+def picture(obj, size="card", **attrs):
+    """
+    ``<picture>`` for a Category or Product image at one of images.SIZES.
+
+    Offers WebP with a JPEG fallback, both from the content-hashed
+    renditions; objects not rendered yet get their original file. Extra
+    keyword arguments become attributes of the ``<img>``.
+    """
+    if size not in images.SIZES:
+        raise template.TemplateSyntaxError(f"Unknown image size {size!r}; choose from {', '.join(SIZE_NAMES)}.")
+    image_field, digest_field = images.SOURCES[obj._meta.label_lower]
+    file, source_digest = getattr(obj, image_field), getattr(obj, digest_field)
+    attrs.setdefault("alt", str(obj))
+    attrs.setdefault("loading", "lazy")
+    attrs.setdefault("decoding", "async")
+    rest = format_html_join("", ' {}="{}"', sorted(attrs.items()))
+
+    if not source_digest:
+        return format_html('<img src="{}"{}>', file.url if file else "", rest)
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}"><img src="{}" srcset="{}"{}></picture>',
+        _srcset(source_digest, size, "webp"),
+        images.rendition_url(source_digest, size, "jpg"),
+        _srcset(source_digest, size, "jpg"),
+        rest,
+    )
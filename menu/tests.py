@@ -1,5 +1,58 @@
-from django.test import TestCase
-from django.urls import reverse
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.forms import SetPasswordForm
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore as DatabaseSession
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.locmem import EmailBackend as LocmemBackend
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, close_old_connections, connection, connections, router, transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, resolve, reverse
+from django.utils import timezone
+from PIL import ExifTags, Image
+
+from . import (
+    async_views, avatars, cart as cart_summary, catalog_cache, checkout as checkout_module, hashers, images, live,
+    prep, routers, sales, urls as menu_urls,
+)
+from .admin import CappedCountPaginator, CheckoutAdmin, OrderAdmin
+from .benchmark import ROUTES, compare, percentile
+from .checkout import OutOfStock, place_order
+from .keyset import decode_cursor, encode_cursor
+from .mail import claim_batch, queue_mail, retry_delay, send_batch
+from .models import (
+    Cart, Category, Checkout, DailySales, HourlySales, Order, OutboundEmail, PrepLine, Product, Profile, Review,
+    StaleOrder,
+)
+from .orders import orders_transitioned, transition
+from .search import build_match, rebuild_index, search_products
+from .throttle import TokenBucket
+from .tracking import new_tracking_no, next_id
+from .views import CartView, UserOrdersView
+
 
 class PasswordResetTests(TestCase):
     def test_password_reset_url_resolves(self):
@@ -14,7 +67,6 @@ class PasswordResetTests(TestCase):
         self.assertEqual(resolved_func.view_initkwargs['subject_template_name'], 'menu/password_reset_subject.txt')
 
 
-
     def test_password_reset_done_url_resolves(self):
         url = reverse('password_reset_done')
         response = self.client.get(url)
@@ -26,3 +78,2426 @@ class PasswordResetTests(TestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'menu/password_reset_complete.html')
+
+
+# ------------------------ CHECKOUT ------------------------
+
+def make_product(category=None, **kwargs):
+    if category is None:
+        category = Category.objects.create(name="Snacks", description="Snacks", image="images/lunch.jpeg")
+    fields = {
+        "name": "Samosa",
+        "quantity": 10,
+        "original_price": 20,
+        "selling_price": 15,
+        "description": "Crispy",
+        "product_image": "images/lunch.jpeg",
+    }
+    fields.update(kwargs)
+    return Product.objects.create(category=category, **fields)
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("buyer", "buyer@example.com", "pass12345")
+        self.client.force_login(self.user)
+        self.category = Category.objects.create(name="Snacks", description="Snacks", image="images/lunch.jpeg")
+
+    def test_checkout_reserves_stock_and_clears_cart(self):
+        samosa = make_product(self.category, quantity=5)
+        tea = make_product(self.category, name="Tea", quantity=3, selling_price=10)
+        Cart.objects.create(user=self.user, item=samosa, qty=2)
+        Cart.objects.create(user=self.user, item=tea, qty=3)
+
+        response = self.client.post(reverse("checkout"))
+
+        self.assertRedirects(response, reverse("order_success"))
+        samosa.refresh_from_db()
+        tea.refresh_from_db()
+        self.assertEqual(samosa.quantity, 3)
+        self.assertEqual(tea.quantity, 0)
+        orders = Order.objects.filter(customer=self.user)
+        self.assertEqual(orders.count(), 2)
+        self.assertEqual(len({o.tracking_no for o in orders}), 1)
+        self.assertFalse(Cart.objects.filter(user=self.user).exists())
+
+    def test_checkout_short_item_writes_nothing(self):
+        samosa = make_product(self.category, quantity=5)
+        tea = make_product(self.category, name="Tea", quantity=1)
+        Cart.objects.create(user=self.user, item=samosa, qty=2)
+        Cart.objects.create(user=self.user, item=tea, qty=3)
+
+        response = self.client.post(reverse("checkout"))
+
+        self.assertRedirects(response, reverse("cart"), fetch_redirect_response=False)
+        samosa.refresh_from_db()
+        self.assertEqual(samosa.quantity, 5)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Cart.objects.filter(user=self.user).count(), 2)
+
+    def test_place_order_lists_every_short_product(self):
+        a = make_product(self.category, name="A", quantity=1)
+        b = make_product(self.category, name="B", quantity=1)
+        with self.assertRaises(OutOfStock) as ctx:
+            place_order(self.user, [(a, 2), (b, 2)])
+        self.assertEqual(ctx.exception.products, [a, b])
+
+    def test_short_products_are_reported_as_the_transaction_saw_them(self):
+        a = make_product(self.category, name="A", quantity=1)
+        b = make_product(self.category, name="B", quantity=5)
+        record = checkout_module._record
+
+        def restock_after_rollback(*args, **kwargs):
+            try:
+                return record(*args, **kwargs)
+            finally:
+                Product.objects.update(quantity=100)
+
+        with mock.patch.object(checkout_module, "_record", restock_after_rollback), self.assertRaises(OutOfStock) as ctx:
+            place_order(self.user, [(a, 2), (b, 2)])
+        self.assertEqual(ctx.exception.products, [a])
+        self.assertEqual(ctx.exception.products[0].quantity, 1)
+
+    def test_deleted_products_are_out_of_stock(self):
+        a = make_product(self.category, name="A", quantity=5)
+        gone = make_product(self.category, name="Gone", quantity=5)
+        Product.objects.filter(id=gone.id).delete()
+        with self.assertRaises(OutOfStock) as ctx:
+            place_order(self.user, [(a, 1), (gone, 1)])
+        self.assertEqual([p.name for p in ctx.exception.products], ["Gone"])
+        a.refresh_from_db()
+        self.assertEqual(a.quantity, 5)
+
+    def test_buy_now_rejects_oversell(self):
+        samosa = make_product(self.category, quantity=1)
+        response = self.client.post(reverse("buy", args=[samosa.id]), {"qty": 2})
+        self.assertRedirects(response, reverse("home"), fetch_redirect_response=False)
+        samosa.refresh_from_db()
+        self.assertEqual(samosa.quantity, 1)
+        self.assertFalse(Order.objects.exists())
+
+    def test_checkout_query_count_is_flat(self):
+        counts = []
+        for n in (1, 5):
+            Cart.objects.filter(user=self.user).delete()
+            for i in range(n):
+                Cart.objects.create(user=self.user, item=make_product(self.category, name=f"P{n}-{i}"), qty=1)
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.post(reverse("checkout"))
+            updates = [q for q in ctx.captured_queries if q["sql"].startswith("UPDATE")]
+            self.assertEqual(len(updates), 1)
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class CheckoutConcurrencyTests(TransactionTestCase):
+    threads = 8
+
+    def test_concurrent_checkouts_never_oversell(self):
+        product = make_product(quantity=5)
+        users = [User.objects.create_user(f"rush{i}", f"rush{i}@example.com", "pass12345") for i in range(self.threads)]
+        barrier = threading.Barrier(self.threads)
+        results = []
+
+        def checkout(user):
+            try:
+                barrier.wait()
+                place_order(user, [(product, 1)])
+                results.append("ok")
+            except OutOfStock:
+                results.append("short")
+            finally:
+                close_old_connections()
+                connection.close()
+
+        workers = [threading.Thread(target=checkout, args=(u,)) for u in users]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+
+        product.refresh_from_db()
+        self.assertEqual(results.count("ok"), 5)
+        self.assertEqual(results.count("short"), self.threads - 5)
+        self.assertEqual(product.quantity, 0)
+        self.assertEqual(Order.objects.filter(orderitem=product).count(), 5)
+
+
+# ------------------------ QUERY BUDGETS ------------------------
+
+class QueryBudgetMixin:
+    """Count the queries a single request costs, leaving the database untouched."""
+
+    def count_queries(self, method, url, data=None):
+        # Budgets are for a cold cache; warm hits are only ever cheaper
+        cache.clear()
+        # String data is a JSON body
+        kwargs = {"content_type": "application/json"} if isinstance(data, str) else {}
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as ctx:
+                getattr(self.client, method)(url, data or {}, **kwargs)
+            transaction.set_rollback(True)
+        return len(ctx.captured_queries)
+
+    def assertQueryBudget(self, budget, method, url, data=None):
+        used = self.count_queries(method, url, data)
+        self.assertLessEqual(used, budget, f"{method.upper()} {url} used {used} queries (budget {budget})")
+        return used
+
+
+class URLQueryBudgetTests(QueryBudgetMixin, TestCase):
+    # name -> (method, budget); every named route in menu/urls.py must be listed.
+    # Pages that render the navbar read the session and, on a cold cache,
+    # build the cart summary with one aggregate query.
+    budgets = {
+        "login": ("get", 0),
+        "register": ("get", 0),
+        "logout": ("get", 4),
+        "profile": ("get", 5),
+        "password_reset": ("get", 0),
+        "password_reset_done": ("get", 0),
+        "password_reset_confirm": ("get", 2),
+        "password_reset_complete": ("get", 0),
+        "home": ("get", 4),
+        "category_detail": ("get", 4),
+        "product_detail": ("get", 4),
+        "product_reviews": ("get", 4),
+        "cart": ("get", 4),
+        "cart_api": ("post", 8),
+        "add_to_cart": ("get", 5),
+        "delete_cart": ("get", 3),
+        "checkout": ("post", 17),
+        "increase_qty": ("post", 4),
+        "decrease_qty": ("post", 4),
+        "buy": ("get", 4),
+        "my_orders": ("get", 4),
+        "order_events": ("get", 0),
+        "order_success": ("get", 3),
+        "add_review": ("post", 8),
+        "search": ("get", 4),
+        "terms": ("get", 2),
+        "privacy": ("get", 2),
+        "refund": ("get", 2),
+        "about_us": ("get", 2),
+        "contact_us": ("get", 2),
+        "delete_account": ("post", 23),
+    }
+
+    def setUp(self):
+        self.user = User.objects.create_user("budget", "budget@example.com", "pass12345")
+        self.client.force_login(self.user)
+        self.category = Category.objects.create(name="Meals", description="Meals", image="images/lunch.jpeg")
+        self.product = make_product(self.category, name="Thali", quantity=1000)
+        self.cart = Cart.objects.create(user=self.user, item=self.product, qty=1)
+        self.order = Order.objects.create(orderitem=self.product, customer=self.user, price=15, order_sts="Delivered")
+
+    def grow(self, n):
+        for i in range(n):
+            product = make_product(self.category, name=f"Dish {self.category.product_set.count()}", quantity=1000)
+            Cart.objects.create(user=self.user, item=product, qty=2)
+            order = Order.objects.create(orderitem=product, customer=self.user, price=30, order_sts="Delivered")
+            other = User.objects.create(username=f"fan{Review.objects.count()}")
+            Review.objects.create(user=other, product=self.product, order=order, comment="Tasty")
+
+    def request_for(self, name):
+        args = {
+            "category_detail": [self.category.id],
+            "product_detail": [self.product.id],
+            "product_reviews": [self.product.id],
+            "add_to_cart": [self.product.id],
+            "delete_cart": [self.cart.id],
+            "increase_qty": [self.cart.id],
+            "decrease_qty": [self.cart.id],
+            "buy": [self.product.id],
+            "add_review": [self.order.id],
+            "password_reset_confirm": ["MQ", "set-password"],
+        }.get(name, [])
+        data = {
+            "search": {"q": "Dish"},
+            "add_review": {"rating": 4, "comment": "Nice"},
+            "cart_api": json.dumps({"changes": [{"item": self.product.id, "delta": 1}]}),
+        }.get(name)
+        return reverse(name, args=args), data
+
+    def test_every_named_url_has_a_budget(self):
+        names = {p.name for p in menu_urls.urlpatterns if isinstance(p, URLPattern) and p.name}
+        self.assertEqual(names, set(self.budgets))
+
+    def test_query_counts_stay_within_budget_as_data_grows(self):
+        self.grow(2)
+        small = {}
+        for name, (method, budget) in self.budgets.items():
+            url, data = self.request_for(name)
+            self.client.force_login(self.user)
+            with self.subTest(url=name):
+                small[name] = self.assertQueryBudget(budget, method, url, data)
+
+        self.grow(10)
+        for name, (method, budget) in self.budgets.items():
+            url, data = self.request_for(name)
+            self.client.force_login(self.user)
+            with self.subTest(url=name):
+                self.assertEqual(self.count_queries(method, url, data), small[name])
+
+
+# ------------------------ RATINGS ------------------------
+
+class ProductRatingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("critic", "critic@example.com", "pass12345")
+        self.client.force_login(self.user)
+        self.product = make_product()
+
+    def deliver(self):
+        return Order.objects.create(orderitem=self.product, customer=self.user, price=15, order_sts="Delivered")
+
+    def test_add_review_updates_aggregates(self):
+        for rating in (5, 2):
+            self.client.post(reverse("add_review", args=[self.deliver().id]), {"rating": rating, "comment": "ok"})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_count, 2)
+        self.assertEqual(self.product.rating_sum, 7)
+        self.assertEqual(self.product.average_rating, 3.5)
+
+    def test_out_of_range_rating_is_rejected(self):
+        self.client.post(reverse("add_review", args=[self.deliver().id]), {"rating": 50, "comment": "ok"})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_count, 0)
+
+    def test_deleting_account_removes_its_ratings(self):
+        self.client.post(reverse("add_review", args=[self.deliver().id]), {"rating": 4, "comment": "ok"})
+        self.client.post(reverse("delete_account"))
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_count, self.product.rating_sum), (0, 0))
+
+    def test_repair_ratings_recomputes_drift(self):
+        Review.objects.create(user=self.user, product=self.product, rating=3, comment="ok")
+        Review.objects.create(user=self.user, product=self.product, rating=4, comment="ok")
+        # Drift, as a raw write would leave it
+        Product.objects.update(rating_count=0, rating_sum=0)
+        out = StringIO()
+        call_command("repair_ratings", "--dry-run", stdout=out)
+        self.assertIn("1 product(s) would be repaired", out.getvalue())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_count, 0)
+
+        call_command("repair_ratings", stdout=StringIO())
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_count, self.product.rating_sum), (2, 7))
+
+    def test_review_feed_is_paginated_newest_first(self):
+        for i in range(12):
+            Review.objects.create(user=self.user, product=self.product, rating=5, comment=f"review {i}")
+        call_command("repair_ratings", stdout=StringIO())
+
+        response = self.client.get(reverse("product_reviews", args=[self.product.id]))
+        self.assertEqual(response.context["num_pages"], 2)
+        self.assertEqual([r.comment for r in response.context["reviews"]][:2], ["review 11", "review 10"])
+
+        response = self.client.get(reverse("product_reviews", args=[self.product.id]), {"page": 2})
+        self.assertEqual([r.comment for r in response.context["reviews"]], ["review 1", "review 0"])
+        self.assertIsNone(response.context["next_page"])
+
+    def test_review_pages_split_same_date_reviews_cleanly(self):
+        for i in range(12):
+            Review.objects.create(user=self.user, product=self.product, rating=5, comment=f"review {i}")
+        Review.objects.update(date=timezone.now())
+        call_command("repair_ratings", stdout=StringIO())
+
+        url = reverse("product_reviews", args=[self.product.id])
+        seen = [r.comment for page in (1, 2) for r in self.client.get(url, {"page": page}).context["reviews"]]
+        self.assertEqual(seen, [f"review {i}" for i in range(11, -1, -1)])
+
+    def test_deleting_reviews_removes_their_ratings(self):
+        other = make_product(self.product.category, name="Vada")
+        for product, rating in ((self.product, 5), (self.product, 2), (other, 4)):
+            self.client.post(reverse("add_review", args=[
+                Order.objects.create(orderitem=product, customer=self.user, price=15, order_sts="Delivered").id
+            ]), {"rating": rating, "comment": "ok"})
+        Review.objects.filter(rating=5).get().delete()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_count, self.product.rating_sum), (1, 2))
+
+        # Many at once are taken out in one UPDATE
+        with CaptureQueriesContext(connection) as ctx:
+            Review.objects.all().delete()
+        updates = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith('UPDATE "menu_product"')]
+        self.assertEqual(len(updates), 1)
+        for product in (self.product, other):
+            product.refresh_from_db()
+            self.assertEqual((product.rating_count, product.rating_sum), (0, 0))
+
+    def ratings(self, product=None):
+        product = product or self.product
+        product.refresh_from_db()
+        return product.rating_count, product.rating_sum
+
+    def test_reviews_written_outside_the_view_are_counted(self):
+        review = Review.objects.create(user=self.user, product=self.product, rating=3, comment="ok")
+        self.assertEqual(self.ratings(), (1, 3))
+
+        review = Review.objects.get(id=review.id)
+        review.rating = 5
+        review.save()
+        self.assertEqual(self.ratings(), (1, 5))
+        review.comment = "still ok"
+        review.save()
+        self.assertEqual(self.ratings(), (1, 5))
+
+        other = make_product(self.product.category, name="Vada")
+        review.product = other
+        review.save()
+        self.assertEqual((self.ratings(), self.ratings(other)), ((0, 0), (1, 5)))
+
+        review.delete()
+        self.assertEqual(self.ratings(other), (0, 0))
+
+    def test_reviews_edited_in_the_admin_move_the_rating(self):
+        admin = User.objects.create_superuser("admin", "admin@example.com", "pass12345")
+        self.client.force_login(admin)
+        self.client.post(reverse("admin:menu_review_add"), {
+            "user": self.user.id, "product": self.product.id, "rating": 4, "comment": "ok",
+        })
+        review = Review.objects.get()
+        self.assertEqual(self.ratings(), (1, 4))
+        self.client.post(reverse("admin:menu_review_change", args=[review.id]), {
+            "user": self.user.id, "product": self.product.id, "rating": 2, "comment": "ok",
+        })
+        self.assertEqual(self.ratings(), (1, 2))
+        self.client.post(reverse("admin:menu_review_delete", args=[review.id]), {"post": "yes"})
+        self.assertEqual(self.ratings(), (0, 0))
+
+    def test_deleting_reviews_never_takes_ratings_below_zero(self):
+        Review.objects.create(user=self.user, product=self.product, rating=3, comment="ok")
+        Product.objects.update(rating_count=0, rating_sum=0)
+        Review.objects.all().delete()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_count, self.product.rating_sum), (0, 0))
+
+
+# ------------------------ SEARCH ------------------------
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.drinks = Category.objects.create(name="Beverages", description="Drinks", image="images/lunch.jpeg")
+        self.meals = Category.objects.create(name="Meals", description="Meals", image="images/lunch.jpeg")
+        self.chai = make_product(self.drinks, name="Masala Chai", description="Spiced milk tea")
+        self.dosa = make_product(self.meals, name="Masala Dosa", description="Crispy crepe with potato")
+        self.thali = make_product(self.meals, name="Veg Thali", description="Rice, dal and masala curry")
+
+    def names(self, query, **kwargs):
+        return [p.name for p in search_products(query, **kwargs)]
+
+    def test_build_match_quotes_prefix_tokens(self):
+        self.assertEqual(build_match('chai" OR *'), '"chai"* "OR"*')
+        self.assertEqual(build_match("  "), "")
+
+    def test_matches_name_description_and_category_ranked_by_name(self):
+        names = self.names("masala")
+        self.assertEqual(set(names[:2]), {"Masala Chai", "Masala Dosa"})
+        self.assertEqual(names[2], "Veg Thali")
+        self.assertEqual(self.names("tea"), ["Masala Chai"])
+        self.assertEqual(self.names("beverages"), ["Masala Chai"])
+        self.assertEqual(self.names("dos"), ["Masala Dosa"])
+        self.assertEqual(self.names("masala meals"), ["Masala Dosa", "Veg Thali"])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.chai.name = "Ginger Tea"
+        self.chai.save()
+        self.assertEqual(self.names("ginger"), ["Ginger Tea"])
+        self.assertNotIn("Ginger Tea", self.names("masala"))
+
+        self.drinks.name = "Hot Drinks"
+        self.drinks.save()
+        self.assertEqual(self.names("drinks"), ["Ginger Tea"])
+
+        self.meals.delete()
+        self.assertEqual(self.names("masala"), [])
+
+    def test_pagination(self):
+        for i in range(5):
+            make_product(self.meals, name=f"Paneer {i}")
+        first = search_products("paneer", per_page=3)
+        second = search_products("paneer", cursor=first.next_cursor, per_page=3)
+        self.assertTrue(first.has_next)
+        self.assertFalse(second.has_next)
+        self.assertEqual(len({p.id for p in first.items + second.items}), 5)
+        back = search_products("paneer", cursor=second.previous_cursor, per_page=3)
+        self.assertEqual(back.items, first.items)
+        self.assertFalse(back.has_previous)
+
+    def test_rebuild_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM menu_product_fts")
+        self.assertEqual(self.names("masala"), [])
+        self.assertEqual(rebuild_index(), 3)
+        self.assertEqual(len(self.names("masala")), 3)
+
+    def test_search_view(self):
+        response = self.client.get(reverse("search"), {"q": "crispy"})
+        self.assertEqual([p.name for p in response.context["result"]], ["Masala Dosa"])
+
+    def test_bench_search_command_runs(self):
+        out = StringIO()
+        call_command("bench_search", "--products", "50", "--repeat", "2", "masala", stdout=out)
+        self.assertIn("masala", out.getvalue())
+        self.assertEqual(Product.objects.count(), 3)
+
+
+# ------------------------ CATALOG CACHE ------------------------
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name="Snacks", description="Snacks", image="images/lunch.jpeg")
+        self.product = make_product(self.category)
+
+    def etag(self, url):
+        return self.client.get(url).headers["ETag"]
+
+    def test_pages_are_served_from_cache(self):
+        for url in (reverse("home"), reverse("category_detail", args=[self.category.id]),
+                    reverse("product_detail", args=[self.product.id])):
+            with self.subTest(url=url):
+                self.client.get(url)
+                with self.assertNumQueries(0):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn("no-cache", response.headers["Cache-Control"])
+
+    def test_only_the_first_category_page_is_cached(self):
+        for i in range(30):
+            make_product(self.category, name=f"Dish {i:02d}")
+        url = reverse("category_detail", args=[self.category.id])
+        first = self.client.get(url).context["page"]
+        with self.assertNumQueries(0):
+            self.client.get(url, {"cursor": "not-a-cursor"})
+        self.client.get(url, {"cursor": first.next_cursor})
+        with self.assertNumQueries(2):
+            second = self.client.get(url, {"cursor": first.next_cursor}).context["page"]
+        self.assertEqual(len(second), 7)
+
+    def test_conditional_get_returns_304_without_queries(self):
+        url = reverse("product_detail", args=[self.product.id])
+        response = self.client.get(url)
+        with self.assertNumQueries(0):
+            again = self.client.get(url, HTTP_IF_NONE_MATCH=response.headers["ETag"])
+        self.assertEqual(again.status_code, 304)
+        again = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response.headers["Last-Modified"])
+        self.assertEqual(again.status_code, 304)
+
+    def test_queued_messages_skip_the_304(self):
+        self.product.quantity = 0
+        self.product.save()
+        self.client.force_login(User.objects.create_user("late", "late@example.com", "pass12345"))
+        url = reverse("product_detail", args=[self.product.id])
+        page_etag = self.etag(url)
+        self.client.get(reverse("buy", args=[self.product.id]))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=page_etag)
+        self.assertContains(response, "Only 0 units available")
+
+    def test_product_save_invalidates_product_category_and_home(self):
+        urls = [reverse("home"), reverse("category_detail", args=[self.category.id]),
+                reverse("product_detail", args=[self.product.id])]
+        before = [self.etag(url) for url in urls]
+        self.product.name = "Veg Samosa"
+        self.product.save()
+        after = [self.etag(url) for url in urls]
+        for old, new in zip(before, after):
+            self.assertNotEqual(old, new)
+        self.assertContains(self.client.get(urls[1]), "Veg Samosa")
+
+    def test_moving_product_invalidates_old_category(self):
+        url = reverse("category_detail", args=[self.category.id])
+        self.assertContains(self.client.get(url), "Samosa")
+        product = Product.objects.get(id=self.product.id)
+        product.category = Category.objects.create(name="Meals", description="Meals", image="images/lunch.jpeg")
+        product.save()
+        self.assertNotContains(self.client.get(url), "Samosa")
+
+    def test_category_rename_invalidates_product_pages(self):
+        url = reverse("product_detail", args=[self.product.id])
+        before = self.etag(url)
+        self.category.name = "Chaat"
+        self.category.save()
+        self.assertNotEqual(self.etag(url), before)
+        self.assertContains(self.client.get(url), "Back to Chaat")
+
+    def test_checkout_and_reviews_invalidate_product_page(self):
+        user = User.objects.create_user("cached", "cached@example.com", "pass12345")
+        url = reverse("product_detail", args=[self.product.id])
+        before = self.etag(url)
+        checkout = place_order(user, [(self.product, 3)])
+        stocked = self.etag(url)
+        self.assertNotEqual(stocked, before)
+        self.assertContains(self.client.get(url), "(7 available)")
+
+        Review.objects.create(user=user, product=self.product, order=checkout.lines[0], comment="Great samosa")
+        self.assertNotEqual(self.etag(url), stocked)
+        self.assertContains(self.client.get(url), "Great samosa")
+
+    def test_missing_pages_still_404(self):
+        self.assertEqual(self.client.get(reverse("product_detail", args=[999])).status_code, 404)
+        self.assertEqual(self.client.get(reverse("category_detail", args=[999])).status_code, 404)
+
+    def test_file_based_cache_backend(self):
+        with tempfile.TemporaryDirectory() as location:
+            backend = {"default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": location}}
+            with override_settings(CACHES=backend):
+                url = reverse("category_detail", args=[self.category.id])
+                etag = self.etag(url)
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+                self.product.save()
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+# ------------------------ OFFER ZONE ------------------------
+
+class OfferZoneTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name="Snacks", description="Snacks", image="images/lunch.jpeg")
+
+    def offers(self):
+        return [p.name for p in self.client.get(reverse("home")).context["offer_products"]]
+
+    def test_discount_is_computed_on_save(self):
+        product = make_product(self.category, original_price=200, selling_price=50)
+        self.assertEqual(product.discount_percent, Decimal("75.00"))
+        product.selling_price = 150
+        product.save(update_fields=["selling_price"])
+        product.refresh_from_db()
+        self.assertEqual(product.discount_percent, Decimal("25.00"))
+        self.assertEqual(make_product(self.category, original_price=0, selling_price=10).discount_percent, 0)
+        self.assertEqual(make_product(self.category, original_price=10, selling_price=12).discount_percent, 0)
+
+    def test_offers_are_ordered_and_limited(self):
+        for i in range(10):
+            make_product(self.category, name=f"Deal {i}", original_price=100, selling_price=50 - i)
+        make_product(self.category, name="Small deal", original_price=100, selling_price=60)
+        offers = self.offers()
+        self.assertEqual(len(offers), 8)
+        self.assertEqual(offers[0], "Deal 9")
+        self.assertNotIn("Small deal", offers)
+
+    def test_offer_zone_is_rebuilt_only_on_price_changes(self):
+        product = make_product(self.category, name="Half Vada", original_price=100, selling_price=40)
+        self.assertEqual(self.offers(), ["Half Vada"])
+
+        product.quantity = 3
+        product.save()
+        with self.assertNumQueries(0):
+            self.offers()
+
+        product.selling_price = 90
+        product.save()
+        self.assertEqual(self.offers(), [])
+
+
+# ------------------------ EMAIL OUTBOX ------------------------
+
+class CountingBackend(LocmemBackend):
+    opened = 0
+
+    def open(self):
+        CountingBackend.opened += 1
+        return super().open()
+
+
+class FailingBackend(LocmemBackend):
+    def send_messages(self, messages):
+        raise ConnectionError("SMTP down")
+
+
+class EmailOutboxTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("mailer", "mailer@example.com", "pass12345")
+        self.client.force_login(self.user)
+
+    def test_checkout_queues_confirmation_without_sending(self):
+        product = make_product(quantity=5)
+        Cart.objects.create(user=self.user, item=product, qty=2)
+        self.client.post(reverse("checkout"))
+        self.assertEqual(len(mail.outbox), 0)
+        queued = OutboundEmail.objects.get()
+        self.assertEqual(queued.recipients, ["mailer@example.com"])
+        self.assertIn("Order Placed Successfully", queued.subject)
+
+    def test_failed_checkout_queues_nothing(self):
+        product = make_product(quantity=1)
+        self.client.post(reverse("buy", args=[product.id]), {"qty": 3})
+        self.assertFalse(OutboundEmail.objects.exists())
+
+    def test_password_reset_is_queued(self):
+        self.client.post(reverse("password_reset"), {"email": "mailer@example.com"})
+        self.assertEqual(len(mail.outbox), 0)
+        queued = OutboundEmail.objects.get()
+        self.assertIn("password-reset-confirm", queued.body)
+
+    @override_settings(EMAIL_BACKEND="menu.tests.CountingBackend")
+    def test_worker_drains_in_batches_over_one_connection(self):
+        for i in range(5):
+            queue_mail(f"Hello {i}", "Body", [f"user{i}@example.com"])
+        CountingBackend.opened = 0
+
+        out = StringIO()
+        call_command("send_queued_mail", "--batch-size", "3", stdout=out)
+
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(CountingBackend.opened, 2)
+        self.assertEqual(OutboundEmail.objects.filter(status="Sent").count(), 5)
+        self.assertIn("5 sent", out.getvalue())
+
+    @override_settings(EMAIL_BACKEND="menu.tests.FailingBackend")
+    def test_failures_back_off_then_dead_letter(self):
+        email = queue_mail("Hello", "Body", ["x@example.com"])
+        self.assertEqual(send_batch(max_attempts=2), (0, 1, 0))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ("Pending", 1))
+        self.assertIn("SMTP down", email.last_error)
+        self.assertGreater(email.next_attempt_at, timezone.now() + retry_delay(1) - timedelta(seconds=5))
+
+        # Not due yet, so the next run leaves it alone
+        self.assertEqual(send_batch(max_attempts=2), (0, 0, 0))
+
+        OutboundEmail.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(send_batch(max_attempts=2), (0, 0, 1))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ("Dead", 2))
+
+    def test_claimed_rows_are_not_picked_up_twice(self):
+        queue_mail("Hello", "Body", ["x@example.com"])
+        self.assertEqual(len(claim_batch(10)), 1)
+        self.assertEqual(claim_batch(10), [])
+
+
+# ------------------------ TRACKING / CHECKOUT HEADER ------------------------
+
+class CheckoutHeaderTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("header", "header@example.com", "pass12345")
+        self.client.force_login(self.user)
+        self.category = Category.objects.create(name="Snacks", description="Snacks", image="images/lunch.jpeg")
+
+    def test_ids_are_unique_and_monotonic_across_threads(self):
+        ids = []
+
+        def take():
+            ids.extend(next_id() for _ in range(2000))
+
+        workers = [threading.Thread(target=take) for _ in range(4)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        self.assertEqual(len(set(ids)), 8000)
+        self.assertLess(next_id(), next_id())
+        self.assertTrue(new_tracking_no().startswith("foodspot"))
+
+    def test_checkout_creates_header_with_lines(self):
+        samosa = make_product(self.category, quantity=5, selling_price=15)
+        tea = make_product(self.category, name="Tea", quantity=5, selling_price=10)
+        Cart.objects.create(user=self.user, item=samosa, qty=2)
+        Cart.objects.create(user=self.user, item=tea, qty=1)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(reverse("checkout"))
+        self.assertFalse([q for q in ctx.captured_queries if "tracking_no" in q["sql"] and q["sql"].startswith("SELECT")])
+
+        checkout = Checkout.objects.get()
+        self.assertEqual(checkout.total, 40)
+        self.assertEqual(checkout.status, "Pending")
+        self.assertEqual(checkout.items.count(), 2)
+        self.assertEqual(set(checkout.items.values_list("tracking_no", flat=True)), {checkout.tracking_no})
+
+    def test_header_status_follows_lines(self):
+        checkout = place_order(self.user, [
+            (make_product(self.category, name="A"), 1),
+            (make_product(self.category, name="B"), 1),
+        ])
+        first, second = checkout.lines
+        first.order_sts = "Out for Delivery"
+        first.save()
+        checkout.refresh_from_db()
+        self.assertEqual(checkout.status, "Pending")
+
+        second.order_sts = "Cancelled"
+        second.save()
+        checkout.refresh_from_db()
+        self.assertEqual(checkout.status, "Out for Delivery")
+
+        first.order_sts = "Delivered"
+        first.save()
+        checkout.refresh_from_db()
+        self.assertEqual(checkout.status, "Delivered")
+
+
+    def test_clashing_tracking_no_is_replaced(self):
+        taken = place_order(self.user, [(make_product(self.category, name="A"), 1)]).tracking_no
+        fresh = new_tracking_no()
+        product = make_product(self.category, name="B", quantity=1)
+        with mock.patch("menu.checkout.new_tracking_no", side_effect=[taken, fresh]):
+            checkout = place_order(self.user, [(product, 1)])
+        self.assertEqual(checkout.tracking_no, fresh)
+        self.assertEqual({order.tracking_no for order in checkout.lines}, {fresh})
+        product.refresh_from_db()
+        self.assertEqual(product.quantity, 0)
+
+    def test_other_integrity_errors_are_not_retried(self):
+        product = make_product(self.category, name="A")
+        with mock.patch("menu.checkout._record", side_effect=IntegrityError("NOT NULL constraint failed")) as record:
+            with self.assertRaises(IntegrityError):
+                place_order(self.user, [(product, 1)])
+        self.assertEqual(record.call_count, 1)
+
+# ------------------------ HOT PATH INDEXES ------------------------
+
+class HotPathIndexTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("indexed", "Indexed@Example.com", "pass12345")
+        self.category = Category.objects.create(name="Snacks", description="Snacks", image="images/lunch.jpeg")
+        self.product = make_product(self.category)
+
+    def test_cart_line_is_unique_per_user_and_item(self):
+        Cart.objects.create(user=self.user, item=self.product)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Cart.objects.create(user=self.user, item=self.product)
+        _, created = Cart.objects.get_or_create(user=self.user, item=self.product)
+        self.assertFalse(created)
+
+    def test_one_review_per_order(self):
+        order = place_order(self.user, [(self.product, 1)]).lines[0]
+        Review.objects.create(user=self.user, product=self.product, order=order, rating=5)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Review.objects.create(user=self.user, product=self.product, order=order, rating=4)
+        # Reviews without an order are not constrained
+        Review.objects.create(user=self.user, product=self.product, rating=4)
+        Review.objects.create(user=self.user, product=self.product, rating=3)
+
+    def test_login_email_lookup_ignores_case(self):
+        response = self.client.post(reverse("login"), {"username": "indexed@example.COM", "password": "pass12345"})
+        self.assertRedirects(response, reverse("home"), fetch_redirect_response=False)
+
+
+class ExplainHotQueriesTests(TransactionTestCase):
+    # The command swaps the default connection onto throwaway databases,
+    # which cannot happen inside the per-test transaction of a TestCase
+
+    def test_reports_plans_before_and_after(self):
+        out = StringIO()
+        call_command("explain_hot_queries", users=5, orders_per_user=2, products=10, repeat=1, stdout=out)
+        report = out.getvalue()
+        self.assertIn("menu_order_tracking_no", report)
+        self.assertIn("menu_user_email_lower", report)
+        self.assertIn("menu_user_username_lower", report)
+        self.assertIn("SCAN auth_user", report)
+
+
+# ------------------------ URL BENCHMARK ------------------------
+
+class BenchmarkReportTests(TestCase):
+    def report(self, **stats):
+        row = {"requests": 100, "errors": 0, "throughput": 100.0, "p50": 10.0, "p95": 20.0, "p99": 30.0}
+        row.update(stats)
+        return {"urls": {"home": row}}
+
+    def test_every_named_url_is_driven(self):
+        names = {p.name for p in menu_urls.urlpatterns if isinstance(p, URLPattern) and p.name}
+        self.assertEqual(names, set(ROUTES))
+
+    def test_percentile_is_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
+
+    def test_compare_flags_only_real_regressions(self):
+        baseline = self.report()
+        self.assertEqual(compare(self.report(p95=22.0), baseline), [])
+        # 50% slower but under the absolute noise floor
+        self.assertEqual(compare(self.report(p50=1.5), self.report(p50=1.0)), [])
+        self.assertEqual(len(compare(self.report(p95=40.0), baseline)), 1)
+        self.assertEqual(len(compare(self.report(throughput=50.0), baseline)), 1)
+        self.assertEqual(len(compare(self.report(errors=3), baseline)), 1)
+        self.assertEqual(compare({"urls": {"cart": baseline["urls"]["home"]}}, baseline), [])
+
+
+class BenchURLsCommandTests(TransactionTestCase):
+    # The command swaps the default connection onto a throwaway database
+    volumes = ["--users", "3", "--products", "10", "--categories", "2", "--orders-per-user", "2",
+               "--clients", "2", "--requests", "4"]
+
+    def run_bench(self, *args):
+        path = os.path.join(tempfile.mkdtemp(), "report.json")
+        call_command("bench_urls", *self.volumes, *args, "--output", path)
+        with open(path) as f:
+            return json.load(f)
+
+    def test_in_process_run_covers_every_url(self):
+        report = self.run_bench()
+        self.assertEqual(set(report["urls"]), set(ROUTES))
+        for name, stats in report["urls"].items():
+            with self.subTest(url=name):
+                self.assertEqual(stats["errors"], 0)
+                self.assertEqual(stats["requests"], 4)
+                self.assertLessEqual(stats["p50"], stats["p95"])
+                self.assertLessEqual(stats["p95"], stats["p99"])
+
+    def test_server_run_and_baseline_gate(self):
+        report = self.run_bench("--server", "--url", "home", "--url", "checkout")
+        self.assertEqual(report["mode"], "server")
+        self.assertEqual(set(report["urls"]), {"home", "checkout"})
+        self.assertEqual(report["urls"]["checkout"]["errors"], 0)
+
+        for stats in report["urls"].values():
+            stats["p50"] = stats["p95"] = 0.0
+            stats["throughput"] = 10 ** 9
+        baseline = os.path.join(tempfile.mkdtemp(), "baseline.json")
+        with open(baseline, "w") as f:
+            json.dump(report, f)
+        with self.assertRaisesMessage(CommandError, "Performance regressed"):
+            self.run_bench("--url", "home", "--baseline", baseline, "--min-delta-ms", "0")
+
+
+# ------------------------ KEYSET PAGINATION ------------------------
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("regular", "regular@example.com", "pass12345")
+        self.client.force_login(self.user)
+        self.category = Category.objects.create(name="Meals", description="Meals", image="images/lunch.jpeg")
+        self.product = make_product(self.category, name="Thali")
+
+    def walk(self, url, params=None):
+        """Follow next cursors from the first page; returns the pages' item lists and the SQL run."""
+        pages, cursor = [], None
+        with CaptureQueriesContext(connection) as ctx:
+            while True:
+                response = self.client.get(url, {**(params or {}), **({"cursor": cursor} if cursor else {})})
+                page = response.context["page"]
+                pages.append(list(page))
+                cursor = page.next_cursor
+                if not cursor:
+                    break
+        return pages, [q["sql"] for q in ctx.captured_queries]
+
+    def test_cursor_round_trip(self):
+        when = timezone.now().replace(microsecond=123456)
+        self.assertEqual(decode_cursor(encode_cursor([str(when), 7])), ("after", [str(when), 7]))
+        self.assertEqual(decode_cursor(encode_cursor([1], "before")), ("before", [1]))
+        for junk in ("", "!!!", encode_cursor([1], "sideways"), "eyJhZnRlciI6IDF9"):
+            self.assertEqual(decode_cursor(junk), (None, None))
+
+    def test_order_history_pages_by_date_then_id(self):
+        now = timezone.now()
+        orders = [
+            Order.objects.create(orderitem=self.product, customer=self.user, price=10, order_sts="Delivered")
+            for _ in range(45)
+        ]
+        # Groups of three share a timestamp, so the id tie-break matters
+        for i, order in enumerate(orders):
+            order.date_order = now - timedelta(minutes=i // 3)
+        Order.objects.bulk_update(orders, ["date_order"])
+
+        pages, queries = self.walk(reverse("my_orders"))
+        self.assertEqual([len(p) for p in pages], [20, 20, 5])
+        expected = list(Order.objects.order_by("-date_order", "-id").values_list("id", flat=True))
+        self.assertEqual([o.id for p in pages for o in p], expected)
+        self.assertFalse([sql for sql in queries if "OFFSET" in sql])
+
+    def test_deep_pages_cost_the_same_queries(self):
+        for _ in range(60):
+            Order.objects.create(orderitem=self.product, customer=self.user, price=10)
+        first = self.client.get(reverse("my_orders")).context["page"]
+        with CaptureQueriesContext(connection) as shallow:
+            self.client.get(reverse("my_orders"))
+        with CaptureQueriesContext(connection) as deep:
+            self.client.get(reverse("my_orders"), {"cursor": first.next_cursor})
+        self.assertEqual(len(deep), len(shallow))
+
+    def test_previous_cursor_returns_the_earlier_page(self):
+        for i in range(30):
+            make_product(self.category, name=f"Dish {i:02d}")
+        url = reverse("category_detail", args=[self.category.id])
+        first = self.client.get(url).context["page"]
+        second = self.client.get(url, {"cursor": first.next_cursor}).context["page"]
+        back = self.client.get(url, {"cursor": second.previous_cursor}).context["page"]
+        self.assertEqual([p.id for p in back], [p.id for p in first])
+        self.assertFalse(back.has_previous)
+        self.assertEqual([p.name for p in first][:2], ["Dish 00", "Dish 01"])
+
+    def test_category_listing_walks_every_product_once(self):
+        for i in range(50):
+            make_product(self.category, name=f"Dish {i % 7}")
+        pages, _ = self.walk(reverse("category_detail", args=[self.category.id]))
+        ids = [p.id for page in pages for p in page]
+        self.assertEqual(len(ids), 51)
+        self.assertEqual(ids, list(Product.objects.order_by("name", "id").values_list("id", flat=True)))
+
+    def test_load_more_json(self):
+        for i in range(30):
+            make_product(self.category, name=f"Paneer {i}")
+        url = reverse("category_detail", args=[self.category.id])
+        first = self.client.get(url, {"format": "json"}).json()
+        self.assertEqual(len(first["items"]), 24)
+        self.assertIn("Paneer", first["html"])
+        second = self.client.get(url, {"format": "json", "cursor": first["next_cursor"]}).json()
+        self.assertEqual(len(second["items"]), 7)
+        self.assertIsNone(second["next_cursor"])
+
+        rebuild_index()
+        found = self.client.get(reverse("search"), {"q": "paneer", "format": "json"}).json()
+        self.assertEqual(len(found["items"]), 12)
+
+        Order.objects.create(orderitem=self.product, customer=self.user, price=10, order_sts="Delivered")
+        orders = self.client.get(reverse("my_orders"), {"format": "json"}).json()
+        self.assertEqual(orders["items"][0]["product"], "Thali")
+        self.assertFalse(orders["items"][0]["has_review"])
+        self.assertIn("Give Feedback", orders["html"])
+
+    def test_json_orders_narrow_to_one_card(self):
+        # The live status stream refreshes a delivered card wherever it is in the list
+        old = Order.objects.create(orderitem=self.product, customer=self.user, price=10, order_sts="Delivered")
+        for _ in range(UserOrdersView.paginate_by):
+            Order.objects.create(orderitem=self.product, customer=self.user, price=10)
+        data = self.client.get(reverse("my_orders"), {"format": "json", "id": old.id}).json()
+        self.assertEqual([item["id"] for item in data["items"]], [old.id])
+        self.assertIn(f'data-order="{old.id}"', data["html"])
+        self.assertIsNone(data["next_cursor"])
+        other = Order.objects.create(orderitem=self.product, customer=User.objects.create_user("ravi"), price=10)
+        for order_id in (other.id, "x"):
+            data = self.client.get(reverse("my_orders"), {"format": "json", "id": order_id}).json()
+            self.assertEqual(data["items"], [])
+
+    def test_malformed_cursor_gives_first_page(self):
+        Order.objects.create(orderitem=self.product, customer=self.user, price=10)
+        page = self.client.get(reverse("my_orders"), {"cursor": encode_cursor(["not a date", "x"])}).context["page"]
+        self.assertEqual(len(page), 1)
+
+
+# ------------------------ CART SUMMARY ------------------------
+
+class CartSummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("badge", "badge@example.com", "pass12345")
+        self.client.force_login(self.user)
+        self.category = Category.objects.create(name="Snacks", description="Snacks", image="images/lunch.jpeg")
+        self.samosa = make_product(self.category, quantity=10, selling_price=15)
+        self.tea = make_product(self.category, name="Tea", quantity=10, selling_price=10)
+
+    def badge(self, url=None):
+        return self.client.get(url or reverse("terms")).context["cart_summary"]
+
+    def aggregate_queries(self, ctx):
+        return [q["sql"] for q in ctx.captured_queries if 'FROM "menu_cart"' in q["sql"] and "SUM(" in q["sql"]]
+
+    def test_totals_in_one_query(self):
+        Cart.objects.create(user=self.user, item=self.samosa, qty=2)
+        Cart.objects.create(user=self.user, item=self.tea, qty=3)
+        with self.assertNumQueries(1):
+            totals = cart_summary.totals(self.user.id)
+        self.assertEqual(totals, {"count": 5, "lines": 2, "total": Decimal("60")})
+        self.assertEqual(cart_summary.totals(0), {"count": 0, "lines": 0, "total": Decimal("0")})
+
+    def test_badge_is_cached_between_pages(self):
+        Cart.objects.create(user=self.user, item=self.samosa, qty=2)
+        with CaptureQueriesContext(connection) as cold:
+            self.assertEqual(self.badge()["count"], 2)
+        with CaptureQueriesContext(connection) as warm:
+            response = self.client.get(reverse("home"))
+        self.assertEqual(len(self.aggregate_queries(cold)), 1)
+        self.assertEqual(self.aggregate_queries(warm), [])
+        self.assertContains(response, ">2</span>")
+
+    def test_cart_views_invalidate_the_summary(self):
+        self.assertEqual(self.badge()["count"], 0)
+        self.client.get(reverse("add_to_cart", args=[self.samosa.id]), {"qty": 2})
+        self.assertEqual(self.badge()["count"], 2)
+
+        line = Cart.objects.get(user=self.user, item=self.samosa)
+        self.client.post(reverse("increase_qty", args=[line.id]))
+        self.assertEqual(self.badge()["count"], 3)
+        self.client.post(reverse("decrease_qty", args=[line.id]))
+        self.assertEqual(self.badge()["total"], Decimal("30"))
+
+        self.client.get(reverse("add_to_cart", args=[self.tea.id]))
+        self.client.get(reverse("delete_cart", args=[line.id]))
+        self.assertEqual(self.badge()["lines"], 1)
+
+        self.client.post(reverse("checkout"))
+        self.assertEqual(self.badge()["count"], 0)
+
+    def test_price_change_and_product_delete_invalidate_carts(self):
+        Cart.objects.create(user=self.user, item=self.samosa, qty=2)
+        self.assertEqual(self.badge()["total"], Decimal("30"))
+        self.samosa.selling_price = 20
+        self.samosa.save()
+        self.assertEqual(self.badge()["total"], Decimal("40"))
+        self.samosa.delete()
+        self.assertEqual(self.badge()["count"], 0)
+
+    def test_etag_follows_the_badge(self):
+        url = reverse("product_detail", args=[self.tea.id])
+        etag = self.client.get(url).headers["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.get(reverse("add_to_cart", args=[self.samosa.id]))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, ">1</span>")
+
+        # Another customer's cart does not touch this user's validators
+        other = User.objects.create_user("other", "other@example.com", "pass12345")
+        etag = self.client.get(url).headers["ETag"]
+        Cart.objects.create(user=other, item=self.tea)
+        cart_summary.invalidate(other.id)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_deleting_the_account_invalidates_its_summary(self):
+        self.assertEqual(self.badge()["count"], 0)
+        before = catalog_cache.get_versions(catalog_cache.cart(self.user.id))
+        self.client.post(reverse("delete_account"))
+        self.assertNotEqual(catalog_cache.get_versions(catalog_cache.cart(self.user.id)), before)
+
+    def test_anonymous_pages_have_no_badge(self):
+        self.client.logout()
+        with self.assertNumQueries(0):
+            self.assertFalse(self.badge())
+
+
+# ------------------------ CART API ------------------------
+
+class CartAPITests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("shopper", "shopper@example.com", "pass12345")
+        self.client.force_login(self.user)
+        self.category = Category.objects.create(name="Snacks", description="Snacks", image="images/lunch.jpeg")
+        self.samosa = make_product(self.category, quantity=5, selling_price=15)
+        self.tea = make_product(self.category, name="Tea", quantity=2, selling_price=10)
+
+    def send(self, payload):
+        body = payload if isinstance(payload, str) else json.dumps(payload)
+        return self.client.post(reverse("cart_api"), body, content_type="application/json")
+
+    def qty(self, product):
+        return Cart.objects.filter(user=self.user, item=product).values_list("qty", flat=True).first()
+
+    def test_single_change_returns_line_and_totals(self):
+        data = self.send({"item": self.samosa.id, "delta": 2}).json()
+        self.assertEqual(data["lines"], [{
+            "id": Cart.objects.get().id, "item": self.samosa.id, "name": "Samosa",
+            "qty": 2, "unit_price": "15.00", "line_total": "30.00",
+        }])
+        self.assertEqual(data["totals"], {"count": 2, "lines": 1, "total": "30.00"})
+
+        data = self.send({"item": self.samosa.id, "delta": 1}).json()
+        self.assertEqual(data["lines"][0]["qty"], 3)
+        self.assertEqual(self.client.get(reverse("terms")).context["cart_summary"]["count"], 3)
+
+    def test_batch_is_all_or_nothing(self):
+        self.send({"item": self.samosa.id, "qty": 1})
+        response = self.send({"changes": [
+            {"item": self.samosa.id, "delta": 2},
+            {"item": self.tea.id, "qty": 3},
+        ]})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["items"], [{"item": self.tea.id, "name": "Tea", "available": 2}])
+        self.assertEqual(self.qty(self.samosa), 1)
+        self.assertIsNone(self.qty(self.tea))
+
+        data = self.send({"changes": [
+            {"item": self.samosa.id, "delta": 2},
+            {"item": self.tea.id, "qty": 2},
+        ]}).json()
+        self.assertEqual([line["qty"] for line in data["lines"]], [3, 2])
+        self.assertEqual(data["totals"]["total"], "65.00")
+
+    def test_stock_guard_on_existing_lines(self):
+        self.send({"item": self.samosa.id, "qty": 5})
+        self.assertEqual(self.send({"item": self.samosa.id, "delta": 1}).status_code, 409)
+        self.assertEqual(self.qty(self.samosa), 5)
+        # Taking units away never needs stock
+        self.assertEqual(self.send({"item": self.samosa.id, "delta": -2}).json()["lines"][0]["qty"], 3)
+
+    def test_lowering_qty_below_stock_that_ran_out(self):
+        self.send({"item": self.samosa.id, "qty": 4})
+        Product.objects.filter(id=self.samosa.id).update(quantity=1)
+        self.assertEqual(self.send({"item": self.samosa.id, "qty": 2}).json()["lines"][0]["qty"], 2)
+        self.assertEqual(self.send({"item": self.samosa.id, "qty": 2}).status_code, 200)
+        self.assertEqual(self.send({"item": self.samosa.id, "qty": 3}).status_code, 409)
+        self.assertEqual(self.qty(self.samosa), 2)
+
+    def test_removing_lines(self):
+        self.send({"changes": [{"item": self.samosa.id, "qty": 2}, {"item": self.tea.id, "qty": 1}]})
+        data = self.send({"changes": [{"item": self.samosa.id, "delta": -5}, {"item": self.tea.id, "qty": 0}]}).json()
+        self.assertEqual(data["lines"], [
+            {"item": self.samosa.id, "qty": 0, "removed": True},
+            {"item": self.tea.id, "qty": 0, "removed": True},
+        ])
+        self.assertEqual(data["totals"], {"count": 0, "lines": 0, "total": "0.00"})
+        self.assertFalse(Cart.objects.exists())
+
+    def test_errors(self):
+        self.assertEqual(self.send({"item": 999, "delta": 1}).status_code, 404)
+        for bad in ("not json", [], {"changes": []}, {"item": self.tea.id}, {"item": self.tea.id, "qty": -1},
+                    {"item": "1", "delta": 1}, {"item": self.tea.id, "delta": True},
+                    {"item": self.tea.id, "delta": 1, "qty": 1}, {"changes": [{"item": 1, "delta": 1}] * 51}):
+            with self.subTest(payload=bad):
+                self.assertEqual(self.send(bad).status_code, 400)
+        self.assertFalse(Cart.objects.exists())
+
+        self.client.logout()
+        self.assertEqual(self.send({"item": self.tea.id, "delta": 1}).status_code, 401)
+
+    def test_cart_page_wires_up_the_api(self):
+        self.send({"item": self.samosa.id, "qty": 2})
+        response = self.client.get(reverse("cart"))
+        self.assertContains(response, reverse("cart_api"))
+        self.assertContains(response, f'data-cart-line="{self.samosa.id}"')
+        self.assertContains(response, 'id="cart-total">30.00<')
+
+
+class CartAPIConcurrencyTests(TransactionTestCase):
+    def test_concurrent_increments_are_not_lost_and_respect_stock(self):
+        category = Category.objects.create(name="Snacks", description="Snacks", image="images/lunch.jpeg")
+        product = make_product(category, quantity=6)
+        user = User.objects.create_user("racer", "racer@example.com", "pass12345")
+        Cart.objects.create(user=user, item=product, qty=1)
+        statuses = []
+
+        def bump():
+            client = Client()
+            client.force_login(user)
+            body = json.dumps({"item": product.id, "delta": 1})
+            statuses.append(client.post(reverse("cart_api"), body, content_type="application/json").status_code)
+            close_old_connections()
+
+        threads = [threading.Thread(target=bump) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(Cart.objects.get().qty, 6)
+        self.assertEqual(sorted(statuses), [200] * 5 + [409] * 3)
+
+
+# ------------------------ IMAGE RENDITIONS ------------------------
+
+def image_bytes(size=(1200, 800), fmt="PNG", color=(200, 40, 40)):
+    out = BytesIO()
+    Image.new("RGB", size, color).save(out, fmt)
+    return out.getvalue()
+
+
+class ImageRenditionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings_override = override_settings(MEDIA_ROOT=media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.category = Category.objects.create(name="Snacks", description="Snacks")
+
+    def upload(self, data=None, name="samosa.png"):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = make_product(
+                self.category, product_image=SimpleUploadedFile(name, data or image_bytes(), "image/png"),
+            )
+        product.refresh_from_db()
+        return product
+
+    def test_upload_renders_every_size_and_format(self):
+        data = image_bytes()
+        product = self.upload(data)
+        digest = images.digest(data)
+        self.assertEqual(product.product_image_digest, digest)
+        for size, width in images.SIZES.items():
+            for ext, (fmt, _) in images.FORMATS.items():
+                with self.subTest(size=size, ext=ext):
+                    name = images.rendition_name(digest, size, ext)
+                    self.assertIn(digest, name)
+                    with default_storage.open(name) as f, Image.open(f) as rendition:
+                        self.assertEqual(rendition.format, fmt)
+                        self.assertEqual(rendition.size, (width, round(width * 2 / 3)))
+
+    def test_small_sources_are_not_upscaled(self):
+        product = self.upload(image_bytes((100, 50)))
+        name = images.rendition_name(product.product_image_digest, "detail", "webp")
+        with default_storage.open(name) as f, Image.open(f) as rendition:
+            self.assertEqual(rendition.size, (100, 50))
+
+    def test_same_content_shares_renditions(self):
+        data = image_bytes()
+        first, second = self.upload(data), self.upload(data, name="copy.png")
+        self.assertNotEqual(first.product_image.name, second.product_image.name)
+        self.assertEqual(first.product_image_digest, second.product_image_digest)
+
+    def test_replacing_or_clearing_the_image_drops_the_old_digest(self):
+        product = self.upload()
+        product.product_image = "images/lunch.jpeg"
+        product.save()
+        self.assertEqual(Product.objects.get().product_image_digest, "")
+
+        product = self.upload(image_bytes(color=(0, 0, 255)))
+        product.product_image = None
+        product.save()
+        self.assertEqual(Product.objects.get(id=product.id).product_image_digest, "")
+
+    def test_unreadable_upload_keeps_the_original(self):
+        with self.assertLogs("menu.images", "WARNING"):
+            product = self.upload(b"not an image")
+        self.assertEqual(product.product_image_digest, "")
+        self.assertFalse(default_storage.exists(images.RENDITIONS_DIR))
+
+    def test_oversized_upload_keeps_the_original(self):
+        with mock.patch.object(Image, "MAX_IMAGE_PIXELS", 100), self.assertLogs("menu.images", "WARNING") as logs:
+            product = self.upload()
+        self.assertEqual(product.product_image_digest, "")
+        self.assertFalse(default_storage.exists(images.RENDITIONS_DIR))
+        self.assertIn(f"Product #{product.id}", logs.output[0])
+        html = Template('{% load menu_images %}{% picture p %}').render(Context({"p": product}))
+        self.assertIn(f'src="{product.product_image.url}"', html)
+
+    def test_picture_tag(self):
+        product = self.upload()
+        html = Template('{% load menu_images %}{% picture p "card" class="c" %}').render(Context({"p": product}))
+        card = images.rendition_url(product.product_image_digest, "card", "webp")
+        detail = images.rendition_url(product.product_image_digest, "detail", "webp")
+        self.assertIn(f'<source type="image/webp" srcset="{card} 1x, {detail} 2x">', html)
+        self.assertIn(f'src="{images.rendition_url(product.product_image_digest, "card", "jpg")}"', html)
+        self.assertIn('class="c"', html)
+        self.assertIn('alt="Samosa"', html)
+
+        plain = make_product(self.category, name="Tea")
+        html = Template('{% load menu_images %}{% picture p %}').render(Context({"p": plain}))
+        self.assertInHTML('<img src="/media/images/lunch.jpeg" alt="Tea" decoding="async" loading="lazy">', html)
+
+    def test_pages_link_renditions(self):
+        product = self.upload()
+        jpg = images.rendition_url(product.product_image_digest, "card", "jpg")
+        self.assertContains(self.client.get(reverse("category_detail", args=[self.category.id])), jpg)
+        detail = images.rendition_url(product.product_image_digest, "detail", "jpg")
+        self.assertContains(self.client.get(reverse("product_detail", args=[product.id])), detail)
+
+    def test_render_images_backfills_existing_rows(self):
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, "images"))
+        shutil.copy(os.path.join(settings.BASE_DIR, "images", "lunch.jpeg"), os.path.join(settings.MEDIA_ROOT, "images"))
+        Category.objects.filter(id=self.category.id).update(image="images/lunch.jpeg")
+        product = make_product(self.category)
+        missing = make_product(self.category, name="Tea", product_image="images/gone.png")
+        cached = self.client.get(reverse("category_detail", args=[self.category.id]))
+
+        out, err = StringIO(), StringIO()
+        call_command("render_images", stdout=out, stderr=err)
+        self.assertIn("Rendered 2 image(s), 1 failed.", out.getvalue())
+        self.assertIn(f"Product #{missing.id}", err.getvalue())
+
+        with open(os.path.join(settings.BASE_DIR, "images", "lunch.jpeg"), "rb") as f:
+            digest = images.digest(f.read())
+        self.assertEqual(Category.objects.get().image_digest, digest)
+        self.assertEqual(Product.objects.get(id=product.id).product_image_digest, digest)
+        page = self.client.get(reverse("category_detail", args=[self.category.id]))
+        self.assertNotEqual(page.headers["ETag"], cached.headers["ETag"])
+        self.assertContains(page, images.rendition_url(digest, "card", "webp"))
+
+        call_command("render_images", "--missing", stdout=out, stderr=StringIO())
+        self.assertIn("Rendered 0 image(s), 1 failed.", out.getvalue())
+
+
+# ------------------------ PROFILE PICTURES ------------------------
+
+def photo_bytes(size=(1600, 900), exif=True):
+    image = Image.new("RGB", size, (10, 120, 200))
+    out = BytesIO()
+    info = Image.Exif()
+    if exif:
+        info[ExifTags.Base.Make] = "PhoneCam"
+        info[ExifTags.Base.Orientation] = 6  # stored sideways, shown rotated 90 degrees
+    image.save(out, "JPEG", exif=info)
+    return out.getvalue()
+
+
+@override_settings(PROFILE_PIC_MAX_UPLOAD_SIZE=200 * 1024, PROFILE_PIC_SIZE=64)
+class ProfilePictureTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings_override = override_settings(MEDIA_ROOT=media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user("avatar", "avatar@example.com", "pass12345")
+        self.client = Client(enforce_csrf_checks=True)
+        self.client.force_login(self.user)
+
+    def post_profile(self, data, name="me.jpg", **extra):
+        self.client.get(reverse("profile"))
+        form = {
+            "csrfmiddlewaretoken": self.client.cookies[settings.CSRF_COOKIE_NAME].value,
+            "first_name": "Ava", "last_name": "Tar", "email": "avatar@example.com", "bio": "Hi",
+        }
+        if data is not None:
+            form["profile_pic"] = SimpleUploadedFile(name, data, "image/jpeg")
+        form.update(extra)
+        return self.client.post(reverse("profile"), form)
+
+    def test_sniff(self):
+        self.assertEqual(avatars.sniff(photo_bytes((8, 8))[:12]), "JPEG")
+        self.assertEqual(avatars.sniff(image_bytes((8, 8))[:12]), "PNG")
+        self.assertEqual(avatars.sniff(b"RIFF\x00\x00\x00\x00WEBP"), "WEBP")
+        self.assertIsNone(avatars.sniff(b"<?php echo 1;"))
+
+    def test_accepted_upload_is_stored_and_queued(self):
+        response = self.post_profile(photo_bytes())
+        self.assertRedirects(response, reverse("profile"), fetch_redirect_response=False)
+        profile = Profile.objects.get(user=self.user)
+        self.assertTrue(profile.pic_pending)
+        self.assertTrue(default_storage.exists(profile.profile_pic.name))
+        self.assertEqual(User.objects.get(id=self.user.id).first_name, "Ava")
+
+    def test_rejected_uploads(self):
+        cases = {
+            "too large": (b"\xff\xd8\xff" + b"\x00" * (300 * 1024), "at most 200"),
+            "not an image": (b"MZ\x90\x00 pretending to be a photo", "Upload a JPEG, PNG, GIF or WebP image."),
+        }
+        for label, (data, message) in cases.items():
+            with self.subTest(label):
+                response = self.post_profile(data)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn(message, str(response.context["p_form"].errors["profile_pic"]))
+                profile = Profile.objects.get(user=self.user)
+                self.assertFalse(profile.profile_pic)
+                self.assertFalse(profile.pic_pending)
+                self.assertFalse(default_storage.exists("profile_pics"))
+
+    def test_csrf_is_still_enforced(self):
+        response = self.post_profile(photo_bytes(), csrfmiddlewaretoken="x" * 32)
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Profile.objects.get(user=self.user).profile_pic)
+
+    def test_worker_squares_shrinks_and_strips_exif(self):
+        self.post_profile(photo_bytes())
+        raw = Profile.objects.get(user=self.user).profile_pic.name
+        out = StringIO()
+        call_command("process_profile_pics", stdout=out)
+        self.assertIn("Done: 1 processed, 0 dropped, 0 superseded.", out.getvalue())
+
+        profile = Profile.objects.get(user=self.user)
+        self.assertFalse(profile.pic_pending)
+        self.assertFalse(default_storage.exists(raw))
+        self.assertTrue(profile.profile_pic.name.startswith(f"profile_pics/{self.user.id}-"))
+        with default_storage.open(profile.profile_pic.name) as f, Image.open(f) as avatar:
+            self.assertEqual((avatar.format, avatar.size), ("JPEG", (64, 64)))
+            self.assertEqual(dict(avatar.getexif()), {})
+        self.assertContains(self.client.get(reverse("profile")), profile.profile_pic.url)
+
+    def test_new_upload_replaces_the_old_file(self):
+        self.post_profile(photo_bytes())
+        avatars.process_batch()
+        first = Profile.objects.get(user=self.user).profile_pic.name
+        self.post_profile(photo_bytes(exif=False))
+        # The old picture is deleted once the save commits, which TestCase never does
+        self.assertTrue(Profile.objects.get(user=self.user).pic_pending)
+        self.assertNotEqual(Profile.objects.get(user=self.user).profile_pic.name, first)
+
+    def test_worker_drops_unreadable_and_skips_superseded(self):
+        self.post_profile(photo_bytes())
+        profile = Profile.objects.get(user=self.user)
+        with default_storage.open(profile.profile_pic.name, "wb") as f:
+            f.write(b"\xff\xd8\xff truncated")
+        self.assertEqual(avatars.process(profile), avatars.DROPPED)
+        self.assertFalse(Profile.objects.get(user=self.user).profile_pic)
+
+        self.post_profile(photo_bytes())
+        stale = Profile.objects.get(user=self.user)
+        Profile.objects.filter(id=stale.id).update(profile_pic="profile_pics/newer.jpg")
+        self.assertEqual(avatars.process(stale), avatars.SUPERSEDED)
+        self.assertEqual(Profile.objects.get(id=stale.id).profile_pic.name, "profile_pics/newer.jpg")
+        self.assertEqual(default_storage.listdir("profile_pics")[1], [os.path.basename(stale.profile_pic.name)])
+
+
+# ------------------------ ASYNC VIEWS ------------------------
+
+@override_settings(ROOT_URLCONF="lol_cafe.asgi_urls")
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("async", "async@example.com", "pass12345")
+        self.category = Category.objects.create(name="Snacks", description="Snacks", image="images/lunch.jpeg")
+        self.product = make_product(self.category, original_price=40, selling_price=15)
+        Cart.objects.create(user=self.user, item=self.product, qty=3)
+        self.order = Order.objects.create(orderitem=self.product, customer=self.user, price=15, order_sts="Delivered")
+        rebuild_index()
+
+    def test_asgi_urlconf_routes_read_pages_to_async_views(self):
+        for name, view, args in (
+            ("home", async_views.HomeView, []),
+            ("category_detail", async_views.CategoryDetailView, [self.category.id]),
+            ("product_detail", async_views.ProductDetailView, [self.product.id]),
+            ("my_orders", async_views.UserOrdersView, []),
+            ("search", async_views.SearchView, []),
+        ):
+            with self.subTest(name):
+                self.assertIs(resolve(reverse(name, args=args)).func.view_class, view)
+        self.assertIs(resolve(reverse("cart")).func.view_class, CartView)
+
+    async def test_catalog_pages(self):
+        await self.async_client.aforce_login(self.user)
+        for url, text in (
+            (reverse("home"), "Offer Zone"),
+            (reverse("category_detail", args=[self.category.id]), "Samosa"),
+            (reverse("product_detail", args=[self.product.id]), "Crispy"),
+            (reverse("search") + "?q=samo", "Samosa"),
+            (reverse("my_orders"), f"Order #{self.order.id}"),
+        ):
+            with self.subTest(url=url):
+                response = await self.async_client.get(url)
+                self.assertContains(response, text)
+                # The badge comes from the summary the view loaded before rendering
+                self.assertContains(response, 'id="cart-badge"')
+
+    def test_conditional_get_needs_no_queries(self):
+        url = reverse("product_detail", args=[self.product.id])
+        get = async_to_sync(self.async_client.get)
+        response = get(url)
+        self.assertIn("no-cache", response.headers["Cache-Control"])
+        with self.assertNumQueries(0):
+            again = get(url, headers={"if-none-match": response.headers["ETag"]})
+        self.assertEqual(again.status_code, 304)
+
+    async def test_json_pages_and_misses(self):
+        await self.async_client.aforce_login(self.user)
+        data = (await self.async_client.get(reverse("my_orders"), {"format": "json"})).json()
+        self.assertEqual([item["id"] for item in data["items"]], [self.order.id])
+        data = (await self.async_client.get(reverse("category_detail", args=[self.category.id]), {"format": "json"})).json()
+        self.assertEqual([item["name"] for item in data["items"]], ["Samosa"])
+
+        self.assertEqual((await self.async_client.get(reverse("product_detail", args=[999]))).status_code, 404)
+        self.assertEqual((await self.async_client.get(reverse("category_detail", args=[999]))).status_code, 404)
+
+    async def test_orders_need_login(self):
+        response = await self.async_client.get(reverse("my_orders"))
+        self.assertRedirects(response, reverse("login"), fetch_redirect_response=False)
+
+
+class BenchServersCommandTests(TransactionTestCase):
+    def test_wsgi_and_asgi_runs(self):
+        path = os.path.join(tempfile.mkdtemp(), "report.json")
+        call_command(
+            "bench_servers", "--users", "3", "--products", "10", "--categories", "2", "--orders-per-user", "2",
+            "--clients", "2", "--requests", "4", "--threads", "2",
+            "--slow-clients", "2", "--slow-lines", "2", "--slow-pause", "0.05", "--output", path,
+        )
+        with open(path) as f:
+            report = json.load(f)
+        self.assertEqual(set(report["servers"]), {"wsgi", "asgi"})
+        for server, run in report["servers"].items():
+            self.assertEqual(set(run["urls"]), {"home", "category_detail", "product_detail", "my_orders", "search"})
+            for name, stats in run["urls"].items():
+                with self.subTest(server=server, url=name):
+                    self.assertEqual(stats["errors"], 0)
+                    self.assertEqual(stats["requests"], 4)
+
+
+# ------------------------ SQLITE TUNING ------------------------
+
+class SQLiteTuningTests(TransactionTestCase):
+    def run_together(self, target, count):
+        barrier = threading.Barrier(count)
+        errors = []
+
+        def run(i):
+            try:
+                barrier.wait()
+                target(i)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return errors
+
+    def test_connections_get_the_configured_pragmas(self):
+        pragmas = settings.SQLITE_PRAGMAS
+        expected = {
+            "journal_mode": pragmas["journal_mode"].lower(),
+            "busy_timeout": pragmas["busy_timeout"],
+            "synchronous": ["OFF", "NORMAL", "FULL", "EXTRA"].index(pragmas["synchronous"].upper()),
+            "cache_size": pragmas["cache_size"],
+        }
+        with connection.cursor() as cursor:
+            for pragma, value in expected.items():
+                with self.subTest(pragma):
+                    cursor.execute(f"PRAGMA {pragma}")
+                    self.assertEqual(cursor.fetchone()[0], value)
+        self.assertEqual(connection.transaction_mode, "IMMEDIATE")
+
+    def test_read_then_write_transactions_queue_instead_of_deadlocking(self):
+        product = make_product(quantity=0)
+
+        def restock(i):
+            with transaction.atomic():
+                Product.objects.get(id=product.id)
+                time.sleep(0.05)
+                Product.objects.filter(id=product.id).update(quantity=F("quantity") + 1)
+
+        self.assertEqual(self.run_together(restock, 4), [])
+        product.refresh_from_db()
+        self.assertEqual(product.quantity, 4)
+
+    def test_many_concurrent_checkouts_without_lock_errors(self):
+        shoppers = 16
+        category = Category.objects.create(name="Snacks", description="Snacks", image="images/lunch.jpeg")
+        products = [make_product(category, name=f"Dish {i}", quantity=100) for i in range(4)]
+        users = [User.objects.create_user(f"rush{i}", f"rush{i}@example.com", "pass12345") for i in range(shoppers)]
+        for i, user in enumerate(users):
+            Cart.objects.create(user=user, item=products[i % 4], qty=2)
+        statuses = []
+
+        def checkout(i):
+            client = Client()
+            client.force_login(users[i])
+            statuses.append(client.post(reverse("checkout")).headers.get("Location"))
+
+        self.assertEqual(self.run_together(checkout, shoppers), [])
+        self.assertEqual(statuses, [reverse("order_success")] * shoppers)
+        self.assertEqual(Checkout.objects.count(), shoppers)
+        self.assertEqual(OutboundEmail.objects.count(), shoppers)
+        self.assertFalse(Cart.objects.exists())
+        self.assertEqual(sorted(Product.objects.values_list("quantity", flat=True)), [92] * 4)
+
+
+# ------------------------ READ REPLICAS ------------------------
+
+@override_settings(DATABASE_REPLICAS=["replica1"], DATABASE_REPLICA_LAG=0)
+class ReplicaRouterTests(TestCase):
+    def setUp(self):
+        # TestCase runs every test inside a transaction, which the router
+        # keeps on the primary; pretend there is none
+        patcher = mock.patch.object(connections["default"], "in_atomic_block", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reads_use_the_replica_only_inside_the_block(self):
+        self.assertEqual(router.db_for_read(Product), "default")
+        with routers.replica_reads():
+            self.assertEqual(router.db_for_read(Product), "replica1")
+            self.assertEqual(router.db_for_read(Category), "replica1")
+            # Accounts, sessions and carts always come from the primary
+            for model in (User, Cart, Session):
+                with self.subTest(model.__name__):
+                    self.assertEqual(router.db_for_read(model), "default")
+            with routers.primary_reads():
+                self.assertEqual(router.db_for_read(Product), "default")
+            self.assertEqual(router.db_for_read(Product), "replica1")
+        self.assertEqual(router.db_for_read(Product), "default")
+
+    def test_a_write_pins_the_rest_of_the_block_to_the_primary(self):
+        with routers.replica_reads():
+            self.assertEqual(router.db_for_write(Product), "default")
+            self.assertEqual(router.db_for_read(Product), "default")
+        with routers.replica_reads():
+            self.assertEqual(router.db_for_read(Product), "replica1")
+
+    def test_transactions_read_from_the_primary(self):
+        with routers.replica_reads(), mock.patch.object(connections["default"], "in_atomic_block", True):
+            self.assertEqual(router.db_for_read(Product), "default")
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas_configured(self):
+        with routers.replica_reads():
+            self.assertEqual(router.db_for_read(Product), "default")
+
+    def test_replicas_are_never_migrated(self):
+        self.assertTrue(router.allow_migrate("default", "menu"))
+        self.assertFalse(router.allow_migrate("replica1", "menu"))
+
+    def test_decorator_covers_sync_and_async_views(self):
+        def view(request):
+            return HttpResponse(router.db_for_read(Product))
+
+        async def aview(request):
+            return HttpResponse(router.db_for_read(Product))
+
+        self.assertEqual(routers.read_from_replica(view)(None).content, b"replica1")
+        self.assertEqual(async_to_sync(routers.read_from_replica(aview))(None).content, b"replica1")
+
+    def test_recently_changed_catalog_data_is_built_from_the_primary(self):
+        cache.clear()
+        built = []
+
+        def build():
+            built.append(router.db_for_read(Product))
+            return built[-1]
+
+        with routers.replica_reads():
+            catalog_cache.get_or_build("replica", [catalog_cache.product(1)], build)
+            with override_settings(DATABASE_REPLICA_LAG=60):
+                catalog_cache.bump(catalog_cache.product(1))
+                catalog_cache.get_or_build("replica", [catalog_cache.product(1)], build)
+        self.assertEqual(built, ["replica1", "default"])
+
+
+@override_settings(DATABASE_REPLICAS=["replica1"], DATABASE_REPLICA_LAG=0)
+class ReplicaEndToEndTests(TransactionTestCase):
+    """A second SQLite file as the replica, refreshed with sync_replicas."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Added after the runner has set up the test databases, which would
+        # otherwise try to create this one too
+        path = os.path.join(tempfile.mkdtemp(), "replica.sqlite3")
+        connections.settings["replica1"] = {**connections["default"].settings_dict, "NAME": path}
+        cls.databases = {"default", "replica1"}
+
+    @classmethod
+    def tearDownClass(cls):
+        connections["replica1"].close()
+        del connections["replica1"]
+        del connections.settings["replica1"]
+        cls.databases = {"default"}
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name="Snacks", description="Snacks", image="images/lunch.jpeg")
+        self.product = make_product(self.category)
+        self.sync()
+
+    def sync(self):
+        out = StringIO()
+        call_command("sync_replicas", stdout=out)
+        self.assertIn("Synced 1 replica(s)", out.getvalue())
+
+    def test_catalog_pages_read_the_replica_until_it_is_synced(self):
+        Product.objects.filter(id=self.product.id).update(name="Kachori")
+        url = reverse("product_detail", args=[self.product.id])
+        self.assertContains(self.client.get(url), "Samosa")
+
+        self.sync()
+        catalog_cache.bump(catalog_cache.product(self.product.id))
+        self.assertContains(self.client.get(url), "Kachori")
+
+    def test_admin_changelist_reads_the_replica(self):
+        admin_user = User.objects.create_superuser("boss", "boss@example.com", "pass12345")
+        self.client.force_login(admin_user)
+        Product.objects.filter(id=self.product.id).update(name="Kachori")
+        changelist = self.client.get(reverse("admin:menu_product_changelist"))
+        self.assertContains(changelist, "Samosa")
+        change_form = self.client.get(reverse("admin:menu_product_change", args=[self.product.id]))
+        self.assertContains(change_form, "Kachori")
+
+    def test_a_request_reads_its_own_writes(self):
+        with routers.replica_reads():
+            self.assertEqual(Product.objects.get(id=self.product.id).quantity, 10)
+            Product.objects.filter(id=self.product.id).update(quantity=3)
+            self.assertEqual(Product.objects.get(id=self.product.id).quantity, 3)
+        self.assertEqual(Product.objects.using("replica1").get(id=self.product.id).quantity, 10)
+
+    def test_only_replicas_can_be_synced(self):
+        with self.assertRaises(CommandError):
+            call_command("sync_replicas", "default", stdout=StringIO())
+
+
+# ------------------------ SESSIONS / MESSAGES ------------------------
+
+class SessionModeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("sess", "sess@example.com", "pass12345")
+        self.product = make_product()
+
+    @override_settings(SESSION_ENGINE="django.contrib.sessions.backends.db")
+    def test_flash_messages_do_not_write_the_session(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse("add_to_cart", args=[self.product.id]))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn("messages", response.cookies)
+        writes = [q["sql"] for q in captured if "django_session" in q["sql"] and not q["sql"].startswith("SELECT")]
+        self.assertEqual(writes, [])
+        # The next page still gets the message
+        shown = [str(m) for m in self.client.get(reverse("cart")).context["messages"]]
+        self.assertEqual(shown, ["1 item(s) added to cart!"])
+
+    def test_logged_in_pages_skip_the_session_table(self):
+        for mode in ("cached_db", "cache", "signed_cookies"):
+            with self.subTest(mode), override_settings(SESSION_ENGINE=settings.SESSION_ENGINES[mode]):
+                Cart.objects.update_or_create(user=self.user, item=self.product, defaults={"qty": 1})
+                client = Client()
+                client.force_login(self.user)
+                client.get(reverse("cart"))
+                with CaptureQueriesContext(connection) as captured:
+                    response = client.get(reverse("cart"))
+                self.assertContains(response, "Samosa")
+                self.assertFalse([q for q in captured if "django_session" in q["sql"]])
+
+    def test_purge_deletes_expired_sessions_in_batches(self):
+        past = timezone.now() - timedelta(days=1)
+        for i in range(5):
+            session = DatabaseSession()
+            session.set_expiry(-60)
+            session.save()
+        Session.objects.update(expire_date=past)
+        live = DatabaseSession()
+        live.save()
+
+        out = StringIO()
+        with override_settings(SESSION_ENGINE="django.contrib.sessions.backends.db"):
+            call_command("purge_sessions", "--batch-size", "2", stdout=out)
+        self.assertIn("Deleted 5 expired session(s) in 3 batch(es)", out.getvalue())
+        self.assertEqual(list(Session.objects.values_list("session_key", flat=True)), [live.session_key])
+
+    @override_settings(SESSION_ENGINE="django.contrib.sessions.backends.signed_cookies")
+    def test_purge_without_session_rows(self):
+        out = StringIO()
+        call_command("purge_sessions", stdout=out)
+        self.assertIn("nothing to purge", out.getvalue())
+
+
+class BenchSessionsCommandTests(TransactionTestCase):
+    def test_reports_session_queries_per_mode(self):
+        path = os.path.join(tempfile.mkdtemp(), "sessions.json")
+        call_command(
+            "bench_sessions", "--users", "2", "--products", "10", "--categories", "2", "--orders-per-user", "2",
+            "--requests", "3", "--url", "home", "--url", "cart", "--output", path,
+        )
+        with open(path) as f:
+            modes = json.load(f)["modes"]
+        self.assertEqual(set(modes), set(settings.SESSION_ENGINES))
+        self.assertEqual(modes["db"]["cart"]["session_queries"], 1)
+        for mode in ("cached_db", "cache", "signed_cookies"):
+            with self.subTest(mode):
+                self.assertEqual(modes[mode]["cart"]["session_queries"], 0)
+                self.assertEqual(modes[mode]["cart"]["errors"], 0)
+
+
+# ------------------------ LOGIN BACKEND / THROTTLE ------------------------
+
+@override_settings(LOGIN_THROTTLE={"ip": (100, 300), "account": (3, 900)})
+class LoginBackendTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("meena", "Meena@Example.com", "pass12345")
+
+    def request(self, ip="10.0.0.1"):
+        return RequestFactory().post(reverse("login"), REMOTE_ADDR=ip)
+
+    def attempt(self, login, password="wrong", ip="10.0.0.1"):
+        return self.client.post(reverse("login"), {"username": login, "password": password}, REMOTE_ADDR=ip)
+
+    def test_username_or_email_in_one_query(self):
+        for login in ("meena", "Meena", "meena@example.com", "MEENA@EXAMPLE.COM"):
+            with self.subTest(login), self.assertNumQueries(1):
+                self.assertEqual(authenticate(self.request(), username=login, password="pass12345"), self.user)
+
+    def test_exact_username_wins_over_a_case_variant(self):
+        other = User.objects.create_user("MEENA", "other@example.com", "other12345")
+        self.assertEqual(authenticate(self.request(), username="MEENA", password="other12345"), other)
+        self.assertEqual(authenticate(self.request(), username="meena", password="pass12345"), self.user)
+        # Neither spelling is exact, so the oldest account is tried
+        self.assertEqual(authenticate(self.request(), username="Meena", password="pass12345"), self.user)
+
+    def test_exact_username_wins_over_an_email_match(self):
+        other = User.objects.create_user("meena@example.com", "other@example.com", "other12345")
+        self.assertEqual(authenticate(self.request(), username="meena@example.com", password="other12345"), other)
+        self.assertEqual(authenticate(self.request(), username="MEENA@example.com", password="pass12345"), self.user)
+
+    def test_account_is_throttled_across_username_and_email(self):
+        for login in ("meena", "meena@example.com", "Meena@Example.com"):
+            self.assertEqual(self.attempt(login).status_code, 200)
+        with mock.patch.object(User, "check_password") as check_password:
+            response = self.attempt("meena", "pass12345", ip="10.0.0.2")
+        check_password.assert_not_called()
+        self.assertEqual(response.status_code, 429)
+        self.assertContains(response, "Too many login attempts", status_code=429)
+        self.assertIn("Retry-After", response.headers)
+        # Another account from the same address is unaffected
+        User.objects.create_user("ravi", "ravi@example.com", "pass12345")
+        self.assertEqual(self.attempt("ravi").status_code, 200)
+
+    def test_successful_login_refills_the_account_bucket(self):
+        self.attempt("meena")
+        self.attempt("meena")
+        response = self.attempt("meena", "pass12345")
+        self.assertRedirects(response, reverse("home"), fetch_redirect_response=False)
+        self.client.logout()
+        for _ in range(3):
+            self.assertEqual(self.attempt("meena").status_code, 200)
+
+    @override_settings(LOGIN_THROTTLE={"ip": (2, 300), "account": (100, 900)})
+    def test_client_ip_is_throttled_across_accounts(self):
+        self.assertEqual(self.attempt("nobody1").status_code, 200)
+        self.assertEqual(self.attempt("nobody2").status_code, 200)
+        self.assertEqual(self.attempt("nobody3").status_code, 429)
+        self.assertEqual(self.attempt("nobody3", ip="10.0.0.9").status_code, 200)
+
+    def test_bucket_refills_over_its_period(self):
+        bucket = TokenBucket("test", 2, 10)
+        self.assertEqual(bucket.take("x", now=100), 0)
+        self.assertEqual(bucket.take("x", now=100), 0)
+        self.assertAlmostEqual(bucket.take("x", now=100), 5)
+        self.assertAlmostEqual(bucket.take("x", now=104), 1)
+        self.assertEqual(bucket.take("x", now=105), 0)
+
+
+# ------------------------ PASSWORD HASHING ------------------------
+
+@override_settings(PASSWORD_HASHER="pbkdf2", PASSWORD_COST={"customer": 1000, "staff": 2000})
+class PasswordPolicyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_new_passwords_use_the_customer_cost(self):
+        user = User.objects.create_user("cost", "cost@example.com", "pass12345")
+        self.assertTrue(user.password.startswith("pbkdf2_sha256$1000$"))
+
+    def test_staff_are_rehashed_to_the_staff_cost_at_login(self):
+        staff = User.objects.create_user("staff", "staff@example.com", "pass12345", is_staff=True)
+        self.assertEqual(authenticate(username="staff", password="pass12345"), staff)
+        staff.refresh_from_db()
+        self.assertTrue(staff.password.startswith("pbkdf2_sha256$2000$"))
+        # Already at the policy: nothing to redo
+        with mock.patch.object(User, "save") as save:
+            authenticate(username="staff", password="pass12345")
+        save.assert_not_called()
+
+    def test_policy_change_rehashes_on_the_next_login(self):
+        user = User.objects.create_user("switch", "switch@example.com", "pass12345")
+        with override_settings(PASSWORD_HASHER="scrypt", PASSWORD_COST={"customer": 2 ** 10, "staff": 2 ** 11}):
+            self.assertIsNone(authenticate(username="switch", password="wrong"))
+            user.refresh_from_db()
+            self.assertTrue(user.password.startswith("pbkdf2_sha256$"))
+
+            self.assertEqual(authenticate(username="switch", password="pass12345"), user)
+            user.refresh_from_db()
+            self.assertTrue(user.password.startswith(f"scrypt${2 ** 10}$"))
+            self.assertEqual(authenticate(username="switch", password="pass12345"), user)
+        # Hashes from an older policy still verify
+        self.assertEqual(authenticate(username="switch", password="pass12345"), user)
+
+    @override_settings(PASSWORD_HASHER="scrypt", PASSWORD_COST={"customer": 2 ** 10, "staff": 2 ** 15})
+    def test_scrypt_verifies_hashes_above_the_customer_cost(self):
+        staff = User.objects.create_user("chef", "chef@example.com", "pass12345", is_staff=True)
+        self.assertEqual(authenticate(username="chef", password="pass12345"), staff)
+        staff.refresh_from_db()
+        self.assertTrue(staff.password.startswith(f"scrypt${2 ** 15}$"))
+        # Checked by the (customer) hasher registered for the algorithm, at the staff hash's cost
+        self.assertEqual(authenticate(username="chef", password="pass12345"), staff)
+        self.assertIsNone(authenticate(username="chef", password="wrong"))
+
+    def test_staff_passwords_keep_the_staff_cost_outside_the_login_backend(self):
+        staff = User.objects.create_user("boss", "boss@example.com", "pass12345", is_staff=True)
+        self.assertTrue(staff.check_password("pass12345"))
+        staff.refresh_from_db()
+        self.assertTrue(staff.password.startswith("pbkdf2_sha256$1000$"))
+
+        # The admin's and the password views' forms call set_password() and check_password()
+        form = SetPasswordForm(staff, {"new_password1": "n3w-Secret!", "new_password2": "n3w-Secret!"})
+        self.assertTrue(form.is_valid())
+        form.save()
+        staff.refresh_from_db()
+        self.assertTrue(staff.password.startswith("pbkdf2_sha256$2000$"))
+        stored = staff.password
+        self.assertTrue(staff.check_password("n3w-Secret!"))
+        staff.refresh_from_db()
+        self.assertEqual(staff.password, stored)
+        self.assertEqual(authenticate(username="boss", password="n3w-Secret!"), staff)
+        staff.refresh_from_db()
+        self.assertEqual(staff.password, stored)
+
+        customer = User.objects.create_user("diner", "diner@example.com", "pass12345")
+        customer.set_password("n3w-Secret!")
+        customer.save()
+        self.assertTrue(customer.password.startswith("pbkdf2_sha256$1000$"))
+
+    def test_hasher_follows_the_role(self):
+        self.assertIsInstance(hashers.hasher_for(User()), hashers.PBKDF2Hasher)
+        self.assertIsInstance(hashers.hasher_for(User(is_superuser=True)), hashers.StaffPBKDF2Hasher)
+
+
+class BenchLoginCommandTests(TransactionTestCase):
+    def test_reports_each_policy(self):
+        out = StringIO()
+        call_command(
+            "bench_login", "--hasher", "pbkdf2", "--hasher", "scrypt", "--cost", "1024", "--logins", "2", stdout=out,
+        )
+        report = out.getvalue()
+        self.assertRegex(report, r"pbkdf2 +1024 ")
+        self.assertRegex(report, r"scrypt +1024 ")
+
+
+# ------------------------ ORDER ADMIN / TRANSITIONS ------------------------
+
+class OrderTransitionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("buyer", "buyer@example.com", "pass12345")
+        self.product = make_product(quantity=100)
+        self.checkout = place_order(self.user, [(self.product, 1), (self.product, 2)])
+        self.lines = self.checkout.lines
+        self.changes = []
+        orders_transitioned.connect(self.record)
+        self.addCleanup(orders_transitioned.disconnect, self.record)
+
+    def record(self, sender, changes, **kwargs):
+        self.changes.append([(c.order_id, c.old_status, c.status) for c in changes])
+
+    def test_bulk_transition_follows_the_state_machine(self):
+        first, second = self.lines
+        Order.objects.filter(id=second.id).update(order_sts="Cancelled")
+        moved = transition(Order.objects.all(), "Out for Delivery")
+        self.assertEqual([c.order_id for c in moved], [first.id])
+        self.assertEqual(self.changes, [[(first.id, "Pending", "Out for Delivery")]])
+        # Delivered is final
+        transition(Order.objects.filter(id=first.id), "Delivered")
+        self.assertEqual(transition(Order.objects.all(), "Cancelled"), [])
+        self.assertEqual(
+            dict(Order.objects.values_list("id", "order_sts")), {first.id: "Delivered", second.id: "Cancelled"},
+        )
+        self.assertEqual(Order.objects.get(id=first.id).version, 2)
+        self.checkout.refresh_from_db()
+        self.assertEqual(self.checkout.status, "Delivered")
+
+    def test_bulk_transition_cost_does_not_grow_with_the_selection(self):
+        with CaptureQueriesContext(connection) as few:
+            transition(Order.objects.filter(id=self.lines[0].id), "Out for Delivery")
+        more = place_order(self.user, [(self.product, 1)] * 6)
+        with CaptureQueriesContext(connection) as many:
+            transition(Order.objects.filter(checkout=more), "Out for Delivery")
+        self.assertEqual(len(many), len(few))
+        updates = [q["sql"] for q in many if q["sql"].startswith('UPDATE "menu_order"')]
+        self.assertEqual(len(updates), 1)
+
+    def test_single_saves_announce_status_changes(self):
+        order = Order.objects.get(id=self.lines[0].id)
+        order.address = "Hostel 4"
+        order.save()
+        self.assertEqual(self.changes, [])
+        order.order_sts = "Out for Delivery"
+        order.save()
+        self.assertEqual(self.changes, [[(order.id, "Pending", "Out for Delivery")]])
+
+    def test_saving_a_stale_order_is_refused(self):
+        mine = Order.objects.get(id=self.lines[0].id)
+        theirs = Order.objects.get(id=self.lines[0].id)
+        theirs.address = "Library"
+        theirs.save()
+        mine.address = "Canteen"
+        with self.assertRaises(StaleOrder):
+            mine.save()
+        self.assertEqual(Order.objects.get(id=mine.id).address, "Library")
+
+
+class OrderAdminTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser("admin", "admin@example.com", "pass12345")
+        self.client.force_login(self.admin)
+        self.product = make_product(quantity=100)
+        self.checkout = place_order(self.admin, [(self.product, 1)] * 3)
+        self.order = self.checkout.lines[0]
+
+    def changelist_queries(self):
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(self.client.get(reverse("admin:menu_order_changelist")).status_code, 200)
+        return len(captured)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        few = self.changelist_queries()
+        place_order(self.admin, [(make_product(name="Vada", quantity=100), 1)] * 10)
+        self.assertEqual(self.changelist_queries(), few)
+
+    def test_capped_count_paginator(self):
+        paginator = CappedCountPaginator(Order.objects.order_by("id"), 2)
+        paginator.cap = 2
+        self.assertEqual(paginator.count, 2)
+        self.assertEqual(paginator.num_pages, 1)
+
+    def test_bulk_action(self):
+        Order.objects.filter(id=self.order.id).update(order_sts="Delivered")
+        response = self.client.post(reverse("admin:menu_order_changelist"), {
+            "action": "mark_out_for_delivery",
+            "_selected_action": list(Order.objects.values_list("id", flat=True)),
+        }, follow=True)
+        self.assertContains(response, "2 order(s) marked Out for Delivery.")
+        self.assertContains(response, "1 order(s) skipped")
+        self.assertEqual(Order.objects.filter(order_sts="Out for Delivery").count(), 2)
+
+    def change_form_data(self, order, **changes):
+        data = {
+            "orderitem": order.orderitem_id, "customer": order.customer_id, "qty": order.qty,
+            "order_sts": order.order_sts, "address": "", "price": order.price, "razorpay_order_id": "",
+            "razorpay_payment_id": "", "razorpay_signature": "", "tracking_no": order.tracking_no,
+            "checkout": order.checkout_id, "version": order.version,
+        }
+        data.update(changes)
+        return data
+
+    def test_change_form_refuses_a_stale_version(self):
+        url = reverse("admin:menu_order_change", args=[self.order.id])
+        order = Order.objects.get(id=self.order.id)
+        transition(Order.objects.filter(id=order.id), "Out for Delivery")
+        response = self.client.post(url, self.change_form_data(order, address="Hostel 4"))
+        self.assertContains(response, "Someone else changed this order")
+        self.assertEqual(Order.objects.get(id=order.id).address, None)
+
+        order.refresh_from_db()
+        response = self.client.post(url, self.change_form_data(order, address="Hostel 4"))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Order.objects.get(id=order.id).address, "Hostel 4")
+
+    def test_change_form_refuses_illegal_transitions(self):
+        url = reverse("admin:menu_order_change", args=[self.order.id])
+        transition(Order.objects.filter(id=self.order.id), "Cancelled")
+        order = Order.objects.get(id=self.order.id)
+        response = self.client.post(url, self.change_form_data(order, order_sts="Pending"))
+        self.assertContains(response, "cannot be marked Pending")
+        self.assertEqual(Order.objects.get(id=order.id).order_sts, "Cancelled")
+
+
+    def race(self, admin_class, method):
+        """Have someone else save the order right before ``admin_class.method`` runs."""
+        original = getattr(admin_class, method)
+
+        def racing(*args, **kwargs):
+            Order.objects.filter(id=self.order.id).update(version=F("version") + 1)
+            return original(*args, **kwargs)
+
+        return mock.patch.object(admin_class, method, racing)
+
+    def test_order_saved_during_the_change_form_save_is_reported(self):
+        url = reverse("admin:menu_order_change", args=[self.order.id])
+        order = Order.objects.get(id=self.order.id)
+        with self.race(OrderAdmin, "save_model"):
+            response = self.client.post(url, self.change_form_data(order, address="Hostel 4"), follow=True)
+        self.assertEqual(response.redirect_chain, [(url, 302)])
+        self.assertContains(response, "Nothing was saved")
+        self.assertIsNone(Order.objects.get(id=order.id).address)
+
+    def test_order_saved_during_the_checkout_inline_save_is_reported(self):
+        url = reverse("admin:menu_checkout_change", args=[self.checkout.id])
+        lines = list(Order.objects.filter(checkout=self.checkout).order_by("id"))
+        data = {
+            "items-TOTAL_FORMS": len(lines), "items-INITIAL_FORMS": len(lines),
+            "items-MIN_NUM_FORMS": 0, "items-MAX_NUM_FORMS": 1000,
+        }
+        for i, line in enumerate(lines):
+            data.update({
+                f"items-{i}-id": line.id, f"items-{i}-checkout": self.checkout.id,
+                f"items-{i}-order_sts": "Out for Delivery", f"items-{i}-version": line.version,
+            })
+        with self.race(CheckoutAdmin, "save_formset"):
+            response = self.client.post(url, data, follow=True)
+        self.assertContains(response, "Nothing was saved")
+        self.assertEqual(set(Order.objects.values_list("order_sts", flat=True)), {"Pending"})
+
+# ------------------------ LIVE ORDER STATUS ------------------------
+
+class LiveOrderStatusTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("live", "live@example.com", "pass12345")
+        self.product = make_product(quantity=100)
+        self.checkout = place_order(self.user, [(self.product, 1), (self.product, 2)])
+        self.channel = live.orders_channel(self.user.id)
+
+    def move(self, status, commit=True):
+        with self.captureOnCommitCallbacks(execute=commit):
+            transition(Order.objects.filter(checkout=self.checkout), status)
+
+    async def read(self, response):
+        return b"".join([chunk async for chunk in response.streaming_content]).decode()
+
+    async def test_local_broker_fans_out_per_channel(self):
+        broker = live.LocalBroker()
+        async with broker.subscribe("a") as first, broker.subscribe("a") as second, broker.subscribe("b") as other:
+            # Publishers are usually request threads, not the event loop
+            thread = threading.Thread(target=broker.publish, args=("a", {"n": 1}))
+            thread.start()
+            thread.join()
+            self.assertEqual(await asyncio.wait_for(first.get(), 1), {"n": 1})
+            self.assertEqual(await asyncio.wait_for(second.get(), 1), {"n": 1})
+            self.assertTrue(other.empty())
+        self.assertEqual(broker._subscribers, {})
+
+    async def test_slow_subscribers_keep_the_latest_messages(self):
+        broker = live.LocalBroker()
+        async with broker.subscribe("a") as queue:
+            for n in range(live.QUEUE_SIZE + 5):
+                broker.publish("a", n)
+            await asyncio.sleep(0)
+            self.assertEqual(queue.qsize(), live.QUEUE_SIZE)
+            self.assertEqual(queue.get_nowait(), 5)
+
+    async def test_only_committed_changes_are_published(self):
+        async with live.broker().subscribe(self.channel) as queue:
+            await sync_to_async(self.move)("Out for Delivery", commit=False)
+            await asyncio.sleep(0)
+            self.assertTrue(queue.empty())
+            await sync_to_async(self.move)("Cancelled")
+            messages = [await asyncio.wait_for(queue.get(), 1) for _ in self.checkout.lines]
+        self.assertEqual(
+            sorted((m["id"], m["status"]) for m in messages),
+            [(line.id, "Cancelled") for line in self.checkout.lines],
+        )
+        self.assertEqual({m["tracking_no"] for m in messages}, {self.checkout.tracking_no})
+
+    @override_settings(ROOT_URLCONF="lol_cafe.asgi_urls", LIVE_HEARTBEAT_SECONDS=0.1, LIVE_STREAM_SECONDS=0.5)
+    async def test_stream_pushes_status_changes(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse("order_events"))
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertEqual(response["Cache-Control"], "no-cache")
+        # Subscribed once the first chunk is out
+        first = (await anext(response.streaming_content)).decode()
+        self.assertIn("retry: ", first)
+        await sync_to_async(self.move)("Out for Delivery")
+        rest = await self.read(response)
+        events = [json.loads(line[len("data: "):]) for line in rest.splitlines() if line.startswith("data: ")]
+        self.assertEqual(
+            sorted((e["id"], e["status"]) for e in events),
+            [(line.id, "Out for Delivery") for line in self.checkout.lines],
+        )
+        self.assertIn(": keepalive", rest)
+        self.assertEqual(live.broker()._subscribers, {})
+
+    @override_settings(ROOT_URLCONF="lol_cafe.asgi_urls", LIVE_HEARTBEAT_SECONDS=0.1, LIVE_STREAM_SECONDS=0.1)
+    async def test_reconnect_gets_current_statuses(self):
+        await sync_to_async(self.move)("Out for Delivery")
+        await self.async_client.aforce_login(self.user)
+        fresh = await self.read(await self.async_client.get(reverse("order_events")))
+        self.assertNotIn("event: order", fresh)
+        resumed = await self.read(
+            await self.async_client.get(reverse("order_events"), headers={"last-event-id": "0"})
+        )
+        self.assertEqual(resumed.count('"status": "Out for Delivery"'), len(self.checkout.lines))
+
+    @override_settings(ROOT_URLCONF="lol_cafe.asgi_urls")
+    async def test_stream_needs_login(self):
+        response = await self.async_client.get(reverse("order_events"))
+        self.assertRedirects(response, reverse("login"), fetch_redirect_response=False)
+
+    def test_wsgi_tells_the_browser_not_to_reconnect(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse("order_events")).status_code, 204)
+        response = self.client.get(reverse("my_orders"))
+        self.assertContains(response, reverse("order_events"))
+        self.assertContains(response, f'data-order="{self.checkout.lines[0].id}"')
+
+
+# ------------------------ KITCHEN PREP BOARD ------------------------
+
+class PrepBoardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("hungry", "hungry@example.com", "pass12345")
+        self.dosa = make_product(name="Dosa", quantity=100)
+        self.chai = make_product(name="Chai", quantity=100)
+
+    def state(self):
+        return sorted(PrepLine.objects.values_list("product_id", "tracking_no", "pending", "out_for_delivery"))
+
+    def test_checkouts_and_transitions_move_the_board(self):
+        first = place_order(self.user, [(self.dosa, 2), (self.chai, 1), (self.dosa, 1)])
+        second = place_order(self.user, [(self.dosa, 4)])
+        self.assertEqual(self.state(), sorted([
+            (self.dosa.id, first.tracking_no, 3, 0),
+            (self.chai.id, first.tracking_no, 1, 0),
+            (self.dosa.id, second.tracking_no, 4, 0),
+        ]))
+        transition(Order.objects.filter(checkout=first, orderitem=self.dosa), "Out for Delivery")
+        transition(Order.objects.filter(checkout=second), "Cancelled")
+        self.assertEqual(self.state(), sorted([
+            (self.dosa.id, first.tracking_no, 0, 3),
+            (self.chai.id, first.tracking_no, 1, 0),
+        ]))
+        transition(Order.objects.filter(checkout=first), "Delivered")
+        transition(Order.objects.filter(checkout=first), "Cancelled")
+        self.assertEqual(self.state(), [])
+
+    def test_a_missing_line_never_goes_negative(self):
+        # e.g. orders placed before the board was filled
+        checkout = place_order(self.user, [(self.dosa, 2)])
+        PrepLine.objects.all().delete()
+        transition(Order.objects.filter(checkout=checkout), "Out for Delivery")
+        self.assertEqual(self.state(), [(self.dosa.id, checkout.tracking_no, 0, 2)])
+
+    def test_single_saves_edits_and_deletes_match_a_rebuild(self):
+        checkout = place_order(self.user, [(self.dosa, 2), (self.chai, 3)])
+        Order.objects.create(orderitem=self.chai, customer=self.user, qty=5, price=50)
+        dosa, chai = checkout.lines
+        order = Order.objects.get(id=dosa.id)
+        order.order_sts = "Out for Delivery"
+        order.save()
+        order = Order.objects.get(id=chai.id)
+        order.qty = 1
+        order.orderitem = self.dosa
+        order.save()
+        Order.objects.get(id=dosa.id).delete()
+        incremental = self.state()
+        self.assertEqual(incremental, sorted([
+            (self.dosa.id, checkout.tracking_no, 1, 0),
+            (self.chai.id, "", 5, 0),
+        ]))
+        prep.rebuild()
+        self.assertEqual(self.state(), incremental)
+
+    def test_deleting_a_product_takes_its_rows_along(self):
+        place_order(self.user, [(self.dosa, 2), (self.chai, 1)])
+        self.dosa.delete()
+        self.assertEqual([row[0] for row in self.state()], [self.chai.id])
+
+    def test_board_reads_in_one_query_whatever_the_order_count(self):
+        for _ in range(5):
+            place_order(self.user, [(self.dosa, 1), (self.chai, 2)])
+        with self.assertNumQueries(1):
+            board = prep.board()
+        self.assertEqual(
+            [(product.name, pending, out, len(lines)) for product, pending, out, lines in board],
+            [("Chai", 10, 0, 5), ("Dosa", 5, 0, 5)],
+        )
+
+    def test_admin_board_and_rebuild_command(self):
+        checkout = place_order(self.user, [(self.dosa, 2)])
+        url = reverse("admin:menu_prepline_changelist")
+        self.client.force_login(self.user)
+        self.assertNotEqual(self.client.get(url).status_code, 200)
+
+        self.client.force_login(User.objects.create_superuser("chef", "chef@example.com", "pass12345"))
+        response = self.client.get(url)
+        self.assertContains(response, "Kitchen prep board")
+        self.assertContains(response, checkout.tracking_no)
+        rows = self.client.get(url, {"format": "json"}).json()["html"]
+        self.assertIn("Dosa", rows)
+
+        PrepLine.objects.all().delete()
+        out = StringIO()
+        call_command("rebuild_prep_board", stdout=out)
+        self.assertIn("1 row(s)", out.getvalue())
+        self.assertEqual(self.state(), [(self.dosa.id, checkout.tracking_no, 2, 0)])
+
+
+# ------------------------ SALES ROLLUPS ------------------------
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("regular", "regular@example.com", "pass12345")
+        self.category = Category.objects.create(name="Meals", description="Meals", image="images/lunch.jpeg")
+        self.thali = make_product(self.category, name="Thali", quantity=100, selling_price=60)
+        self.chai = make_product(name="Chai", quantity=100, selling_price=10)
+
+    def state(self):
+        return [
+            sorted(model.objects.values_list("start", "product_id", "revenue", "units", "orders"))
+            for model in (HourlySales, DailySales)
+        ]
+
+    def test_orders_and_status_changes_match_a_rebuild(self):
+        first = place_order(self.user, [(self.thali, 2), (self.chai, 3)])
+        second = place_order(self.user, [(self.chai, 1)])
+        Order.objects.create(orderitem=self.chai, customer=self.user, qty=2, price=20)
+        transition(Order.objects.filter(checkout=second), "Cancelled")
+        transition(Order.objects.filter(checkout=first), "Out for Delivery")
+        order = Order.objects.get(checkout=first, orderitem=self.chai)
+        order.qty, order.price = 1, 10
+        order.save()
+        Order.objects.get(checkout=first, orderitem=self.thali).delete()
+
+        hourly, daily = self.state()
+        self.assertEqual([row[1:] for row in daily], [(self.chai.id, Decimal("30.00"), 3, 2)])
+        self.assertEqual([row[1:] for row in hourly], [row[1:] for row in daily])
+        sales.rebuild()
+        self.assertEqual(self.state(), [hourly, daily])
+
+    def test_report_fills_every_period_and_ranks_sales(self):
+        place_order(self.user, [(self.thali, 2), (self.chai, 3)])
+        place_order(self.user, [(self.chai, 1)])
+        today = timezone.localdate()
+
+        report = sales.report(today - timedelta(days=6), today)
+        self.assertEqual(len(report["series"]), 7)
+        self.assertEqual(report["series"][-1]["revenue"], Decimal("160.00"))
+        self.assertEqual(report["series"][0]["revenue"], 0)
+        self.assertEqual(report["totals"], {"revenue": Decimal("160.00"), "units": 6, "orders": 3})
+        self.assertEqual(
+            [(row["product__name"], row["units"]) for row in report["products"]], [("Thali", 2), ("Chai", 4)],
+        )
+        self.assertEqual([row["category__name"] for row in report["categories"]], ["Meals", "Snacks"])
+
+        hourly = sales.report(today, today, "hour")
+        self.assertEqual(len(hourly["series"]), 24)
+        self.assertEqual(hourly["totals"], report["totals"])
+
+    def test_sales_stay_in_the_category_they_were_made_in(self):
+        place_order(self.user, [(self.thali, 2)])
+        self.thali.category = Category.objects.create(name="Lunch", description="Lunch", image="images/lunch.jpeg")
+        self.thali.save()
+        today = timezone.localdate()
+        categories = [row["category__name"] for row in sales.report(today, today)["categories"]]
+        self.assertEqual(categories, ["Meals"])
+        sales.rebuild()
+        self.assertEqual([row["category__name"] for row in sales.report(today, today)["categories"]], categories)
+
+        # A product with no sales yet in a period starts its row in the new category
+        order = place_order(self.user, [(self.thali, 1)]).lines[0]
+        Order.objects.filter(id=order.id).update(date_order=timezone.now() - timedelta(days=1))
+        sales.rebuild()
+        yesterday = today - timedelta(days=1)
+        self.assertEqual([row["category__name"] for row in sales.report(yesterday, yesterday)["categories"]], ["Lunch"])
+
+    def test_dashboard_reads_only_the_rollups(self):
+        place_order(self.user, [(self.thali, 1)])
+        self.client.force_login(User.objects.create_superuser("owner", "owner@example.com", "pass12345"))
+        url = reverse("admin:menu_dailysales_changelist")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertContains(response, "Sales dashboard")
+        self.assertContains(response, "₹60.00")
+        self.assertFalse([q["sql"] for q in queries if '"menu_order"' in q["sql"]])
+
+        today = timezone.localdate()
+        response = self.client.get(url, {"first": today - timedelta(days=10), "last": today, "period": "hour"})
+        self.assertContains(response, "Hourly charts cover at most 7 days")
+        self.assertIsNone(response.context["report"])
+
+    def test_rebuild_command_since_a_date(self):
+        place_order(self.user, [(self.thali, 1)])
+        old = place_order(self.user, [(self.chai, 2)])
+        Order.objects.filter(checkout=old).update(date_order=timezone.now() - timedelta(days=3))
+        sales.rebuild()
+        expected = self.state()
+
+        HourlySales.objects.filter(product=self.thali).delete()
+        DailySales.objects.all().update(units=0)
+        out = StringIO()
+        call_command("rebuild_sales_rollups", "--since", str(timezone.localdate() - timedelta(days=1)), stdout=out)
+        self.assertIn("1 hourly and 1 daily row(s)", out.getvalue())
+        hourly, daily = self.state()
+        self.assertEqual(hourly, expected[0])
+        # Days before --since are left as they were
+        self.assertEqual(
+            sorted((row[1], row[3]) for row in daily), sorted([(self.chai.id, 0), (self.thali.id, 1)]),
+        )
+
+    def test_deleting_an_account_takes_its_orders_off_in_one_pass(self):
+        place_order(self.user, [(self.thali, 1)])
+        with CaptureQueriesContext(connection) as few:
+            self.user.delete()
+        user = User.objects.create_user("many", "many@example.com", "pass12345")
+        for _ in range(5):
+            place_order(user, [(self.thali, 1), (self.chai, 2)])
+        with CaptureQueriesContext(connection) as many:
+            user.delete()
+        self.assertEqual(len(many), len(few))
+        self.assertEqual(self.state(), [[], []])
+        self.assertFalse(PrepLine.objects.exists())
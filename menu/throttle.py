@@ -0,0 +1,59 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Login attempts are metered by token buckets kept in the shared cache, so
+# every worker spends from the same buckets. Each bucket holds ``capacity``
+# attempts and refills evenly over ``period`` seconds; an empty bucket turns
+# the attempt away before the password is hashed. Buckets are configured in
+# settings.LOGIN_THROTTLE, one per client IP and one per account.
+
+PREFIX = "throttle"
+
+
+class TokenBucket:
+    """
+    One named family of buckets, e.g. "ip"; ``take(ident)`` spends from the bucket of ``ident``.
+
+    The cache has no compare-and-set, so two workers racing on the same
+    bucket can both spend its last token; a burst can overshoot by at most
+    the number of concurrent workers.
+    """
+
+    def __init__(self, name, capacity, period):
+        self.name = name
+        self.capacity = capacity
+        self.period = period
+        self.rate = capacity / period
+
+    def key(self, ident):
+        # Identifiers are user input (emails, IPv6 addresses); hash them into a safe key
+        return f"{PREFIX}:{self.name}:" + hashlib.sha1(str(ident).encode()).hexdigest()
+
+    def take(self, ident, now=None):
+        """Spend one token. Returns 0 when allowed, otherwise the seconds until one is free."""
+        now = time.time() if now is None else now
+        key = self.key(ident)
+        tokens, updated = cache.get(key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+        if tokens < 1:
+            return (1 - tokens) / self.rate
+        # A bucket left alone for a whole period is full again, so it can expire
+        cache.set(key, (tokens - 1, now), timeout=int(self.period) + 1)
+        return 0
+
+    def reset(self, ident):
+        cache.delete(self.key(ident))
+
+
+def bucket(name):
+    capacity, period = settings.LOGIN_THROTTLE[name]
+    return TokenBucket(name, capacity, period)
+
+
+def client_ip(request):
+    # REMOTE_ADDR only: X-Forwarded-For is whatever the client wants it to be
+    # unless a trusted proxy rewrites it
+    return request.META.get("REMOTE_ADDR", "")
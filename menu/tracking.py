@@ -0,0 +1,54 @@
+import os
+import threading
+import time
+
+from django.conf import settings
+
+# Tracking numbers are 64-bit, time-ordered IDs in the style of Twitter's
+# Snowflake: milliseconds since EPOCH_MS, then a node number, then a
+# per-millisecond sequence. Each process hands them out from memory, so no
+# database lookup is needed, and two processes can only clash if they share
+# a node number. TRACKING_NODE_ID gives each worker its own, and settings
+# refuse to load without it unless DEBUG is on; only then is the node taken
+# from the PID, which can repeat across workers (menu.checkout.place_order
+# retries a clashing number with a fresh one).
+
+EPOCH_MS = 1767225600000  # 2026-01-01T00:00:00Z
+NODE_BITS = 10
+SEQUENCE_BITS = 12
+MAX_NODE = (1 << NODE_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+PREFIX = 'foodspot'
+
+_lock = threading.Lock()
+_last_ms = -1
+_sequence = 0
+
+
+def node_id():
+    node = getattr(settings, 'TRACKING_NODE_ID', None)
+    if node is None:
+        node = os.getpid()
+    return node & MAX_NODE
+
+
+def next_id():
+    global _last_ms, _sequence
+    with _lock:
+        now = int(time.time() * 1000) - EPOCH_MS
+        # Never go backwards, even if the wall clock does
+        now = max(now, _last_ms)
+        if now == _last_ms:
+            _sequence = (_sequence + 1) & MAX_SEQUENCE
+            if _sequence == 0:
+                # Sequence exhausted for this millisecond; borrow the next one
+                now += 1
+        else:
+            _sequence = 0
+        _last_ms = now
+        return (now << (NODE_BITS + SEQUENCE_BITS)) | (node_id() << SEQUENCE_BITS) | _sequence
+
+
+def new_tracking_no():
+    return f"{PREFIX}{next_id()}"
@@ -1,11 +1,12 @@
 from django.urls import path
 from django.contrib.auth import views as auth_views
+from .forms import OutboxPasswordResetForm
 from .views import (
     UserRegisterView, UserLoginView, UserLogoutView,
-    HomeView, CategoryDetailView, ProductDetailView,
-    AddToCartView, CartView, DeleteCartItemView,
+    HomeView, CategoryDetailView, ProductDetailView, ProductReviewsView,
+    AddToCartView, CartView, CartAPIView, DeleteCartItemView,
     IncreaseQty, DecreaseQty,
-    BuyNowView, UserOrdersView, CheckoutView,
+    BuyNowView, UserOrdersView, OrderEventsView, CheckoutView,
     SearchView, order_success, AddReviewView, ProfileView,
     DeleteAccountView
 )
@@ -24,7 +25,8 @@ urlpatterns = [
          auth_views.PasswordResetView.as_view(
              template_name='menu/password_reset_form.html',
              email_template_name='menu/password_reset_email.html',
-             subject_template_name='menu/password_reset_subject.txt'
+             subject_template_name='menu/password_reset_subject.txt',
+             form_class=OutboxPasswordResetForm
          ), 
          name='password_reset'),
     path('password-reset/done/', 
@@ -46,9 +48,11 @@ urlpatterns = [
 
     # ---------------- PRODUCT ----------------
     path("product/<int:pk>/", ProductDetailView.as_view(), name="product_detail"),
+    path("product/<int:pk>/reviews/", ProductReviewsView.as_view(), name="product_reviews"),
 
     # ---------------- CART ----------------
     path("cart/", CartView.as_view(), name="cart"),
+    path("cart/api/", CartAPIView.as_view(), name="cart_api"),
     path("add-to-cart/<int:pk>/", AddToCartView.as_view(), name="add_to_cart"),
     path("cart/delete/<int:pk>/", DeleteCartItemView.as_view(), name="delete_cart"),
     path("checkout/", CheckoutView.as_view(), name="checkout"),
@@ -62,6 +66,7 @@ urlpatterns = [
 
     # ---------------- ORDERS ----------------
     path("my-orders/", UserOrdersView.as_view(), name="my_orders"),
+    path("my-orders/events/", OrderEventsView.as_view(), name="order_events"),
     path("order-success/", order_success, name="order_success"),
     path("add-review/<int:order_id>/", AddReviewView.as_view(), name="add_review"),
 
@@ -1,21 +1,29 @@
+import json
+from math import ceil
+
 from django.shortcuts import render, redirect, get_object_or_404
-from django.db.models import F
+from django.db import transaction
+from django.db.models import Exists, OuterRef
 from django.views import View
 from django.views.generic import ListView
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.utils.decorators import method_decorator
-from django.http import JsonResponse, HttpResponseBadRequest
+from django.http import Http404, HttpResponse, JsonResponse, HttpResponseBadRequest
+from django.template.loader import render_to_string
 from django.views.decorators.cache import never_cache
-from django.core.mail import send_mail
-from django.conf import settings
-import random
-import string
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.core.files.storage import default_storage
 
-from django.contrib.auth.models import User
 from .forms import UserRegisterForm, UserLoginForm, UserOrderForm, ReviewForm, UserUpdateForm, ProfileUpdateForm
 from .models import Category, Product, Cart, Order, Review, Profile
+from . import avatars, cart, catalog_cache, keyset
+from .catalog_cache import conditional_page
+from .checkout import OutOfStock, place_order
+from .mail import queue_mail
+from .routers import read_from_replica
+from .search import search_products
 
 
 # ------------------------ LOGIN REQUIRED DECORATOR ------------------------
@@ -28,6 +36,28 @@ def signin_required(fn):
     return wrapper
 
 
+# ------------------------ LOAD MORE ------------------------
+
+def wants_json(request):
+    return request.GET.get("format") == "json"
+
+
+def load_more(request, page, template, items, **context):
+    """JSON variant of a keyset page: its rendered cards, their data and the next cursor."""
+    return JsonResponse({
+        "html": render_to_string(template, context, request=request),
+        "items": items,
+        "next_cursor": page.next_cursor,
+    })
+
+
+def product_items(products):
+    return [
+        {"id": p.id, "name": p.name, "selling_price": str(p.selling_price), "url": reverse("product_detail", args=[p.id])}
+        for p in products
+    ]
+
+
 # ------------------------ AUTH VIEWS ------------------------
 
 @method_decorator(never_cache, name="dispatch")
@@ -54,25 +84,21 @@ class UserLoginView(View):
     def post(self, request):
         form = UserLoginForm(request.POST)
         if form.is_valid():
-            username_or_email = form.cleaned_data["username"]
-            password = form.cleaned_data["password"]
-
-            # Try to handle email login
-            if '@' in username_or_email:
-                try:
-                    user_obj = User.objects.get(email=username_or_email)
-                    username = user_obj.username
-                except User.DoesNotExist:
-                    username = username_or_email # Fallback to literal string
-            else:
-                username = username_or_email
-
-            user = authenticate(request, username=username, password=password)
+            # menu.backends.EmailOrUsernameBackend takes either, and throttles attempts
+            user = authenticate(
+                request, username=form.cleaned_data["username"], password=form.cleaned_data["password"]
+            )
             if user:
                 login(request, user)
                 if user.is_superuser:
                     return redirect('/admin/')
                 return redirect("home")
+            retry_after = getattr(request, "login_retry_after", None)
+            if retry_after:
+                messages.error(request, f"Too many login attempts. Try again in {ceil(retry_after / 60)} minute(s).")
+                response = render(request, "menu/login.html", {"form": form}, status=429)
+                response["Retry-After"] = str(ceil(retry_after))
+                return response
             messages.error(request, "Invalid username/email or password")
 
         return render(request, "menu/login.html", {"form": form})
@@ -85,40 +111,110 @@ def UserLogoutView(request):
 
 # ------------------------ HOME / CATEGORY / PRODUCT ------------------------
 
-# ------------------------ HOME / CATEGORY / PRODUCT ------------------------
-
-@method_decorator(never_cache, name="dispatch")
+@method_decorator(read_from_replica, name="get")
+@method_decorator(conditional_page(lambda request: [catalog_cache.catalog(), catalog_cache.offers()]), name="get")
 class HomeView(ListView):
     model = Category
     template_name = "menu/index.html"
     context_object_name = "categories"
+    offer_limit = 8
+
+    def get_queryset(self):
+        return catalog_cache.get_or_build(
+            "home:categories", [catalog_cache.catalog()], lambda: list(Category.objects.all())
+        )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Offer Zone: Products with discount > 50% (selling price <= 50% of original price)
-        context['offer_products'] = Product.objects.filter(
-            original_price__gt=0,
-            selling_price__lte=F('original_price') * 0.5
+        # Offer Zone: biggest discounts of at least 50%, read off the discount_percent index
+        context['offer_products'] = catalog_cache.get_or_build(
+            "home:offers", [catalog_cache.offers()], lambda: list(
+                Product.objects.filter(discount_percent__gte=50)
+                .order_by('-discount_percent', '-id')[:self.offer_limit]
+            )
         )
         return context
 
 
-@method_decorator(never_cache, name="dispatch")
+@method_decorator(read_from_replica, name="get")
+@method_decorator(conditional_page(lambda request, pk: [catalog_cache.category(pk)]), name="get")
 class CategoryDetailView(View):
+    paginate_by = 24
+
     def get(self, request, pk):
-        category = Category.objects.get(id=pk)
-        products = Product.objects.filter(category=category)
+        cursor = request.GET.get("cursor")
+        if keyset.decode_cursor(cursor)[0] is None:
+            # A malformed cursor lists the first page anyway
+            cursor = None
+
+        def build():
+            category = Category.objects.filter(id=pk).first()
+            if category is None:
+                return None, keyset.Page([])
+            # Keyset on (name, id) rides the (category, name) index
+            return category, keyset.paginate(
+                Product.objects.filter(category=category), ("name", "id"), cursor, self.paginate_by
+            )
+
+        # Only the first page is cached: cursors come from the client, and one
+        # cache entry per cursor would let anyone fill the cache
+        if cursor is None:
+            category, page = catalog_cache.get_or_build(f"category:{pk}", [catalog_cache.category(pk)], build)
+        else:
+            category, page = build()
+        if category is None:
+            raise Http404("No Category matches the given query.")
+        if wants_json(request):
+            return load_more(request, page, "menu/product_cards.html", product_items(page), products=page)
         return render(request, "menu/category_detail.html", {
             "name": category,
-            "data": products
+            "data": page,
+            "page": page,
         })
 
 
-@method_decorator(never_cache, name="dispatch")
+@method_decorator(read_from_replica, name="get")
+@method_decorator(conditional_page(lambda request, pk: [catalog_cache.product(pk)]), name="get")
 class ProductDetailView(View):
     def get(self, request, pk):
-        product = Product.objects.get(id=pk)
-        return render(request, "menu/p_detail.html", {"data": product})
+        def build():
+            product = Product.objects.select_related("category").filter(id=pk).first()
+            reviews = list(product.review_set.select_related("user").order_by("-date")[:5]) if product else []
+            return product, reviews
+
+        product, reviews = catalog_cache.get_or_build(f"product:{pk}", [catalog_cache.product(pk)], build)
+        if product is None:
+            raise Http404("No Product matches the given query.")
+        return render(request, "menu/p_detail.html", {"data": product, "reviews": reviews})
+
+
+@method_decorator(read_from_replica, name="get")
+class ProductReviewsView(View):
+    paginate_by = 10
+
+    def get(self, request, pk):
+        product = get_object_or_404(Product, id=pk)
+
+        # Page count comes from the stored rating_count, so no COUNT(*) is needed
+        num_pages = max((product.rating_count + self.paginate_by - 1) // self.paginate_by, 1)
+        try:
+            page = min(max(int(request.GET.get("page", 1)), 1), num_pages)
+        except ValueError:
+            page = 1
+        offset = (page - 1) * self.paginate_by
+        reviews = (
+            product.review_set.select_related("user")
+            # id breaks ties between same-date reviews, so OFFSET pages never repeat or skip one
+            .order_by("-date", "-id")[offset:offset + self.paginate_by]
+        )
+        return render(request, "menu/reviews.html", {
+            "data": product,
+            "reviews": reviews,
+            "page": page,
+            "num_pages": num_pages,
+            "previous_page": page - 1 if page > 1 else None,
+            "next_page": page + 1 if page < num_pages else None,
+        })
 
 
 # ------------------------ CART FUNCTIONALITY ------------------------
@@ -154,6 +250,7 @@ class AddToCartView(View):
         else:
             cart_item.qty = qty
             cart_item.save()
+        cart.invalidate(request.user.id)
 
         messages.success(request, f"{qty} item(s) added to cart!")
         return redirect("cart")
@@ -163,12 +260,58 @@ class AddToCartView(View):
 @method_decorator(never_cache, name="dispatch")
 class CartView(View):
     def get(self, request):
-        cart_items = Cart.objects.filter(user=request.user)
-        total = sum(item.item.selling_price * item.qty for item in cart_items)
-
+        cart_items = Cart.objects.filter(user=request.user).select_related("item")
         return render(request, "menu/cart.html", {
             "data": cart_items,
-            "total_price": total
+            "total_price": cart.summary(request.user.id)["total"]
+        })
+
+
+# ------------------------ CART API ------------------------
+
+class CartAPIView(View):
+    """
+    JSON cart mutations: POST one change or a batch, applied atomically.
+
+    Answers with the changed lines and the new cart totals, so the cart page
+    updates in place instead of a redirect and a full re-render.
+    """
+
+    def post(self, request):
+        if not request.user.is_authenticated:
+            return JsonResponse({"error": "login_required"}, status=401)
+        try:
+            changes = cart.parse_changes(json.loads(request.body))
+        except ValueError as e:
+            return JsonResponse({"error": "invalid", "detail": str(e)}, status=400)
+
+        try:
+            changed = cart.apply_changes(request.user.id, changes)
+        except Product.DoesNotExist as e:
+            return JsonResponse({"error": "not_found", "detail": str(e)}, status=404)
+        except OutOfStock as e:
+            return JsonResponse({
+                "error": "out_of_stock",
+                "items": [{"item": p.id, "name": p.name, "available": p.quantity} for p in e.products],
+            }, status=409)
+
+        lines = {
+            line.item_id: line
+            for line in Cart.objects.filter(user=request.user, item_id__in=changed).select_related("item")
+        }
+        return JsonResponse({
+            "lines": [
+                {
+                    "id": lines[item].id,
+                    "item": item,
+                    "name": lines[item].item.name,
+                    "qty": lines[item].qty,
+                    "unit_price": lines[item].item.selling_price,
+                    "line_total": lines[item].total_price(),
+                } if item in lines else {"item": item, "qty": 0, "removed": True}
+                for item in sorted(changed)
+            ],
+            "totals": cart.summary(request.user.id),
         })
 
 
@@ -177,12 +320,13 @@ class CartView(View):
 @method_decorator(signin_required, name="dispatch")
 class IncreaseQty(View):
     def post(self, request, pk):
-        item = get_object_or_404(Cart, id=pk, user=request.user)
+        item = get_object_or_404(Cart.objects.select_related("item"), id=pk, user=request.user)
         
         # Check stock availability
         if item.item.quantity > item.qty:
             item.qty += 1
             item.save()
+            cart.invalidate(request.user.id)
         else:
             messages.warning(request, f"Only {item.item.quantity} units available.")
             
@@ -199,6 +343,7 @@ class DecreaseQty(View):
             item.save()
         else:
             item.delete()
+        cart.invalidate(request.user.id)
         return redirect("cart")
 
 
@@ -206,6 +351,7 @@ class DecreaseQty(View):
 class DeleteCartItemView(View):
     def get(self, request, pk):
         Cart.objects.filter(id=pk, user=request.user).delete()
+        cart.invalidate(request.user.id)
         messages.warning(request, "Item removed from cart")
         return redirect("cart")
 
@@ -216,73 +362,53 @@ class DeleteCartItemView(View):
 @method_decorator(never_cache, name="dispatch")
 class CheckoutView(View):
     def get(self, request):
-        cart_items = Cart.objects.filter(user=request.user)
-        if not cart_items.exists():
+        cart_items = list(Cart.objects.filter(user=request.user).select_related("item"))
+        if not cart_items:
             messages.warning(request, "Your cart is empty.")
             return redirect("home")
 
-        total = sum(item.item.selling_price * item.qty for item in cart_items)
         form = UserOrderForm()
         
         return render(request, "menu/checkout.html", {
             "cart_items": cart_items,
-            "total_price": total,
+            "total_price": cart.summary(request.user.id)["total"],
             "form": form
         })
 
     def post(self, request):
-        cart_items = Cart.objects.filter(user=request.user)
+        cart_items = list(Cart.objects.filter(user=request.user).select_related("item"))
         if not cart_items:
             return redirect("home")
 
         form = UserOrderForm(request.POST)
         if form.is_valid():
             # address removed as per user request
-            
-            # Generate unique tracking number for this checkout session
-            trackno = 'foodspot' + str(random.randint(1111111, 9999999))
-            while Order.objects.filter(tracking_no=trackno).exists():
-                trackno = 'foodspot' + str(random.randint(1111111, 9999999))
-
-            # Stock Validation and Order Creation
-            total = 0
-            for c_item in cart_items:
-                if c_item.item.quantity < c_item.qty:
-                    messages.error(request, f"Not enough stock for {c_item.item.name}")
-                    return redirect("cart")
-
-                # Decrement Stock
-                c_item.item.quantity -= c_item.qty
-                c_item.item.save()
-
-                # Create Order
-                total += c_item.item.selling_price * c_item.qty
-                Order.objects.create(
-                    orderitem=c_item.item,
-                    customer=request.user,
-                    qty=c_item.qty,
-                    price=c_item.item.selling_price * c_item.qty,
-                    order_sts="Pending",
-                    tracking_no=trackno
-                )
-            
-            # Clear cart
-            cart_items.delete()
 
-            # Send Email Notification
-            subject = f"Order Placed Successfully - {trackno}"
-            message = f"Hi {request.user.username},\n\nYour order has been placed successfully.\nOrder ID: {trackno}\nTotal Amount: ₹{total}\n\nThank you for ordering with us!\n\nUse 'My Orders' to track status."
+            # Reserve stock, create orders, clear the cart and queue the
+            # confirmation email in one transaction
             try:
-                send_mail(subject, message, settings.EMAIL_HOST_USER if hasattr(settings, 'EMAIL_HOST_USER') else 'admin@foodspot.com', [request.user.email])
-            except Exception as e:
-                print(f"Email failed: {e}")
+                with transaction.atomic():
+                    checkout = place_order(
+                        request.user,
+                        [(c_item.item, c_item.qty) for c_item in cart_items],
+                    )
+                    Cart.objects.filter(id__in=[c_item.id for c_item in cart_items]).delete()
+                    cart.invalidate(request.user.id)
+
+                    trackno, total = checkout.tracking_no, checkout.total
+                    subject = f"Order Placed Successfully - {trackno}"
+                    message = f"Hi {request.user.username},\n\nYour order has been placed successfully.\nOrder ID: {trackno}\nTotal Amount: ₹{total}\n\nThank you for ordering with us!\n\nUse 'My Orders' to track status."
+                    queue_mail(subject, message, [request.user.email])
+            except OutOfStock as e:
+                for product in e.products:
+                    messages.error(request, f"Not enough stock for {product.name}")
+                return redirect("cart")
 
             return redirect("order_success")
 
-        total = sum(item.item.selling_price * item.qty for item in cart_items)
         return render(request, "menu/checkout.html", {
             "cart_items": cart_items,
-            "total_price": total,
+            "total_price": cart.summary(request.user.id)["total"],
             "form": form
         })
 
@@ -329,39 +455,20 @@ class BuyNowView(View):
         if form.is_valid():
             # address removed as per user request
             
-            # Stock Validation Check
-            if product.quantity < qty:
+            # Reserve stock, create the order and queue the confirmation email in one transaction
+            try:
+                with transaction.atomic():
+                    checkout = place_order(request.user, [(product, qty)])
+
+                    trackno, current_total = checkout.tracking_no, checkout.total
+                    subject = f"Order Placed Successfully - {trackno}"
+                    message = f"Hi {request.user.username},\n\nYour order for {qty}x {product.name} has been placed successfully.\nOrder ID: {trackno}\nTotal Amount: ₹{current_total}\n\nThank you for ordering with us!"
+                    queue_mail(subject, message, [request.user.email])
+            except OutOfStock:
+                product.refresh_from_db(fields=["quantity"])
                 messages.error(request, f"Not enough stock. Only {product.quantity} available.")
                 return redirect("home")
 
-            # Generate unique tracking number
-            trackno = 'foodspot' + str(random.randint(1111111, 9999999))
-            while Order.objects.filter(tracking_no=trackno).exists():
-                trackno = 'foodspot' + str(random.randint(1111111, 9999999))
-
-            # Decrement Stock
-            product.quantity -= qty
-            product.save()
-
-            # Create Order
-            current_total = product.selling_price * qty
-            Order.objects.create(
-                orderitem=product,
-                customer=request.user,
-                price=current_total,
-                order_sts="Pending",
-                qty=qty,
-                tracking_no=trackno
-            )
-
-            # Send Email Notification
-            subject = f"Order Placed Successfully - {trackno}"
-            message = f"Hi {request.user.username},\n\nYour order for {qty}x {product.name} has been placed successfully.\nOrder ID: {trackno}\nTotal Amount: ₹{current_total}\n\nThank you for ordering with us!"
-            try:
-                send_mail(subject, message, settings.EMAIL_HOST_USER if hasattr(settings, 'EMAIL_HOST_USER') else 'admin@foodspot.com', [request.user.email])
-            except Exception as e:
-                print(f"Email failed: {e}")
-
             return redirect("order_success")
         
         total_price = product.selling_price * qty
@@ -375,13 +482,52 @@ class BuyNowView(View):
 
 # ------------------------ ORDER STATUS + HISTORY ------------------------
 
+def customer_orders(request):
+    """The user's orders as My Orders lists them; ``?id=`` narrows them to that one order."""
+    orders = (
+        Order.objects.filter(customer=request.user)
+        .select_related("orderitem")
+        .annotate(has_review=Exists(Review.objects.filter(order=OuterRef("pk"))))
+    )
+    order_id = request.GET.get("id")
+    if order_id is not None:
+        # A single card, which the live status stream refreshes on delivery
+        orders = orders.filter(id=order_id) if order_id.isdigit() else orders.none()
+    return orders
+
+
 @method_decorator(signin_required, name="dispatch")
 @method_decorator(never_cache, name="dispatch")
 class UserOrdersView(View):
+    paginate_by = 20
+
     def get(self, request):
-        orders = Order.objects.filter(customer=request.user).order_by("-date_order")
+        orders = customer_orders(request)
+        # Keyset on (date_order, id) seeks straight into the (customer, -date_order) index
+        page = keyset.paginate(orders, ("-date_order", "-id"), request.GET.get("cursor"), self.paginate_by)
         form = ReviewForm()
-        return render(request, "menu/orders.html", {"orders": orders, "form": form})
+        if wants_json(request):
+            items = [
+                {
+                    "id": order.id,
+                    "date_order": order.date_order.isoformat(),
+                    "status": order.order_sts,
+                    "product": order.orderitem.name,
+                    "qty": order.qty,
+                    "price": str(order.price),
+                    "has_review": order.has_review,
+                }
+                for order in page
+            ]
+            return load_more(request, page, "menu/order_cards.html", items, orders=page, form=form)
+        return render(request, "menu/orders.html", {"orders": page, "page": page, "form": form})
+
+
+class OrderEventsView(View):
+    def get(self, request):
+        # The live status stream needs the ASGI server (menu.async_views.OrderEventsView);
+        # 204 tells the browser's EventSource not to reconnect
+        return HttpResponse(status=204)
 
 @method_decorator(signin_required, name="dispatch")
 class AddReviewView(View):
@@ -400,9 +546,11 @@ class AddReviewView(View):
         if form.is_valid():
             review = form.save(commit=False)
             review.user = request.user
-            review.product = order.orderitem
+            review.product_id = order.orderitem_id
             review.order = order
-            review.save()
+            with transaction.atomic():
+                # Counted into the product's rating as it is saved (menu/signals.py)
+                review.save()
             messages.success(request, "Thank you for your feedback!")
         else:
             messages.error(request, "Invalid feedback submission.")
@@ -411,16 +559,36 @@ class AddReviewView(View):
 
 # ------------------------ SEARCH ------------------------
 
+@method_decorator(read_from_replica, name="get")
 class SearchView(View):
+    paginate_by = 12
+
     def get(self, request):
         query = request.GET.get("q")
-        products = Product.objects.filter(name__icontains=query) if query else None
-        return render(request, "menu/search.html", {"result": products})
+        page = search_products(query, request.GET.get("cursor"), self.paginate_by) if query else None
+        if wants_json(request):
+            page = page or keyset.Page([])
+            return load_more(request, page, "menu/product_cards.html", product_items(page), products=page)
+        return render(request, "menu/search.html", {
+            "result": page,
+            "query": query,
+            "page": page,
+        })
 
 
 @method_decorator(signin_required, name="dispatch")
 @method_decorator(never_cache, name="dispatch")
+# The upload handler has to be in place before anything reads request.POST,
+# which the CSRF middleware would do; post() checks the token itself instead
+@method_decorator(csrf_exempt, name="dispatch")
 class ProfileView(View):
+    def dispatch(self, request, *args, **kwargs):
+        self.upload_handler = None
+        if request.method == "POST":
+            self.upload_handler = avatars.ProfilePicUploadHandler(request)
+            request.upload_handlers = [self.upload_handler]
+        return super().dispatch(request, *args, **kwargs)
+
     def get(self, request):
         u_form = UserUpdateForm(instance=request.user)
         profile, created = Profile.objects.get_or_create(user=request.user)
@@ -431,14 +599,24 @@ class ProfileView(View):
             'p_form': p_form
         })
 
+    @method_decorator(csrf_protect)
     def post(self, request):
         u_form = UserUpdateForm(request.POST, instance=request.user)
         profile, created = Profile.objects.get_or_create(user=request.user)
+        previous_pic = profile.profile_pic.name
         p_form = ProfileUpdateForm(request.POST, request.FILES, instance=profile)
+        if self.upload_handler.error:
+            p_form.add_error('profile_pic', self.upload_handler.error)
 
         if u_form.is_valid() and p_form.is_valid():
             u_form.save()
-            p_form.save()
+            profile = p_form.save(commit=False)
+            new_pic = 'profile_pic' in request.FILES
+            # The raw upload is squared and shrunk by the process_profile_pics worker
+            profile.pic_pending = profile.pic_pending or new_pic
+            profile.save()
+            if new_pic and previous_pic:
+                transaction.on_commit(lambda: default_storage.delete(previous_pic))
             messages.success(request, 'Profile updated successfully!')
             return redirect('profile')
             
@@ -452,8 +630,13 @@ class ProfileView(View):
 class DeleteAccountView(View):
     def post(self, request):
         user = request.user
+        # delete() clears user.id
+        user_id = user.id
         logout(request)
-        user.delete()
+        with transaction.atomic():
+            # The user's reviews leave the product ratings as they cascade (menu/signals.py)
+            user.delete()
+            cart.invalidate(user_id)
         messages.success(request, "Your account has been deleted permanentally.")
         return redirect("login")
 